@@ -1,4 +1,3 @@
-import atlite
 from pyproj import CRS
 import time
 from scipy.ndimage import label
@@ -8,12 +7,13 @@ import pickle
 import os  
 import argparse
 import geopandas as gpd
-from atlite.gis import shape_availability
 import rasterio
 import yaml
 from utils.data_preprocessing import clean_region_name, log_scenario_run
 from rasterstats import zonal_stats
-from utils.raster_analysis import area_filter
+from utils.raster_analysis import area_filter, area_filter_raster
+from utils.raster_io import raster_profile, create_raster
+from utils.exclusion_layers import ExclusionEngine, ValueRange, compare_tiled, compare_with_atlite
 
 # Record the starting time
 start_time = time.time()
@@ -35,6 +35,8 @@ parser.add_argument("--region", default=region_name_clean, help="region name")
 parser.add_argument("--method", default="manual", help="method to run the script, e.g., snakemake or manual")
 parser.add_argument("--scenario", help="scenario name (overrides config.yaml if provided)")
 parser.add_argument("--technology", help="technology (overrides config.yaml if provided)")
+parser.add_argument("--check_atlite", action="store_true", help="also compute the exclusions with atlite and report the differing pixels (needs atlite)")
+parser.add_argument("--check_tiles", action="store_true", help="with exclusion_tile_size: also compute the exclusions without tiles and report the differing pixels (must be 0)")
 args = parser.parse_args()
 
 # If running via Snakemake, use the region name and folder name from command line arguments
@@ -159,28 +161,32 @@ additional_exclusion_rasters = 1 if os.path.exists(additional_exclusion_rasters_
 
 #perform exclusions
 
-#raster can be in different CRS than exclusioncontainer, it is co-registered by atlite!
+#raster can be in different CRS than exclusioncontainer, it is co-registered by the exclusion engine!
 #same applies for vector data
 
 info_list_exclusion = []
 info_list_not_selected = []
 info_list_not_available = []
 
-# initiate Exclusion container
-excluder = atlite.ExclusionContainer(crs=local_crs_obj, res=res)
+# initiate exclusion engine
+# masks (and distance fields) of unchanged layers are reused from previous scenarios of this region if the layer cache is on
+layer_cache_dir = os.path.join(data_path, '.exclusion_layer_cache') if config.get('exclusion_layer_cache', 0) else None
+excluder = ExclusionEngine(crs=local_crs_obj, res=res, cache_dir=layer_cache_dir,
+                           buffer_mode=config.get('exclusion_buffer_mode') or 'geometry',
+                           max_distance=config.get('exclusion_max_distance', 10000),
+                           max_workers=config.get('exclusion_workers') or 1)
 
-# add landcover exclusions 
+# add landcover exclusions (raster read once, one dilation per distinct buffer value)
 if tech_config['landcover_codes']:   
     input_codes = tech_config['landcover_codes']
-    for key, value in input_codes.items():
-        excluder.add_raster(landcoverPath, codes=key, buffer=value, crs=global_crs_obj)
+    excluder.add_landcover(landcoverPath, input_codes, crs=global_crs_obj)
     info_list_exclusion.append(f"landcover codes which are excluded (code, buffer in meters): {input_codes}")
 else: print('landcover not selected in config.')
 
 # add elevation exclusions
 param = tech_config['max_elevation']
 if dem==1 and param is not None: 
-    excluder.add_raster(demRasterPath, codes=range(param,10000), crs=global_crs_obj)
+    excluder.add_raster(demRasterPath, codes=ValueRange(param, 10000, include_max=False), crs=global_crs_obj) # elevations of 10000 m and more are nodata
     info_list_exclusion.append(f"max elevation: {param}")
 elif dem==1 and param is None: info_list_not_selected.append(f"DEM")
 elif dem==0: info_list_not_available.append(f"DEM")
@@ -188,7 +194,7 @@ elif dem==0: info_list_not_available.append(f"DEM")
 # add slope exclusions
 param = tech_config['max_slope']
 if slope==1 and param is not None:
-    excluder.add_raster(slopeRasterPath, codes=range(param,90), crs=global_crs_obj)
+    excluder.add_raster(slopeRasterPath, codes=ValueRange(min=param), crs=global_crs_obj)
     info_list_exclusion.append(f"max slope: {param}")
 elif slope==1 and param is None: info_list_not_selected.append(f"slope")
 elif slope==0: info_list_not_available.append(f"slope")
@@ -196,19 +202,15 @@ elif slope==0: info_list_not_available.append(f"slope")
 # add terrain ruggedness exclusions
 param = tech_config['max_terrain_ruggedness']
 if terrain_ruggedness==1 and param is not None:
-    excluder.add_raster(terrain_ruggedness_path, codes=range(0,param), invert=True, crs=global_crs_obj)
+    excluder.add_raster(terrain_ruggedness_path, codes=ValueRange(0, param, include_max=False), invert=True, crs=global_crs_obj)
     info_list_exclusion.append(f"max terrain ruggedness: {param}")
 elif terrain_ruggedness==1 and param is None: info_list_not_selected.append(f"terrain_ruggedness")
 elif terrain_ruggedness==0: info_list_not_available.append(f"terrain_ruggedness")
 
 # add population exclusions
-def lower_end_filter(mask):
-    """Filter out values below a lower end."""
-    lower_end = tech_config['max_population']
-    return mask > lower_end
 param = tech_config.get('max_population')
 if population==1 and param is not None:
-    excluder.add_raster(populationPath, codes=lower_end_filter, crs=global_crs_obj, nodata=None) # nodata=None, otherwise no data values get excluded (assumption: in no data pixels there is no population)
+    excluder.add_raster(populationPath, codes=ValueRange(min=param, include_min=False), crs=global_crs_obj, nodata=None) # nodata=None, otherwise no data values get excluded (assumption: in no data pixels there is no population)
     info_list_exclusion.append(f"max population per pixel: {param}")
 elif population==1 and param is None: info_list_not_selected.append(f"population")
 elif population==0: info_list_not_available.append(f"population")
@@ -222,46 +224,24 @@ elif nfacing==1 and param is None: info_list_not_selected.append(f"nfacing")
 elif nfacing==0: info_list_not_available.append(f"nfacing")
 
 
-# add wind exclusions
-def wind_filter(mask):
-    """Filter out values outside the desired wind speed range."""
-    min_val = tech_config['min_wind_speed']
-    max_val = tech_config['max_wind_speed']
-    if min_val is not None and max_val is not None:
-        return (mask < min_val) | (mask > max_val)
-    elif min_val is not None:
-        return mask < min_val
-    elif max_val is not None:
-        return mask > max_val
-
+# add wind exclusions (values outside the desired wind speed range)
 if technology in  ["onshorewind", "offshorewind"] and (tech_config['min_wind_speed'] is not None or tech_config['max_wind_speed'] is not None): 
     min_wind_speed = tech_config['min_wind_speed']
     max_wind_speed = tech_config['max_wind_speed']
-    excluder.add_raster(windRasterPath, codes=wind_filter, crs=global_crs_obj)
+    excluder.add_raster(windRasterPath, codes=ValueRange(min_wind_speed, max_wind_speed, outside=True), crs=global_crs_obj)
     if min_wind_speed is not None and max_wind_speed is not None: info=f"min wind speed: {min_wind_speed}, max wind speed: {max_wind_speed}"
     elif min_wind_speed is not None: info=f"min wind speed: {min_wind_speed}"
     elif max_wind_speed is not None: info=f"max wind speed: {max_wind_speed}"
     info_list_exclusion.append(f'{info}')
 elif wind==0: info_list_not_available.append(f"wind")
 
-# add solar exclusions
-def solar_filter(mask): #desired yearly, specific solar production (kWh/m²/year) 
-    """Filter out values outside the desired solar production range (kWh/m²/year)."""
-    min_val = tech_config.get('min_solar_production')
-    max_val = tech_config.get('max_solar_production')
-    if min_val is not None and max_val is not None:
-        return (mask < min_val) | (mask > max_val)
-    elif min_val is not None:
-        return mask < min_val
-    elif max_val is not None:
-        return mask > max_val
-    
+# add solar exclusions (values outside the desired yearly, specific solar production range in kWh/m²/year)
 if technology == "solar" and (tech_config.get('min_solar_production') is not None or tech_config.get('max_solar_production') is not None):
     
     min_solar_production = tech_config.get('min_solar_production')
     max_solar_production = tech_config.get('max_solar_production')
 
-    excluder.add_raster(solarRasterPath, codes=solar_filter, crs=global_crs_obj)
+    excluder.add_raster(solarRasterPath, codes=ValueRange(min_solar_production, max_solar_production, outside=True), crs=global_crs_obj)
     if min_solar_production is not None and max_solar_production is not None:
         info=f"min_solar_production: {min_solar_production}, max_solar_production: {max_solar_production}"
     elif min_solar_production is not None:
@@ -333,7 +313,7 @@ elif protectedAreas == 0: info_list_not_available.append("protectedAreas")
 # Forest Density (optional; raster threshold like terrain ruggedness)
 param = tech_config.get('max_forest_density')
 if forestDensity == 1 and param is not None:
-    excluder.add_raster(forestDensityPath, codes=range(0,param), invert=True, crs=global_crs_obj)
+    excluder.add_raster(forestDensityPath, codes=ValueRange(0, param, include_max=False), invert=True, crs=global_crs_obj)
     info_list_exclusion.append(f"max forest density included: {param}")
 elif forestDensity == 1 and param is None: info_list_not_selected.append("forestDensity")
 elif forestDensity == 0: info_list_not_available.append("forestDensity")
@@ -390,7 +370,7 @@ if additional_exclusion_rasters==1 and buffer_config:
         if filename in buffer_config:              # check if buffer is defined
             buffer_value = buffer_config[filename]
             filepath = os.path.join(additional_exclusion_rasters_folderPath, filename)
-            excluder.add_raster(filepath, codes=range(0,1e6), buffer=buffer_value, crs=global_crs_obj)
+            excluder.add_raster(filepath, codes=ValueRange(0, 1e6, include_max=False), buffer=buffer_value, crs=global_crs_obj)
             info_list_exclusion.append(f'additional exclusion raster file: {filename}: {buffer_value}'        )
 elif additional_exclusion_rasters == 1 and not buffer_config: info_list_not_selected.append("additional_exclusion_rasters_buffer")
 elif additional_exclusion_rasters == 0: info_list_not_available.append("additional_exclusion_polygons_buffer")
@@ -431,12 +411,35 @@ for item in info_list_not_selected:
     print('- ', item)
 
 
+# Define output directory
+output_dir = os.path.join(data_path, 'available_land')
+os.makedirs(output_dir, exist_ok=True)
+output_file_available_land = os.path.join(output_dir, f"{region_name_clean}_{technology}_{scenario}_available_land_{local_crs_tag}.tif")
+
 # calculate available areas
 print('\nperforming exclusions...')
-masked, transform = shape_availability(region.geometry, excluder)
+exclusion_tile_size = config.get('exclusion_tile_size')
+if exclusion_tile_size:
+    # tile by tile into a GeoTIFF, memory depends on the tile size instead of the region size
+    output_file_unfiltered = os.path.join(output_dir, f"{region_name_clean}_{technology}_{scenario}_available_land_unfiltered_{local_crs_tag}.tif")
+    eligible_pixels, transform, _ = excluder.tiled_availability(region.geometry, output_file_unfiltered, tile_size=exclusion_tile_size,
+                                                                max_workers=config.get('exclusion_tile_workers') or 1)
+    if args.check_tiles:
+        print(f'tile check: {compare_tiled(excluder, region.geometry, output_file_unfiltered)} pixels differ from the exclusions without tiles')
+    if args.check_atlite:
+        with rasterio.open(output_file_unfiltered) as src:
+            masked = src.read(1).astype(bool)
+else:
+    masked, transform = excluder.shape_availability(region.geometry)
+    eligible_pixels = int(masked.sum())
+if args.check_atlite:
+    comparison = compare_with_atlite(excluder, region.geometry, available=masked)
+    print(f"atlite check: {comparison['differing_pixels']} differing pixels ({comparison['differing_share']:.4%}), "
+          f"eligible pixels {comparison['eligible_pixels']} (atlite {comparison['eligible_pixels_atlite']}), "
+          f"atlite took {comparison['seconds_atlite']:.2f} s")
 #masked, transform = shape_availability_reprojected(region.geometry, excluder, dst_transform=transform_lc, dst_crs=local_crs_obj, dst_shape=shape)
 
-available_area = masked.sum() * excluder.res**2
+available_area = eligible_pixels * excluder.res**2
 eligible_share = available_area / region.geometry.item().area
 available_area_km2 = available_area * 1e-6
 
@@ -455,40 +458,40 @@ min_pixels_connected = tech_config['min_pixels_connected']
 #min_pixels_x=tech_config['min_pixels_x']
 #min_pixels_y=tech_config['min_pixels_y']
 
-masked_area_filtered = area_filter(masked,min_size=min_pixels_connected)
-#masked_area_filtered = area_filter2(masked,min_x=5, min_y=5)
-
-#array to be used 
-array = masked_area_filtered
-
-# Convert boolean array to integers (1 for True, 0 for False)
-int_array = array.astype(np.uint8)
-
-# Set 0 (False) to be the nodata value
-nodata_value = 0
-
-#save eligible land array as .tif file
-# Define the metadata for the new file
-# You'll need to adjust these parameters based on your specific data
-metadata = {
-    'driver': 'GTiff',
-    'dtype': rasterio.uint8,
-    'nodata': nodata_value,
-    'width': array.shape[1],
-    'height': array.shape[0],
-    'count': 1,
-    'crs': local_crs_obj,  
-    'transform': transform,
-    'compress': 'LZW' 
-}
-
-# Define output directory
-output_dir = os.path.join(data_path, 'available_land')
-os.makedirs(output_dir, exist_ok=True)
-output_file_available_land = os.path.join(output_dir, f"{region_name_clean}_{technology}_{scenario}_available_land_{local_crs_tag}.tif")
-# Write the array to a new .tif file
-with rasterio.open(output_file_available_land, 'w', **metadata) as dst:
-    dst.write(array, 1)
+if exclusion_tile_size:
+    # areas connected across tiles are merged with a union-find, the mask is not read at once
+    area_filter_raster(output_file_unfiltered, output_file_available_land, min_size=min_pixels_connected,
+                       tile_size=exclusion_tile_size, max_workers=config.get('exclusion_tile_workers') or 1)
+    os.remove(output_file_unfiltered)
+else:
+    masked_area_filtered = area_filter(masked,min_size=min_pixels_connected)
+    #masked_area_filtered = area_filter2(masked,min_x=5, min_y=5)
+
+    #array to be used 
+    array = masked_area_filtered
+
+    # Convert boolean array to integers (1 for True, 0 for False)
+    int_array = array.astype(np.uint8)
+
+    # Set 0 (False) to be the nodata value
+    nodata_value = 0
+
+    #save eligible land array as .tif file
+    # Define the metadata for the new file
+    # You'll need to adjust these parameters based on your specific data
+    metadata = raster_profile(
+        dtype=rasterio.uint8,
+        nodata=nodata_value,
+        width=array.shape[1],
+        height=array.shape[0],
+        count=1,
+        crs=local_crs_obj,
+        transform=transform,
+    )
+
+    # Write the array to a new .tif file
+    with create_raster(output_file_available_land, metadata) as dst:
+        dst.write(array, 1)
  
 
 
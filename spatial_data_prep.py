@@ -2,7 +2,16 @@
 """
 @author: Jonas Meier
 
-TBA
+Spatial data prep of a study region: clips, reprojects and derives all input layers of the exclusion analysis.
+
+Can be run as a script (one region, or several with --regions) or imported:
+
+    from spatial_data_prep import load_configs, prepare_region, prepare_regions
+    config, config_advanced = load_configs()
+    prepare_regions(['Region A', 'Region B'], config, config_advanced)
+
+Global datasets (WDPA, DEM, population, landcover, wind and solar atlas, GADM boundaries) are loaded once per
+process and reused by all regions prepped in that process (see utils/global_datasets.py).
 """
 
 import time
@@ -12,436 +21,424 @@ import json
 import pickle
 import yaml
 import rasterio
-import pygadm
 import openeo
-import richdem
-import xdem
 import logging
 import argparse
-import numpy as np
+from types import SimpleNamespace
 from pyproj import CRS
 from utils.data_preprocessing import *
 from utils.local_OSM_shp_files import *
-from utils.fetch_OSM import osm_to_gpkg
+from utils.fetch_OSM import osm_to_gpkg, osm_features_to_gpkg, OVERPASS_URL
+from utils.osm_pbf import pbf_to_gpkg
 from utils.simplify import generate_overpass_polygon
-from utils.proximity_calc import generate_distance_raster
-
-# Record the starting time
-start_time = time.time()
+from utils.proximity_calc import generate_proximity_rasters, proximity_grid, exclusion_grid, on_grid
+from utils.dem_derivatives import compute_slope_aspect, compute_tri
+from utils.layer_cache import LayerCache
+from utils.raster_io import raster_profile, create_raster
+from utils.global_datasets import GlobalDatasets
+from utils.stage_scheduler import Stage, run_stages, print_stage_timings
 
 # Suppress specific noisy INFO logs from openeo
 #logging.getLogger("openeo.config").setLevel(logging.WARNING)
 #logging.getLogger("openeo.rest.connection").setLevel(logging.WARNING)
 
-
-with open("configs/config.yaml", "r", encoding="utf-8") as f:
-    config = yaml.load(f, Loader=yaml.FullLoader)
-
-# Load advanced data prep settings
-advanced_config_path = os.path.join("configs", "advanced_settings", "advanced_data_prep_settings.yaml")
-if not os.path.exists(advanced_config_path):
-    advanced_config_path = os.path.join("configs", "advanced_settings", "advanced_data_prep_settings_template.yaml")
-with open(advanced_config_path, "r", encoding="utf-8") as f:
-    config_advanced = yaml.load(f, Loader=yaml.FullLoader)
-
-#-------data config------- 
-consider_coastlines = config['coastlines']
-consider_railways = config['railways']
-consider_roads = config['roads']
-consider_airports = config['airports']
-consider_waterbodies = config['waterbodies']
-consider_military = config['military']
-population_data = config.get('population_source', 0)
-consider_wind_atlas = config['wind_atlas']
-consider_solar_atlas = config['solar_atlas']
-compute_substation_proximity = config.get('compute_substation_proximity', 0) 
-compute_road_proximity = config.get('compute_road_proximity', 0)
-compute_terrain_ruggedness = config.get('compute_terrain_ruggedness', 0)
-consider_additional_exclusion_polygons = config['additional_exclusion_polygons_folder_name']
-consider_additional_exclusion_rasters = config['additional_exclusion_rasters_folder_name']
-CRS_manual = config['CRS_manual']  #if None use empty string
-consider_protected_areas = config['protected_areas_source']
-OSM_source = config['OSM_source']  #either 'geofabrik' or 'overpass'
-consider_forest_density = config.get('forest_density', 0)
-
-#----------------------------
-study_region_name = config['study_region_name'] # this defines the folder where the data is saved and the prefix in the files. 
-region_name_clean = clean_region_name(study_region_name) 
-OSM_folder_name = config['OSM_folder_name'] #usually same as country_code, only needed if OSM is to be considered
-DEM_filename = config['DEM_filename']
-
-#use GADM boundary
-gadm_region_name = config['GADM_region_name'] #if country is studied, then use country name
-country_code = config['country_code']  #3-digit ISO code  #PRT  #Städteregion Aachen in level 2 #Porto in level 1 #Elbe-Elster in level 2 #Zell am See in level 2
-gadm_level = config['GADM_level']
-#or use custom region
-custom_study_area_filename = config.get('custom_study_area_filename', None)
-
-#Initialize parser for command line arguments and define arguments
-parser = argparse.ArgumentParser()
-parser.add_argument("--region", default=region_name_clean, help="study region name")
-parser.add_argument("--method",default="manual", help="method to run the script, e.g., snakemake or manual")
-args = parser.parse_args()
-
-# If running via Snakemake, use the region name and folder name from command line arguments
-if args.method == "snakemake":
-    region_name = args.region
-    print(region_name)
-    region_name_clean = clean_region_name(region_name)  # Clean the region name for file naming
-    print(f"Running via snakemake - measures: region={region_name_clean}")
-else:
-    print(f"Running manually - measures: region={region_name_clean}")
-
-##################################################
-#north facing pixels
-X = config_advanced['X']
-Y = config_advanced['Y']
-Z = config_advanced['Z']
-
-
-# Record the starting time
-start_time = time.time()
-
-# Get paths to data files or folders
-dirname = os.path.dirname(__file__)
+dirname = os.path.dirname(os.path.abspath(__file__))
 data_path = os.path.join(dirname, 'Raw_Spatial_Data')
-demRasterPath = os.path.join(data_path, 'DEM', DEM_filename)
-protected_areas_folder = os.path.join(data_path, 'protected_areas')
-additional_rasters_folder = os.path.join(data_path, 'additional_exclusion_rasters')
-wind_solar_atlas_folder = os.path.join(data_path, 'global_solar_wind_atlas')
-if OSM_source == 'geofabrik':
-    OSM_data_path = os.path.join(data_path, 'OSM', OSM_folder_name)
-
-# Define output directories
-output_dir = os.path.join(dirname, 'data', f'{region_name_clean}')
-os.makedirs(output_dir, exist_ok=True)
-
-# Set up logging
-log_file_path = os.path.join(output_dir, "data-prep.log")
-file_handler = logging.FileHandler(log_file_path, mode='w')
-file_handler.setLevel(logging.DEBUG)  # file can record everything
-
-stream_handler = logging.StreamHandler()
-stream_handler.setLevel(logging.WARNING)  # terminal only shows WARNING and above
-
-logging.basicConfig(
-    handlers=[file_handler, stream_handler],
-    level=logging.INFO,  # minimum level for logger; handlers override this
-    format="%(levelname)s:%(name)s:%(message)s"
-    ) #source: https://stackoverflow.com/questions/13733552/logger-configuration-to-log-to-file-and-print-to-stdout
-
-logging.info(f'\nPrepping {region_name_clean}...')
-
-#get region boundary
-if custom_study_area_filename:
-    #check if dynamic filename is used
-    if "{region_name}" in custom_study_area_filename:
-        custom_study_area_filename = custom_study_area_filename.format(region_name=region_name_clean)
-    print(f"\nUsing custom study area filename: {custom_study_area_filename}")
-    custom_study_area_filepath = os.path.join('Raw_Spatial_Data','custom_study_area', custom_study_area_filename)
-    region = gpd.read_file(custom_study_area_filepath).dissolve() # Dissolve to ensure it's a single polygon
-    if region.crs != 4326:
-        logging.warning('crs of custom polygon file for study region is not in EPSG 4326')
-    logging.info('using custom polygon for study area')
-elif gadm_level==0:
-    gadm_data = pygadm.Items(admin=country_code)
-    region = gadm_data
-    region.set_crs('epsg:4326', inplace=True) #pygadm lib extracts information from the GADM dataset as GeoPandas GeoDataFrame. GADM.org provides files in coordinate reference system is longitude/latitude and the WGS84 datum.
-    logging.info('using whole country as study area')
-else:
-    gadm_data = pygadm.Items(admin=country_code, content_level=gadm_level)
-    region = gadm_data.loc[gadm_data[f'NAME_{gadm_level}']==gadm_region_name].copy()
-    region.set_crs('epsg:4326', inplace=True) #pygadm lib extracts information from the GADM dataset as GeoPandas GeoDataFrame. GADM.org provides files in coordinate reference system is longitude/latitude and the WGS84 datum.
-    logging.info('using admin area within country as study area')
-
-# simplify polygon of study area (openeo can only handle polygons up to a certain size)
-try:
-    region["geometry"] = region["geometry"].simplify(config_advanced["study_area"]["tolerance"], preserve_topology=True)
-except Exception as e:
-    logging.warning(f"Polygon of study could not be simplified: {e}")
-region.to_file(os.path.join(output_dir, f'{region_name_clean}_EPSG4326.geojson'), driver='GeoJSON', encoding='utf-8')
-
-
-# calculate UTM zone based on representative point of country 
-representative_point = region.representative_point().iloc[0]
-latitude, longitude = representative_point.y, representative_point.x
-EPSG = int(32700 - round((45 + latitude) / 90, 0) * 100 + round((183 + longitude) / 6, 0))
-#if EPSG was set manual in the beginning then use that one
-if CRS_manual:
-    local_crs_obj = CRS.from_user_input(CRS_manual)  # Accepts 'EPSG:3035', 'ESRI:102003', WKT, or PROJ strings
-    logging.info(f'Using manually set CRS: {local_crs_obj.to_string()}')
-else:
-    local_crs_obj = CRS.from_user_input(EPSG)
-    logging.info(f'Local CRS to be used: {local_crs_obj.to_string()}')
-print(local_crs_obj)
-
-# Extract tag for filename, e.g., 'EPSG3035' or 'ESRI102003'
-auth = local_crs_obj.to_authority()
-local_crs_tag = ''.join(auth) if auth else local_crs_obj.to_string().replace(":", "_")
-# Save the CRS object as a pickle file
-with open(os.path.join(output_dir, f'{region_name_clean}_local_CRS.pkl'), 'wb') as file:
-    pickle.dump(local_crs_obj, file)
-
-# reproject country to defined projected CRS
-region.to_crs(local_crs_obj, inplace=True) 
-region.to_file(os.path.join(output_dir, f'{region_name_clean}_{local_crs_tag}.geojson'), driver='GeoJSON', encoding='utf-8')
-# also have region polygon in equal-area Mollweide projection
-region_mollweide = region.to_crs(CRS.from_user_input('ESRI:54009'))
-
-# set global CRS EPSG:4326
-global_crs_obj = CRS.from_user_input('4326')
-auth = global_crs_obj.to_authority()
-global_crs_tag = ''.join(auth) if auth else global_crs_obj.to_string().replace(":", "_")
-# Save the CRS object as a pickle file
-with open(os.path.join(output_dir, f'{region_name_clean}_global_CRS.pkl'), 'wb') as file:
-    pickle.dump(global_crs_obj, file)
-
-#calculate bounding box with 1000m buffer (region needs to be in projected CRS so meters are the unit)
-region_copy = region
-region_copy['buffered']=region_copy.buffer(1000)
-region_buffered_4000 = region_copy.buffer(4000) #have DEM larger than study area to account for Ruggedness Index calculation (convert to 4326 below)
-# Convert buffered region back to EPSC 4326 to get bounding box latitude and longitude 
-region_buffered_4326 = region_copy.set_geometry('buffered').to_crs(global_crs_obj)
-region_buffered_4000 = region_buffered_4000.to_crs(global_crs_obj)
-bounding_box = region_buffered_4326['buffered'].total_bounds 
-logging.info(f"Bounding box in EPSG 4326: \nminx: {bounding_box[0]}, miny: {bounding_box[1]}, maxx: {bounding_box[2]}, maxy: {bounding_box[3]}")
-
-
-#clip global oceans and seas file to study region for coastlines
-if consider_coastlines == 1:
-    print('\nprocessing coastlines')
-    goas_region_filePath = os.path.join(output_dir, f'goas_{region_name_clean}_{global_crs_tag}.gpkg')
-    if not os.path.exists(goas_region_filePath): #process data if file not exists in output folder
-        goas_raw_filePath = os.path.join(data_path, 'GOAS', 'goas.gpkg')
-        if not os.path.exists(goas_raw_filePath):
-            print('downloading global oceans and seas (coastlines)')
-            goas_download(output_dir=os.path.join(data_path, 'GOAS'))
-        try:
+
+# buffer around the region for the bounding box of the clipped layers (meters), also part of the goas cache key
+BOUNDING_BOX_BUFFER = 1000
+
+
+def load_configs(config_path=os.path.join("configs", "config.yaml")):
+    """
+    Loads the main config and the advanced data prep settings (falls back to the template if no own settings exist).
+
+    Returns:
+        tuple: (config, config_advanced) as dicts.
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+
+    advanced_config_path = os.path.join("configs", "advanced_settings", "advanced_data_prep_settings.yaml")
+    if not os.path.exists(advanced_config_path):
+        advanced_config_path = os.path.join("configs", "advanced_settings", "advanced_data_prep_settings_template.yaml")
+    with open(advanced_config_path, "r", encoding="utf-8") as f:
+        config_advanced = yaml.load(f, Loader=yaml.FullLoader)
+
+    return config, config_advanced
+
+
+def load_region(config, region_name=None, gadm_region_name=None, datasets=None):
+    """
+    Gets the boundary of a study region from the custom study area file or GADM, as configured in config.
+
+    Parameters:
+        config (dict): Main config.
+        region_name (str, optional): Name of the study region, used in a dynamic custom study area filename ("{region_name}"). Defaults to study_region_name of the config.
+        gadm_region_name (str, optional): Name of the admin area in GADM (only used for GADM_level > 0). Defaults to GADM_region_name of the config.
+        datasets (GlobalDatasets, optional): Shared global datasets, so GADM boundaries of a country are fetched once.
+
+    Returns:
+        tuple: (GeoDataFrame of the region in EPSG:4326, path to the custom study area file or None)
+    """
+    datasets = datasets or GlobalDatasets(data_path)
+    region_name = region_name or config['study_region_name']
+    gadm_region_name = gadm_region_name or config['GADM_region_name']
+    custom_study_area_filename = config.get('custom_study_area_filename', None)
+    gadm_level = config['GADM_level']
+
+    if custom_study_area_filename:
+        #check if dynamic filename is used
+        if "{region_name}" in custom_study_area_filename:
+            custom_study_area_filename = custom_study_area_filename.format(region_name=clean_region_name(region_name))
+        print(f"\nUsing custom study area filename: {custom_study_area_filename}")
+        custom_study_area_filepath = os.path.join(data_path, 'custom_study_area', custom_study_area_filename)
+        region = gpd.read_file(custom_study_area_filepath).dissolve() # Dissolve to ensure it's a single polygon
+        if region.crs != 4326:
+            logging.warning('crs of custom polygon file for study region is not in EPSG 4326')
+        logging.info('using custom polygon for study area')
+        return region, custom_study_area_filepath
+    elif gadm_level==0:
+        region = datasets.gadm(config['country_code'])
+        logging.info('using whole country as study area')
+    else:
+        gadm_data = datasets.gadm(config['country_code'], gadm_level)
+        region = gadm_data.loc[gadm_data[f'NAME_{gadm_level}']==gadm_region_name].copy()
+        if region.empty:
+            raise ValueError(f"'{gadm_region_name}' is not an admin area of {config['country_code']} at GADM_level {gadm_level} (column NAME_{gadm_level})")
+        logging.info('using admin area within country as study area')
+    return region, None
+
+
+def validate_region_names(region_names, config, datasets):
+    """
+    Checks that several region names select different study areas before any of them is prepped.
+
+    Parameters:
+        region_names (list of str): Names of the study regions.
+        config (dict): Main config.
+        datasets (GlobalDatasets): Shared global datasets (GADM boundaries).
+
+    Raises:
+        ValueError: If several names would select the same area (GADM_level 0 or a custom study area file without "{region_name}")
+                    or a name is not an admin area at GADM_level.
+    """
+    custom_study_area_filename = config.get('custom_study_area_filename', None)
+    gadm_level = config['GADM_level']
+    if custom_study_area_filename:
+        if "{region_name}" not in custom_study_area_filename and len(region_names) > 1:
+            raise ValueError(f"custom_study_area_filename '{custom_study_area_filename}' has no \"{{region_name}}\", so all regions would be the same area")
+    elif gadm_level == 0:
+        if len(region_names) > 1:
+            raise ValueError("GADM_level is 0, so every region name would be the whole country. Set GADM_level to the level of the region names.")
+    else:
+        gadm_names = set(datasets.gadm(config['country_code'], gadm_level)[f'NAME_{gadm_level}'])
+        unknown = [name for name in region_names if name not in gadm_names]
+        if unknown:
+            raise ValueError(f"not admin areas of {config['country_code']} at GADM_level {gadm_level} (column NAME_{gadm_level}): {unknown}")
+
+
+def prep_coastlines(ctx):
+    """Clip global oceans and seas (GOAS) file to study region for coastlines."""
+    if ctx.config['coastlines'] == 1:
+        print('\nprocessing coastlines')
+        goas_region_filePath = os.path.join(ctx.output_dir, f'goas_{ctx.region_name_clean}_{ctx.global_crs_tag}.gpkg')
+        goas_raw_filePath = ctx.datasets.goas_path()
+        goas_cache_key = ctx.layer_cache.key('goas', sources=[goas_raw_filePath], geometry=ctx.region, params={'bounding_box_buffer': BOUNDING_BOX_BUFFER})
+        if not ctx.layer_cache.restore(goas_cache_key, [goas_region_filePath]): #process data if region, buffer or source changed
             print('clipping coastlines to study region')
-            coastlines = gpd.read_file(goas_raw_filePath)
-            coastlines_region = coastlines.clip(bounding_box)
+            # only the GOAS parts intersecting the bounding box are read (R-tree of the split file)
+            coastlines_region = read_vector_bbox(ctx.datasets.goas_split_path(), ctx.bounding_box, dissolve=True)
             if not coastlines_region.empty:
-                coastlines_region.to_file(os.path.join(output_dir, f'goas_{region_name_clean}_{global_crs_tag}.gpkg'), driver='GPKG', encoding='utf-8')
+                coastlines_region.to_file(goas_region_filePath, driver='GPKG', encoding='utf-8')
             else:
                 logging.info('no coastline in study region')
-        except Exception as e:
-            logging.error(f'global oceans and seas (coastlines) failed: {e}')
-    else:
-        print(f"GOAS data already exists for region")
-
-
-# Convert region back to EPSC 4326 to trim raster files and clip polygons
-region.to_crs(global_crs_obj, inplace=True) 
-
-
-# OSM data
-if OSM_source == 'geofabrik':
-    try:
-        OSM_output_dir = os.path.join(output_dir, 'OSM_Infrastructure')
-        os.makedirs(OSM_output_dir, exist_ok=True) 
-        process_all_local_osm_layer(config_advanced, region, region_name_clean, OSM_output_dir, OSM_data_path, target_crs=None)
-    except Exception as e:
-        logging.error(f"local OSM shapefiles failed: {e}")
-
-elif OSM_source == 'overpass':
-    print('\nprocessing OSM data')
-
-    # Define OSM features to fetch
-    # Load all possible OSM features directly from config
-    osm_features_config = config_advanced.get("osm_features_config", {})
-    
-    print('Prepare polygon for overpass query')
-    #Use the GDAM polygon to fetch OSM data, first simplify the polygon to avoid too many vertices
-    polygon = generate_overpass_polygon(region)
-    
-    # Filter based on config flags
-    selected_osm_features_dict = {
-        key: val for key, val in osm_features_config.items()
-        if config.get(f"{key}", 0)}
-    
-    # Define output base directory and prepare unsupported log
-    OSM_output_dir = os.path.join(output_dir, "OSM_Infrastructure")
-    unsupported_summary = {}
-    unsupported_geometries_summary_path = os.path.join(OSM_output_dir, "unsupported_geometries_summary.json")
-
-    # Loop through regions and features
-    for feature_key in selected_osm_features_dict:
-
-        # skip if we’ve already got this GeoPackage
-        gpkg_path = os.path.join(OSM_output_dir, f"{feature_key}.gpkg")
-
-        if os.path.exists(gpkg_path) and not config_advanced['force_osm_download']:
-            print(f">>  Skipping '{feature_key}' for {region_name_clean}: '{rel_path(gpkg_path)}' already exists.")
-
+            ctx.layer_cache.store(goas_cache_key, 'goas', [goas_region_filePath])
         else:
-            print(f"\nProcessing {feature_key} in {region_name_clean}")
-            #the function returns a dictionary with unsupported geometries to check if the features dictionary is correct
-            unsupported = osm_to_gpkg(
-                region_name=region_name_clean,
-                polygon=polygon,
-                feature_key=feature_key,
-                features_dict=selected_osm_features_dict,
-                timeout=500,
-                # Optional override for geometry types per feature::
-                # relevant_geometries_override={"substation": ["node"]},
-                output_dir=OSM_output_dir
-            )
-
-            # Save unsupported counts if any were found
-            if unsupported:         
-                unsupported_summary[f"{region_name_clean}_{feature_key}"] = unsupported
-
-        # Save summary of unsupported geometries to JSON file
-        # the unsupported_summary dictionary contains the counts of unsupported geometries for each feature. 
-        # Unsupportd geometries are geometries not expected for the feature, e.g. a "node" for a transmission line. 
-        # Usually there are few unsupported geometries. 
-        
-        with open(unsupported_geometries_summary_path, "w", encoding="utf-8") as f:
-            json.dump(unsupported_summary, f, indent=2, ensure_ascii=False)
-
-    print(f"\nUnsupported geometry summary saved to {rel_path(OSM_output_dir)}")
-
-# create proximity raster for substations if data exists and calculation is enabled
-if compute_substation_proximity:
-    print('\ncomputing proximity distance for substations')
-    substation_filename = "substations.gpkg"
-    substations_path = os.path.join(OSM_output_dir, substation_filename)
-    if os.path.exists(substations_path):
-        substations_gdf = gpd.read_file(substations_path)
-        if not substations_gdf.empty:
-            proximity_dir = os.path.join(output_dir, "proximity")
-            os.makedirs(proximity_dir, exist_ok=True)
-            proximity_out = os.path.join(proximity_dir, "substation_distance.tif")
-            if os.path.exists(proximity_out):
-                print(f"Proximity raster already exists at {rel_path(proximity_out)}. Skipping generation.")
-            else:
-                generate_distance_raster(
-                    shapefile_path=substations_path,
-                    region_gdf=region,
-                    output_path=proximity_out,
+            print(f"GOAS data already exists for region")
+
+
+def prep_osm(ctx):
+    """OSM data from Geofabrik shapefiles, a local .osm.pbf extract or the overpass API."""
+    if ctx.config['OSM_source'] == 'geofabrik':
+        os.makedirs(ctx.OSM_output_dir, exist_ok=True) 
+        # layer flags are in the main config, fclass filters and store settings in the advanced settings
+        process_all_local_osm_layer({**ctx.config, **ctx.config_advanced}, ctx.region, ctx.region_name_clean, ctx.OSM_output_dir, ctx.OSM_data_path, target_crs=None)
+
+    elif ctx.config['OSM_source'] == 'pbf':
+        print('\nprocessing OSM data')
+        # same features and tag selectors as for overpass, read from the local extract in one pass
+        selected_osm_features_dict = {
+            key: val for key, val in ctx.config_advanced.get("osm_features_config", {}).items()
+            if ctx.config.get(f"{key}", 0) and (ctx.config_advanced['force_osm_download'] or not os.path.exists(os.path.join(ctx.OSM_output_dir, f"{key}.gpkg")))}
+        if not selected_osm_features_dict:
+            print(f">>  Skipping OSM for {ctx.region_name_clean}: all GeoPackages already exist.")
+            return
+        unsupported = pbf_to_gpkg(
+            ctx.OSM_data_path,
+            region_name=ctx.region_name_clean,
+            features_dict=selected_osm_features_dict,
+            output_dir=ctx.OSM_output_dir,
+            region_geometry=ctx.region.unary_union,
+            promoted_tags=ctx.config_advanced.get('overpass_promoted_tags', ['name']),
+        )
+        with open(os.path.join(ctx.OSM_output_dir, "unsupported_geometries_summary.json"), "w", encoding="utf-8") as f:
+            json.dump({f"{ctx.region_name_clean}_{key}": val for key, val in unsupported.items()}, f, indent=2, ensure_ascii=False)
+
+    elif ctx.config['OSM_source'] == 'overpass':
+        print('\nprocessing OSM data')
+
+        # Define OSM features to fetch
+        # Load all possible OSM features directly from config
+        osm_features_config = ctx.config_advanced.get("osm_features_config", {})
+
+        print('Prepare polygon for overpass query')
+        #Use the GDAM polygon to fetch OSM data, first simplify the polygon to avoid too many vertices
+        polygon = generate_overpass_polygon(ctx.region)
+
+        # Filter based on config flags
+        selected_osm_features_dict = {
+            key: val for key, val in osm_features_config.items()
+            if ctx.config.get(f"{key}", 0)}
+
+        # Prepare unsupported log
+        unsupported_summary = {}
+        unsupported_geometries_summary_path = os.path.join(ctx.OSM_output_dir, "unsupported_geometries_summary.json")
+
+        if ctx.config_advanced.get('overpass_union_query', 0):
+            # one combined query for all features which are missing (or all features if the download is forced)
+            missing_osm_features_dict = {
+                key: val for key, val in selected_osm_features_dict.items()
+                if ctx.config_advanced['force_osm_download'] or not os.path.exists(os.path.join(ctx.OSM_output_dir, f"{key}.gpkg"))}
+            for feature_key in [key for key in selected_osm_features_dict if key not in missing_osm_features_dict]:
+                print(f">>  Skipping '{feature_key}' for {ctx.region_name_clean}: '{rel_path(os.path.join(ctx.OSM_output_dir, f'{feature_key}.gpkg'))}' already exists.")
+            if missing_osm_features_dict:
+                print(f"\nProcessing {', '.join(missing_osm_features_dict)} in {ctx.region_name_clean}")
+                unsupported = osm_features_to_gpkg(
+                    region_name=ctx.region_name_clean,
+                    polygon=polygon,
+                    features_dict=missing_osm_features_dict,
+                    timeout=500,
+                    output_dir=ctx.OSM_output_dir,
+                    endpoint=ctx.config_advanced.get('overpass_endpoint') or OVERPASS_URL,
+                    # large regions: query tiles of the region instead of the simplified polygon
+                    region_geometry=ctx.region.unary_union,
+                    tile_size=ctx.config_advanced.get('overpass_tile_size'),
+                    promoted_tags=ctx.config_advanced.get('overpass_promoted_tags', ['name']),
+                    tile_options={
+                        'max_split_depth': ctx.config_advanced.get('overpass_max_split_depth', 3),
+                        'max_workers': ctx.config_advanced.get('overpass_workers', 2),
+                        'min_interval': ctx.config_advanced.get('overpass_min_interval', 1),
+                    },
+                    cache_dir=ctx.config_advanced.get('overpass_cache_dir') or os.path.join(dirname, 'data', '.overpass_cache'),
+                    # a forced download bypasses the cached responses
+                    cache_ttl=0 if ctx.config_advanced['force_osm_download'] else ctx.config_advanced.get('overpass_cache_ttl_days', 7) * 24 * 3600,
                 )
+                unsupported_summary.update({f"{ctx.region_name_clean}_{key}": val for key, val in unsupported.items()})
+            with open(unsupported_geometries_summary_path, "w", encoding="utf-8") as f:
+                json.dump(unsupported_summary, f, indent=2, ensure_ascii=False)
         else:
-            print("Proximity distance cannot be calculated as the substation is not provided.")
-    else:
-        print("Proximity distance cannot be calculated as the substation is not provided.")
-
-# create proximity raster for roads if data exists and calculation is enabled
-if compute_road_proximity:
-    print('\ncomputing proximity distance for roads')
-    roads_filename = "roads.gpkg"
-    roads_path = os.path.join(OSM_output_dir, roads_filename)
-    if os.path.exists(roads_path):
-        roads_gdf = gpd.read_file(roads_path) 
-        if not roads_gdf.empty:
-            proximity_dir = os.path.join(output_dir, "proximity")
-            os.makedirs(proximity_dir, exist_ok=True)
-            proximity_out = os.path.join(proximity_dir, "road_distance.tif")
-            if os.path.exists(proximity_out):
-                print(f"Proximity raster already exists at {rel_path(proximity_out)}. Skipping generation.")
-            else:
-                generate_distance_raster(
-                    shapefile_path=roads_path,
-                    region_gdf=region,
-                    output_path=proximity_out,
-                )
+            # Loop through regions and features
+            for feature_key in selected_osm_features_dict:
+
+                # skip if we’ve already got this GeoPackage
+                gpkg_path = os.path.join(ctx.OSM_output_dir, f"{feature_key}.gpkg")
+
+                if os.path.exists(gpkg_path) and not ctx.config_advanced['force_osm_download']:
+                    print(f">>  Skipping '{feature_key}' for {ctx.region_name_clean}: '{rel_path(gpkg_path)}' already exists.")
+
+                else:
+                    print(f"\nProcessing {feature_key} in {ctx.region_name_clean}")
+                    #the function returns a dictionary with unsupported geometries to check if the features dictionary is correct
+                    unsupported = osm_to_gpkg(
+                        region_name=ctx.region_name_clean,
+                        polygon=polygon,
+                        feature_key=feature_key,
+                        features_dict=selected_osm_features_dict,
+                        timeout=500,
+                        # Optional override for geometry types per feature::
+                        # relevant_geometries_override={"substation": ["node"]},
+                        output_dir=ctx.OSM_output_dir
+                    )
+
+                    # Save unsupported counts if any were found
+                    if unsupported:         
+                        unsupported_summary[f"{ctx.region_name_clean}_{feature_key}"] = unsupported
+
+                # Save summary of unsupported geometries to JSON file
+                # the unsupported_summary dictionary contains the counts of unsupported geometries for each feature. 
+                # Unsupportd geometries are geometries not expected for the feature, e.g. a "node" for a transmission line. 
+                # Usually there are few unsupported geometries. 
+
+                with open(unsupported_geometries_summary_path, "w", encoding="utf-8") as f:
+                    json.dump(unsupported_summary, f, indent=2, ensure_ascii=False)
+
+        print(f"\nUnsupported geometry summary saved to {rel_path(ctx.OSM_output_dir)}")
+
+
+def proximity_target_grid(ctx):
+    """
+    CRS and grid (transform, width, height) of the proximity rasters.
+
+    With proximity_grid 'landcover' the grid of the exclusion rasters at the landcover pixel size is used, with a
+    technology name (e.g. 'onshorewind') the grid of that technology (resolution_manual and projection_manual of
+    configs/<technology>.yaml, the landcover pixel size if no resolution is set). Otherwise an own grid at proximity_resolution.
+    """
+    target = ctx.config_advanced.get('proximity_grid')
+    crs = ctx.local_crs_obj
+    resolution = None
+    if target and target != 'landcover':
+        with open(os.path.join("configs", f"{target}.yaml"), "r", encoding="utf-8") as f:
+            tech_config = yaml.load(f, Loader=yaml.FullLoader)
+        if tech_config.get('projection_manual'):
+            crs = CRS.from_user_input(tech_config['projection_manual'])
+        resolution = tech_config.get('resolution_manual')
+    if target and resolution is None:
+        pixel_path = os.path.join(ctx.output_dir, f'pixel_size_{ctx.region_name_clean}_{ctx.local_crs_tag}.json')
+        if os.path.exists(pixel_path):
+            with open(pixel_path, 'r') as fp:
+                resolution = json.load(fp)
         else:
-            print("Proximity distance cannot be calculated as the roads are not provided.")
-    else:
-        print("Proximity distance cannot be calculated as the roads are not provided.")
-
-#clip and reproject additional exclusion polygons
-if consider_additional_exclusion_polygons:
-    print('\nprocessing additional exclusion polygons')
-    # Define output directory for additional exclusion polygons
-    add_excl_polygons_dir = os.path.join(output_dir,'additional_exclusion_polygons')
-    os.makedirs(add_excl_polygons_dir, exist_ok=True)
-    source_dir = os.path.join(data_path, 'additional_exclusion_polygons', config['additional_exclusion_polygons_folder_name'])
-    counter = 1
-    # Loop through all files in the directory
-    for filename in os.listdir(source_dir):
-        filepath = os.path.join(source_dir, filename)    # Construct the full file path
-        # Check if the file is either a GeoJSON or GeoPackage
-        if filename.endswith(".geojson") or filename.endswith(".gpkg"):
-            gdf = gpd.read_file(filepath) # Read the file into a GeoDataFrame
-            gdf_clipped_reprojected = geopandas_clip_reproject(gdf, region, global_crs_obj)
-            filename_base = os.path.splitext(filename)[0]  # Remove file extension
-            if not gdf_clipped_reprojected.empty:
-                gdf_clipped_reprojected.to_file(os.path.join(add_excl_polygons_dir, f'{counter}_{filename_base}_{region_name_clean}_{global_crs_tag}.gpkg'), driver='GPKG')
+            logging.warning(f'{rel_path(pixel_path)} not found, proximity rasters use their own grid')
+            crs = ctx.local_crs_obj
+    if resolution is None:
+        return crs, proximity_grid(ctx.region, crs, ctx.config_advanced.get('proximity_resolution', 100),
+                                   ctx.config_advanced.get('proximity_padding', 0))
+    return crs, exclusion_grid(ctx.region, crs, resolution)
+
+
+def prep_proximity(ctx):
+    """Proximity rasters for substations, roads, transmission lines and the coast (needs the OSM data and coastlines)."""
+    # output name -> (config flag, source file, description)
+    proximity_layers = {
+        'substation_distance': ('compute_substation_proximity', os.path.join(ctx.OSM_output_dir, "substations.gpkg"), 'substations'),
+        'road_distance': ('compute_road_proximity', os.path.join(ctx.OSM_output_dir, "roads.gpkg"), 'roads'),
+        'transmission_line_distance': ('compute_transmission_line_proximity', os.path.join(ctx.OSM_output_dir, "transmission_lines.gpkg"), 'transmission lines'),
+        'coast_distance': ('compute_coast_proximity', os.path.join(ctx.output_dir, f'goas_{ctx.region_name_clean}_{ctx.global_crs_tag}.gpkg'), 'coastlines'),
+    }
+    proximity_dir = os.path.join(ctx.output_dir, "proximity")
+    crs, grid = proximity_target_grid(ctx)
+
+    sources = {}
+    for name, (flag, source_path, description) in proximity_layers.items():
+        if not ctx.config.get(flag, 0):
+            continue
+        print(f'\ncomputing proximity distance for {description}')
+        proximity_out = os.path.join(proximity_dir, f"{name}.tif")
+        if not os.path.exists(source_path):
+            print(f"Proximity distance cannot be calculated as the {description} are not provided.")
+        elif os.path.exists(proximity_out) and on_grid(proximity_out, crs, *grid):
+            print(f"Proximity raster already exists at {rel_path(proximity_out)}. Skipping generation.")
+        else:
+            sources[proximity_out] = source_path
+
+    if sources:
+        # all layers are rasterized on the same grid and written once, masked to the region
+        written = generate_proximity_rasters(sources, region_gdf=ctx.region, crs=crs, grid=grid)
+        for proximity_out, ok in written.items():
+            if ok:
+                print(f"Saved proximity raster to {rel_path(proximity_out)}")
+            else:
+                print(f"Proximity distance cannot be calculated for {rel_path(proximity_out)} as the source has no features.")
+
+
+def prep_additional_exclusion_polygons(ctx):
+    """Clip and reproject additional exclusion polygons."""
+    if ctx.config['additional_exclusion_polygons_folder_name']:
+        print('\nprocessing additional exclusion polygons')
+        # Define output directory for additional exclusion polygons
+        add_excl_polygons_dir = os.path.join(ctx.output_dir,'additional_exclusion_polygons')
+        os.makedirs(add_excl_polygons_dir, exist_ok=True)
+        source_dir = os.path.join(ctx.data_path, 'additional_exclusion_polygons', ctx.config['additional_exclusion_polygons_folder_name'])
+        counter = 1
+        # Loop through all files in the directory
+        for filename in os.listdir(source_dir):
+            filepath = os.path.join(source_dir, filename)    # Construct the full file path
+            # Check if the file is either a GeoJSON or GeoPackage
+            if filename.endswith(".geojson") or filename.endswith(".gpkg"):
+                gdf = gpd.read_file(filepath) # Read the file into a GeoDataFrame
+                gdf_clipped_reprojected = geopandas_clip_reproject(gdf, ctx.region, ctx.global_crs_obj)
+                filename_base = os.path.splitext(filename)[0]  # Remove file extension
+                if not gdf_clipped_reprojected.empty:
+                    gdf_clipped_reprojected.to_file(os.path.join(add_excl_polygons_dir, f'{counter}_{filename_base}_{ctx.region_name_clean}_{ctx.global_crs_tag}.gpkg'), driver='GPKG')
+                    counter = counter + 1
+
+
+def prep_additional_exclusion_rasters(ctx):
+    """Clip additional exclusion rasters."""
+    if ctx.config['additional_exclusion_rasters_folder_name']:
+        print('\nprocessing additional exclusion rasters')
+        add_excl_rasters_dir = os.path.join(ctx.output_dir,'additional_exclusion_rasters') 
+        os.makedirs(add_excl_rasters_dir, exist_ok=True) # Define output directory for additional exclusion rasters
+        source_dir = os.path.join(ctx.data_path, 'additional_exclusion_rasters', ctx.config['additional_exclusion_rasters_folder_name'])
+        counter = 1
+        # Loop through all files in the directory
+        for filename in os.listdir(source_dir):
+            filepath = os.path.join(source_dir, filename)    # Construct the full file path
+            # Check if the file is either a GeoJSON or GeoPackage
+            if filename.endswith(".tif"):
+                data_name = os.path.splitext(filename)[0]
+                clip_raster(filepath, ctx.region_name_clean, ctx.region, add_excl_rasters_dir, data_name, block_size=ctx.raster_block_size)
                 counter = counter + 1
 
-#clip and reproject additional rasters
-if consider_additional_exclusion_rasters:
-    print('\nprocessing additional exclusion rasters')
-    add_excl_rasters_dir = os.path.join(output_dir,'additional_exclusion_rasters') 
-    os.makedirs(add_excl_rasters_dir, exist_ok=True) # Define output directory for additional exclusion rasters
-    source_dir = os.path.join(data_path, 'additional_exclusion_rasters', config['additional_exclusion_rasters_folder_name'])
-    counter = 1
-    # Loop through all files in the directory
-    for filename in os.listdir(source_dir):
-        filepath = os.path.join(source_dir, filename)    # Construct the full file path
-        # Check if the file is either a GeoJSON or GeoPackage
-        if filename.endswith(".tif"):
-            data_name = os.path.splitext(filename)[0]
-            clip_raster(filepath, region_name_clean, region, add_excl_rasters_dir, data_name)
-            counter = counter + 1
-
-
-#population data
-if population_data == 'worldpop':
-    print('\nprocessing population data')
-    try:
-        population_filePath = os.path.join(output_dir, f'population_{region_name_clean}_EPSG4326.tif') 
-        if not os.path.exists(population_filePath): #process data if file not exists in output folder
-            population_raw_filePath = os.path.join(data_path, 'population', f"population_{country_code}_{config['population_year']}.tif")
-            if not os.path.exists(population_raw_filePath):
-                download_worldpop(country_code=country_code, year=config['population_year'], output_dir=os.path.join(data_path, 'population'))
-            clip_raster(population_raw_filePath, region_name_clean, region, output_dir, 'population')
-    except Exception as e:
-        logging.error(f"population data failed: {e}")
-if population_data == 'file':
-    print('\nprocessing local population data')
-    try:
-        population_filePath = os.path.join(output_dir, f'population_{region_name_clean}_EPSG4326.tif')
-        if not os.path.exists(population_filePath): #process data if file not exists in output folder
-            population_raw_filePath = os.path.join(data_path, 'population', f"population_{country_code}_{config['population_year']}.tif")
-            clip_raster(population_raw_filePath, region_name_clean, region, output_dir, 'population')
-    except Exception as e:
-        logging.error(f"population data failed: {e}")
-
-
 
-if config['landcover_source'] == 'openeo':
-    print('\nprocessing landcover')
-    logging.info('using openeo to get landcover')
-    openeo_landcover_filePath = os.path.join(output_dir, f'landcover_openeo_{region_name_clean}_{global_crs_tag}.tif')
-    
-    if not os.path.exists(openeo_landcover_filePath):
-        try:
+def prep_population(ctx):
+    """Population data (WorldPop or local file)."""
+    population_data = ctx.config.get('population_source', 0)
+    if population_data == 'worldpop' or population_data == 'file':
+        print('\nprocessing population data')
+        population_filePath = os.path.join(ctx.output_dir, f'population_{ctx.region_name_clean}_EPSG4326.tif') 
+        population_raw_filePath = ctx.datasets.population_path(ctx.country_code, ctx.config['population_year'], download=population_data == 'worldpop')
+        population_cache_key = ctx.layer_cache.key('population', sources=[population_raw_filePath], geometry=ctx.region)
+        if not ctx.layer_cache.restore(population_cache_key, [population_filePath]): #process data if region or source changed
+            with ctx.datasets.raster(population_raw_filePath) as population_src:
+                clip_raster(population_src, ctx.region_name_clean, ctx.region, ctx.output_dir, 'population', block_size=ctx.raster_block_size)
+            ctx.layer_cache.store(population_cache_key, 'population', [population_filePath])
+        else:
+            print(f"Population data already exists for region")
+
+
+def prep_landcover(ctx):
+    """Landcover from openeo or a local file, including pixel size and landcover codes."""
+    if ctx.config['landcover_source'] == 'openeo':
+        print('\nprocessing landcover')
+        logging.info('using openeo to get landcover')
+        openeo_landcover_filePath = os.path.join(ctx.output_dir, f'landcover_openeo_{ctx.region_name_clean}_{ctx.global_crs_tag}.tif')
+        openeo_landcover_colored_filePath = os.path.join(ctx.output_dir, f'landcover_openeo_colored_{ctx.region_name_clean}_{ctx.global_crs_tag}.tif')
+        landcover_openeo_local_CRS = os.path.join(ctx.output_dir, f'landcover_openeo_{ctx.region_name_clean}_{ctx.local_crs_tag}.tif')
+        openeo_output_paths = [openeo_landcover_filePath, openeo_landcover_colored_filePath, landcover_openeo_local_CRS,
+                               os.path.join(ctx.output_dir, f'pixel_size_{ctx.region_name_clean}_{ctx.local_crs_tag}.json'),
+                               os.path.join(ctx.output_dir, f'landuses_{ctx.region_name_clean}.json')]
+        # the aoi sent to openeo is derived from the region, so the region geometry keys the download
+        openeo_cache_key = ctx.layer_cache.key('landcover_openeo', geometry=ctx.region,
+                                               params={'collection': 'ESA_WORLDCOVER_10M_2021_V2', 'resolution': ctx.config['resolution_landcover'], 'crs': ctx.local_crs_tag})
+
+        if not ctx.layer_cache.restore(openeo_cache_key, openeo_output_paths): #download if region or resolution changed
 
             connection = openeo.connect(url="openeo.dataspace.copernicus.eu").authenticate_oidc()
 
-            if custom_study_area_filename:
-                with open(custom_study_area_filepath, 'r', encoding="utf-8") as file: #use region file in EPSG 4326 because openeo default file is in 4326
+            if ctx.aoi_path:
+                with open(ctx.aoi_path, 'r', encoding="utf-8") as file: #use region file in EPSG 4326 because openeo default file is in 4326
                     aoi = json.load(file) #load polygon for clipping with openeo            
             else:
-                with open(os.path.join(output_dir, f'{region_name_clean}_EPSG4326.geojson'), 'r') as file: #use region file in EPSG 4326 because openeo default file is in 4326
+                with open(os.path.join(ctx.output_dir, f'{ctx.region_name_clean}_EPSG4326.geojson'), 'r') as file: #use region file in EPSG 4326 because openeo default file is in 4326
                     aoi = json.load(file)
 
             datacube_landcover = connection.load_collection("ESA_WORLDCOVER_10M_2021_V2")
             # clip landcover directly to area of interest 
             landcover = datacube_landcover.mask_polygon(aoi)
-            
+
             # change resolution if wanted (projection also possible, see documentation)
-            if config['resolution_landcover']:
-                landcover = landcover.resample_spatial(resolution=config['resolution_landcover']) #resolution=0 does not change resolution
-            
+            if ctx.config['resolution_landcover']:
+                landcover = landcover.resample_spatial(resolution=ctx.config['resolution_landcover']) #resolution=0 does not change resolution
+
             result = landcover.save_result('GTiFF')
             job_options = {
                 "do_extent_check": False,
                 "executor-memory": "5G", #set executer-memory higher to process larger regions; see https://forum.dataspace.copernicus.eu/t/batch-process-error-when-using-certain-region/1454 
                 } #see also https://discuss.eodc.eu/t/memory-overhead-problem/424
             # Creating a new batch job at the back-end by sending the datacube information.
-            job = result.create_job(job_options=job_options, title=f'landcover_openeo_{region_name_clean}_{global_crs_tag}')
+            job = result.create_job(job_options=job_options, title=f'landcover_openeo_{ctx.region_name_clean}_{ctx.global_crs_tag}')
             # Starts the job and waits until it finished to download the result.
             job.start_and_wait()
             job.get_results().download_file(openeo_landcover_filePath) 
@@ -449,15 +446,14 @@ if config['landcover_source'] == 'openeo':
             # color openeo landcover file
             try:
                 from utils import legends 
-                openeo_landcover_colored_filePath = os.path.join(output_dir, f'landcover_openeo_colored_{region_name_clean}_{global_crs_tag}.tif')
                 colors_dict_int = getattr(legends, 'colors_dict_esa_worldcover2021_int') #color codes as RGB integers
                 with rasterio.open(openeo_landcover_filePath) as landcover:
                     band = landcover.read(1, masked=True) # Read the first band, masked=True is masking no data values
                     meta = landcover.meta
                     colors_dict_int_sorted = dict(sorted(colors_dict_int.items())) #can only write color values as int with rasterio 
-                    meta.update({'compress': 'DEFLATE', 'photometric': 'palette'}) # You can also try 'DEFLATE', 'JPEG', or 'PACKBITS'
+                    meta = raster_profile(meta, photometric='palette')
                     # save colored version
-                    with rasterio.open(openeo_landcover_colored_filePath, 'w', **meta) as dst:
+                    with create_raster(openeo_landcover_colored_filePath, meta) as dst:
                         dst.write(band, indexes=1)
                         dst.write_colormap(1, colors_dict_int_sorted) #be aware of dtype: landcover file is saved with int16, so RGB color values also needs to be an integer?
             except Exception as e:
@@ -466,238 +462,412 @@ if config['landcover_source'] == 'openeo':
 
             # reproject landcover to local CRS
             # grayscale (for DEM calculations below)
-            landcover_openeo_local_CRS = os.path.join(output_dir, f'landcover_openeo_{region_name_clean}_{local_crs_tag}.tif')
-            reproject_raster(openeo_landcover_filePath, region_name_clean, local_crs_obj, 'mode', 'uint8', landcover_openeo_local_CRS)
+            reproject_raster(openeo_landcover_filePath, ctx.region_name_clean, ctx.local_crs_obj, 'mode', 'uint8', landcover_openeo_local_CRS)
             # # colored
             # landcover_openeo_local_CRS_colored = os.path.join(output_dir, f'landcover_openeo_colored_{region_name_clean}_{local_crs_tag}.tif')
             # reproject_raster(openeo_landcover_colored_filePath, region_name_clean, local_crs_obj, 'mode', 'uint8', landcover_openeo_local_CRS_colored)
 
             # save pixel size and unique land cover codes
-            landcover_information(landcover_openeo_local_CRS, output_dir, region_name_clean, local_crs_tag)
-        
-        except Exception as e:
-            logging.error(f"openeo landcover failed: {e}")
-
-
-    elif os.path.exists(openeo_landcover_filePath):
-        logging.info('Landcover not downloaded from openeo. There is already a clipped landcover file in the output folder.')
-
-    processed_landcover_filePath = openeo_landcover_filePath
-
-if config['landcover_source'] == 'file':
-    print('processing landcover')
-    try:
-        landcover_filename = config['landcover_filename']
-        landcoverRasterPath = os.path.join(data_path, 'landcover', landcover_filename)
-        local_landcover_filePath = os.path.join(output_dir, f'landcover_file_{region_name_clean}_{global_crs_tag}.tif')
-        if not os.path.exists(local_landcover_filePath): #process data if file not exists in output folder
+            landcover_information(landcover_openeo_local_CRS, ctx.output_dir, ctx.region_name_clean, ctx.local_crs_tag)
+            ctx.layer_cache.store(openeo_cache_key, 'landcover_openeo', openeo_output_paths)
+        else:
+            logging.info('Landcover not downloaded from openeo. There is already a clipped landcover file in the output folder.')
+
+        processed_landcover_filePath = openeo_landcover_filePath
+
+    if ctx.config['landcover_source'] == 'file':
+        print('processing landcover')
+        landcover_filename = ctx.config['landcover_filename']
+        landcoverRasterPath = os.path.join(ctx.data_path, 'landcover', landcover_filename)
+        local_landcover_filePath = os.path.join(ctx.output_dir, f'landcover_file_{ctx.region_name_clean}_{ctx.global_crs_tag}.tif')
+        landcover_local_CRS = os.path.join(ctx.output_dir, f'landcover_file_{ctx.region_name_clean}_{ctx.local_crs_tag}.tif')
+        landcover_output_paths = [local_landcover_filePath, landcover_local_CRS,
+                                  os.path.join(ctx.output_dir, f'pixel_size_{ctx.region_name_clean}_{ctx.local_crs_tag}.json'),
+                                  os.path.join(ctx.output_dir, f'landuses_{ctx.region_name_clean}.json')]
+        landcover_cache_key = ctx.layer_cache.key('landcover_file', sources=[landcoverRasterPath], geometry=ctx.region, params={'crs': ctx.local_crs_tag})
+        if not ctx.layer_cache.restore(landcover_cache_key, landcover_output_paths): #process data if region or source changed
             print('processing landcover')
             logging.info('using local file to get landcover')
-            clip_reproject_raster(landcoverRasterPath, region_name_clean, region, 'landcover_file', local_crs_obj, 'mode', 'int16', output_dir)
-            landcover_openeo_local_CRS = os.path.join(output_dir, f'landcover_file_{region_name_clean}_{local_crs_tag}.tif')
-            landcover_information(landcover_openeo_local_CRS, output_dir, region_name_clean, local_crs_tag)
+            with ctx.datasets.raster(landcoverRasterPath) as landcover_src:
+                clip_reproject_raster(landcover_src, ctx.region_name_clean, ctx.region, 'landcover_file', ctx.local_crs_obj, 'mode', 'int16', ctx.output_dir, block_size=ctx.raster_block_size)
+            landcover_information(landcover_local_CRS, ctx.output_dir, ctx.region_name_clean, ctx.local_crs_tag)
+            ctx.layer_cache.store(landcover_cache_key, 'landcover_file', landcover_output_paths)
         else:
             print(f"Local landcover already processed to region.")
-        processed_landcover_filePath = os.path.join(output_dir, f'landcover_file_{region_name_clean}_{local_crs_tag}.tif')
-    except Exception as e:
-        logging.error(f"local landcover file failed: {e}")
-    
-
-
-print('\nprocessing DEM') #block comment: SHIFT+ALT+A, multiple line comment: STRG+#
-try:
-    clip_reproject_raster(demRasterPath, region_name_clean, region, 'DEM', local_crs_obj, 'bilinear', 'float32', output_dir)
-    clip_reproject_raster(demRasterPath, region_name_clean, region_buffered_4000, 'DEM_buffered', local_crs_obj, 'bilinear', 'float32', output_dir)
-    dem_4326_Path = os.path.join(output_dir, f'DEM_{region_name_clean}_EPSG4326.tif')
-    dem_local_buffered_Path = os.path.join(output_dir, f'DEM_buffered_{region_name_clean}_{local_crs_tag}.tif') #for ruggedness index calculation
+        processed_landcover_filePath = landcover_local_CRS
+
+
+
+def prep_dem(ctx):
+    """DEM and its derivatives (slope, aspect, north facing pixels, terrain ruggedness)."""
+    print('\nprocessing DEM') #block comment: SHIFT+ALT+A, multiple line comment: STRG+#
+    with ctx.datasets.raster(ctx.demRasterPath) as dem_src:
+        clip_reproject_raster(dem_src, ctx.region_name_clean, ctx.region, 'DEM', ctx.local_crs_obj, 'bilinear', 'float32', ctx.output_dir, block_size=ctx.raster_block_size)
+        # the buffered DEM is only needed in the local CRS (ruggedness index), so it is warped straight from the source
+        clip_reproject_raster(dem_src, ctx.region_name_clean, ctx.region_buffered_4000, 'DEM_buffered', ctx.local_crs_obj, 'bilinear', 'float32', ctx.output_dir, block_size=ctx.raster_block_size, write_geographic=False)
+    dem_4326_Path = os.path.join(ctx.output_dir, f'DEM_{ctx.region_name_clean}_EPSG4326.tif')
+    dem_local_buffered_Path = os.path.join(ctx.output_dir, f'DEM_buffered_{ctx.region_name_clean}_{ctx.local_crs_tag}.tif') #for ruggedness index calculation
     #reproject and match resolution of DEM to landcover data (co-registration)
-    dem_localCRS_Path=os.path.join(output_dir, f'DEM_{region_name_clean}_{local_crs_tag}.tif')
+    dem_localCRS_Path=os.path.join(ctx.output_dir, f'DEM_{ctx.region_name_clean}_{ctx.local_crs_tag}.tif')
     # dem_resampled_Path=os.path.join(output_dir, f'DEM_{region_name_clean}_{local_crs_tag}_resampled.tif') 
     # co_register(dem_localCRS_Path, processed_landcover_filePath, 'nearest', dem_resampled_Path, dtype='int16')
 
-    #slope and aspect map
+    #slope, aspect and north facing pixels in one tiled pass over the DEM in local CRS
     # Define output directories
-    richdem_helper_dir = os.path.join(output_dir, 'derived_from_DEM')
+    richdem_helper_dir = os.path.join(ctx.output_dir, 'derived_from_DEM')
     os.makedirs(richdem_helper_dir, exist_ok=True)
+    dem_tile_size = ctx.raster_block_size or 1024
+
+    slopeFilePathLocalCRS = os.path.join(richdem_helper_dir, f'slope_{ctx.region_name_clean}_{ctx.local_crs_tag}.tif')
+    aspectFilePathLocalCRS = os.path.join(richdem_helper_dir, f'aspect_{ctx.region_name_clean}_{ctx.local_crs_tag}.tif')
+    # map showing pixels with slope bigger X and aspect between Y and Z (north facing with slope where you would not build PV)
+    northFacingFilePathLocalCRS = os.path.join(richdem_helper_dir, f'north_facing_{ctx.region_name_clean}_{ctx.local_crs_tag}.tif')
+    north_facing_count = compute_slope_aspect(dem_localCRS_Path, slopeFilePathLocalCRS, aspectFilePathLocalCRS, northFacingFilePathLocalCRS,
+                                              north_facing_thresholds=(ctx.config_advanced['X'], ctx.config_advanced['Y'], ctx.config_advanced['Z']),
+                                              tile_size=dem_tile_size)
 
-    #create slope map (https://www.earthdatascience.org/tutorials/get-slope-aspect-from-digital-elevation-model/)
-    #save in local CRS
-    dem_file = richdem.LoadGDAL(dem_localCRS_Path)
-    slope = richdem.TerrainAttribute(dem_file, attrib='slope_degrees')
-    slopeFilePathLocalCRS = os.path.join(richdem_helper_dir, f'slope_{region_name_clean}_{local_crs_tag}.tif')
-    save_richdem_file(slope, dem_localCRS_Path, slopeFilePathLocalCRS)
-    # slope_co_registered_FilePath = os.path.join(richdem_helper_dir, f'slope_{region_name_clean}_{local_crs_tag}_resampled.tif')
-    # co_register(slopeFilePathLocalCRS, processed_landcover_filePath, 'nearest', slope_co_registered_FilePath, dtype='int16')
     #save in 4326: slope cannot be calculated from EPSG4326 because units get confused (https://github.com/r-barnes/richdem/issues/34)
-    slopeFilePath4326 = os.path.join(richdem_helper_dir, f'slope_{region_name_clean}_EPSG4326.tif')
-    reproject_raster(slopeFilePathLocalCRS, region_name_clean, 4326, 'bilinear', 'float32', slopeFilePath4326)
-
-    #create aspect map (https://www.earthdatascience.org/tutorials/get-slope-aspect-from-digital-elevation-model/)
-    #save in local CRS
-    dem_file = richdem.LoadGDAL(dem_localCRS_Path)
-    aspect = richdem.TerrainAttribute(dem_file, attrib='aspect')
-    aspectFilePathLocalCRS = os.path.join(richdem_helper_dir, f'aspect_{region_name_clean}_{local_crs_tag}.tif')
-    save_richdem_file(aspect, dem_localCRS_Path, aspectFilePathLocalCRS)
-    # aspect_co_registered_FilePath = os.path.join(richdem_helper_dir, f'aspect_{region_name_clean}_{local_crs_tag}_resampled.tif')
-    # co_register(aspectFilePathLocalCRS, processed_landcover_filePath, 'nearest', aspect_co_registered_FilePath, dtype='int16')
-    #save in 4326: not sure if aspect is calculated correctly in EPSG4326 because units might get confused (https://github.com/r-barnes/richdem/issues/34)
-    aspectFilePath4326 = os.path.join(richdem_helper_dir, f'aspect_{region_name_clean}_EPSG4326.tif')
-    reproject_raster(aspectFilePathLocalCRS, region_name_clean, 4326, 'bilinear', 'float32', aspectFilePath4326)
+    slopeFilePath4326 = os.path.join(richdem_helper_dir, f'slope_{ctx.region_name_clean}_EPSG4326.tif')
+    reproject_raster(slopeFilePathLocalCRS, ctx.region_name_clean, 4326, 'bilinear', 'float32', slopeFilePath4326)
+
+    northFacingFilePath4326 = os.path.join(richdem_helper_dir, f'north_facing_{ctx.region_name_clean}_EPSG4326.tif')
+    if north_facing_count > 0:
+        reproject_raster(northFacingFilePathLocalCRS, ctx.region_name_clean, 4326, 'nearest', 'int16', northFacingFilePath4326)
+    else:
+        logging.info('no north-facing pixel exceeding threshold slope')
+        for path in [northFacingFilePathLocalCRS, northFacingFilePath4326]:
+            if os.path.exists(path):
+                os.remove(path)
 
     #------------- Terrain Ruggedness Index -----------------
-    if compute_terrain_ruggedness:
+    if ctx.config.get('compute_terrain_ruggedness', 0):
         print('\nprocessing Terrain Ruggedness Index')
-        tri_local_path = os.path.join(richdem_helper_dir, f'TerrainRuggednessIndex_{region_name_clean}_{local_crs_tag}.tif')
-        tri_global_path = os.path.join(richdem_helper_dir, f'TerrainRuggednessIndex_{region_name_clean}_{global_crs_tag}.tif')
-        if os.path.exists(tri_local_path) and os.path.exists(tri_global_path):
+        tri_local_path = os.path.join(richdem_helper_dir, f'TerrainRuggednessIndex_{ctx.region_name_clean}_{ctx.local_crs_tag}.tif')
+        tri_global_path = os.path.join(richdem_helper_dir, f'TerrainRuggednessIndex_{ctx.region_name_clean}_{ctx.global_crs_tag}.tif')
+        # keyed by the DEM source, not by the buffered DEM which is written again in every run
+        tri_cache_key = ctx.layer_cache.key('terrain_ruggedness', sources=[ctx.demRasterPath], geometry=ctx.region_buffered_4000, params={'crs': ctx.local_crs_tag, 'window_size': 9})
+        if ctx.layer_cache.restore(tri_cache_key, [tri_local_path, tri_global_path]): #process data if region or DEM changed
             print(f"Terrain Ruggedness Index already exists at {rel_path(tri_local_path)}. Skipping calculation.")
         else:
-            dem = xdem.DEM(dem_local_buffered_Path)
-            tri = dem.terrain_ruggedness_index(window_size=9)
-            tri.data = np.rint(tri.data).astype(np.float32)
-            tri.save(tri_local_path)
-            reproject_raster(tri_local_path, region_name_clean, 4326, 'bilinear', 'float32', tri_global_path)
-    
-
-    # create map showing pixels with slope bigger X and aspect between Y and Z (north facing with slope where you would not build PV)
-    # local CRS co-registered
-    #create_north_facing_pixels(slope_co_registered_FilePath, aspect_co_registered_FilePath, region_name_clean, richdem_helper_dir, X, Y, Z)
-    create_north_facing_pixels(slopeFilePath4326, aspectFilePath4326, region_name_clean, richdem_helper_dir, X, Y, Z)
+            compute_tri(dem_local_buffered_Path, tri_local_path, window_size=9, tile_size=dem_tile_size)
+            reproject_raster(tri_local_path, ctx.region_name_clean, 4326, 'bilinear', 'float32', tri_global_path)
+            ctx.layer_cache.store(tri_cache_key, 'terrain_ruggedness', [tri_local_path, tri_global_path])
 
-except Exception as e:
-    logging.error(f'DEM failed: {e}')
 
 
-#protected areas
-#download WDPA (WDPA is country specific, so the protected areas for a custom polygon spanning over multiple countries cannot be obtained)
-if consider_protected_areas == 'WDPA' or consider_protected_areas == 'file':
-    print('\nprocessing protected areas')
-    protected_areas_filePath = os.path.join(output_dir, f'protected_areas_{consider_protected_areas}_{region_name_clean}_{global_crs_tag}.gpkg')
-    if not os.path.exists(protected_areas_filePath): #process data if file not exists in output folder
+def prep_protected_areas(ctx):
+    """Protected areas (WDPA or local file)."""
+    #download WDPA (WDPA is country specific, so the protected areas for a custom polygon spanning over multiple countries cannot be obtained)
+    consider_protected_areas = ctx.config['protected_areas_source']
+    if consider_protected_areas == 'WDPA' or consider_protected_areas == 'file':
+        print('\nprocessing protected areas')
+        protected_areas_filePath = os.path.join(ctx.output_dir, f'protected_areas_{consider_protected_areas}_{ctx.region_name_clean}_{ctx.global_crs_tag}.gpkg')
 
         if consider_protected_areas == 'WDPA':    
             logging.info('using WDPA')
-            raw_WPDA_file = os.path.join(protected_areas_folder, f'WDPA_{country_code}', f'{country_code}_WDPA.gpkg')
-            if not os.path.exists(raw_WPDA_file):
-                try: 
-                    WDPA_country_folder = os.path.join(protected_areas_folder, f'WDPA_{country_code}')
-                    os.makedirs(WDPA_country_folder, exist_ok=True)
-
-                    wdpa_url, source_month = retrieve_wdpa_url(country_code)
-                    download_unpack_zip(wdpa_url, WDPA_country_folder)
-                    gdb_folder = find_folder(WDPA_country_folder, file_ending='.gdb') #gdb means geodatabase
-                    convert_gdb_to_gpkg(gdb_folder, WDPA_country_folder, f'{country_code}_WDPA.gpkg')
-                    print(f'WDPA downloaded for {source_month}')
-
-                except Exception as e:
-                    logging.error(f'WDPA download and conversion failed: {e}')
-            else:
-                logging.info('folder with protected areas of country of study region already exists')
-                WDPA_country_folder = os.path.join(protected_areas_folder, f'WDPA_{country_code}')
-            
-            raw_protected_areas_filepath = os.path.join(WDPA_country_folder, f'{country_code}_WDPA.gpkg')
+            raw_protected_areas_filepath = ctx.datasets.wdpa_path(ctx.country_code)
 
         elif consider_protected_areas == 'file':
             logging.info("using local file for protected areas")
-            protected_areas_filename=config['protected_areas_filename']
-            raw_protected_areas_filepath = os.path.join(protected_areas_folder, protected_areas_filename)
+            protected_areas_filename=ctx.config['protected_areas_filename']
+            raw_protected_areas_filepath = os.path.join(ctx.data_path, 'protected_areas', protected_areas_filename)
 
         #clip to study region (WDPA or local file)
-        try:    
-            protected_areas_file = gpd.read_file(raw_protected_areas_filepath)
-            protected_areas_file = geopandas_clip_reproject(protected_areas_file, region, global_crs_obj)
+        protected_areas_cache_key = ctx.layer_cache.key('protected_areas', sources=[raw_protected_areas_filepath], geometry=ctx.region, params={'source': consider_protected_areas})
+        if not ctx.layer_cache.restore(protected_areas_cache_key, [protected_areas_filePath]): #process data if region or source changed
+            protected_areas_file = ctx.datasets.vector(raw_protected_areas_filepath)
+            protected_areas_file = geopandas_clip_reproject(protected_areas_file, ctx.region, ctx.global_crs_obj)
             if not protected_areas_file.empty:
                 protected_areas_file.to_file(protected_areas_filePath, driver='GPKG', encoding='utf-8')
             else:
                 logging.info("No protected areas found in the region. File not saved.")
-        except Exception as e:
-            logging.error(f"processing protected areas failed: {e}")
-    
-    else:
-        print(f"Protected areas file already exists for region.")
+            ctx.layer_cache.store(protected_areas_cache_key, 'protected_areas', [protected_areas_filePath])
+        else:
+            print(f"Protected areas file already exists for region.")
+
+
+def prep_forest_density(ctx):
+    """Forest density raster."""
+    # forest density (optional; raster clipped/reprojected if filename is provided)
+    if ctx.config.get('forest_density', 0) == 1:
+        forest_density_filename = ctx.config.get('forest_density_filename', 0)
+        print('\nprocessing forest density (raster)')
+        raw_forest_density_path = os.path.join(ctx.data_path, 'landcover', forest_density_filename)
+        if not os.path.exists(raw_forest_density_path):
+            logging.warning(f"Forest density raster not found: {rel_path(raw_forest_density_path)}")
+        else:
+            # clip and reproject to local CRS
+            with ctx.datasets.raster(raw_forest_density_path) as forest_density_src:
+                clip_raster(forest_density_src, ctx.region_name_clean, ctx.region, ctx.output_dir, 'forest_density', block_size=ctx.raster_block_size)
+
+
+def prep_wind_atlas(ctx):
+    """Global wind atlas."""
+    if ctx.config['wind_atlas'] == 1:
+        print('\nprocessing global wind atlas')
+        wind_raster_filePath = ctx.datasets.wind_atlas_path(ctx.country_code, height=100)
+
+        #clip raster
+        # clip_raster(wind_raster_filePath, region_name_clean, region, output_dir, 'wind')
+        #clip and reproject to local CRS (also saves file which is only clipped but not reprojected)
+        with ctx.datasets.raster(wind_raster_filePath) as wind_src:
+            clip_reproject_raster(wind_src, ctx.region_name_clean, ctx.region, 'wind', ctx.local_crs_obj, 'bilinear', 'float32', ctx.output_dir, block_size=ctx.raster_block_size)
+        #co-register raster to land cover
+        # wind_raster_clipped_reprojected_filePath = os.path.join(output_dir, f'wind_{region_name_clean}_{local_crs_tag}.tif')
+        # wind_raster_co_registered_filePath = os.path.join(output_dir, f'wind_{region_name_clean}_{local_crs_tag}_resampled.tif')
+        # co_register(wind_raster_clipped_reprojected_filePath, processed_landcover_filePath, 'nearest', wind_raster_co_registered_filePath, dtype='float32')
+
+
+def prep_solar_atlas(ctx):
+    """Global solar atlas."""
+    if ctx.config['solar_atlas'] == 1:
+        print('\nprocessing global solar atlas')
+        country_name_solar_atlas = ctx.config['country_name_solar_atlas']
+        solar_raster_filePath = ctx.datasets.solar_atlas_path(country_name_solar_atlas, ctx.config['solar_atlas_measure'])
+        #clip raster
+        # clip_raster(solar_raster_filePath, region_name_clean, region, output_dir, 'solar')
+        #clip and reproject to local CRS (also saves file which is only clipped but not reprojected)
+        with ctx.datasets.raster(solar_raster_filePath) as solar_src:
+            clip_reproject_raster(solar_src, ctx.region_name_clean, ctx.region, 'solar', ctx.local_crs_obj, 'bilinear', 'float32', ctx.output_dir, block_size=ctx.raster_block_size)
+        #co-register raster to land cover
+        # solar_raster_clipped_reprojected_filePath = os.path.join(output_dir, f'solar_{region_name_clean}_{local_crs_tag}.tif')
+        # solar_raster_co_registered_filePath = os.path.join(output_dir, f'solar_{region_name_clean}_{local_crs_tag}_resampled.tif')
+        # co_register(solar_raster_clipped_reprojected_filePath, processed_landcover_filePath, 'nearest', solar_raster_co_registered_filePath, dtype='float32')
+
+
+
+
+def prepare_region(region_gdf, config, config_advanced=None, region_name=None, datasets=None, aoi_path=None):
+    """
+    Preps all configured input layers of one study region and saves them in data/<region name>.
+
+    Parameters:
+        region_gdf (GeoDataFrame): Boundary of the study region (in EPSG:4326), e.g. from load_region().
+        config (dict): Main config.
+        config_advanced (dict, optional): Advanced data prep settings. Loaded from the configs folder if None.
+        region_name (str, optional): Name of the study region used for the output folder and filenames. Defaults to study_region_name of the config.
+        datasets (GlobalDatasets, optional): Global datasets shared between regions. A new registry is used (and closed) if None.
+        aoi_path (str, optional): GeoJSON file in EPSG:4326 used as area of interest for openeo (e.g. the custom study area file).
+                                  Defaults to the simplified region polygon saved in the output folder.
+
+    Returns:
+        dict: Wall time in seconds per stage (None for skipped stages).
+    """
+    start_time = time.time()
+
+    if config_advanced is None:
+        config_advanced = load_configs()[1]
+    region_name_clean = clean_region_name(region_name or config['study_region_name'])
+    own_datasets = datasets is None
+    if own_datasets:
+        datasets = GlobalDatasets(data_path, raw_data_cache_dir=config_advanced.get('raw_data_cache_dir'))
 
+    # Define output directories
+    output_dir = os.path.join(dirname, 'data', f'{region_name_clean}')
+    os.makedirs(output_dir, exist_ok=True)
 
-# forest density (optional; raster clipped/reprojected if filename is provided)
-if consider_forest_density == 1:
-    forest_density_filename = config.get('forest_density_filename', 0)
-    print('\nprocessing forest density (raster)')
-    raw_forest_density_path = os.path.join(data_path, 'landcover', forest_density_filename)
-    if not os.path.exists(raw_forest_density_path):
-        logging.warning(f"Forest density raster not found: {rel_path(raw_forest_density_path)}")
-    else:
-        # clip and reproject to local CRS
-        try:
-            clip_raster(raw_forest_density_path, region_name_clean, region, output_dir, 'forest_density')
-        except Exception as e:
-            logging.warning(f"Failed to clip/reproject forest density raster: {e}")
+    # log of this region (the handler is removed again when the region is done)
+    log_file_path = os.path.join(output_dir, "data-prep.log")
+    file_handler = logging.FileHandler(log_file_path, mode='w')
+    file_handler.setLevel(logging.DEBUG)  # file can record everything
+    file_handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    logging.getLogger().addHandler(file_handler)
 
+    try:
+        logging.info(f'\nPrepping {region_name_clean}...')
+        region = region_gdf.copy()
 
-#global wind atlas
-if consider_wind_atlas == 1:
-    print('\nprocessing global wind atlas')
-    wind_raster_filePath = os.path.join(wind_solar_atlas_folder, f'{country_code}_wind_speed_100.tif')
-    if not os.path.exists(wind_raster_filePath):
+        # simplify polygon of study area (openeo can only handle polygons up to a certain size)
         try:
-            download_global_wind_atlas(country_code=country_code, height=100, data_path=data_path) #global wind atlas apparently uses 3 letter ISO code
+            region["geometry"] = region["geometry"].simplify(config_advanced["study_area"]["tolerance"], preserve_topology=True)
         except Exception as e:
-            logging.error(f'global wind atlas download failed: {e}')
-    
-    else:
-        print(f"Global wind atlas data already downloaded")
-
-    #clip raster
-    # clip_raster(wind_raster_filePath, region_name_clean, region, output_dir, 'wind')
-    #clip and reproject to local CRS (also saves file which is only clipped but not reprojected)
-    clip_reproject_raster(wind_raster_filePath, region_name_clean, region, 'wind', local_crs_obj, 'bilinear', 'float32', output_dir)
-    #co-register raster to land cover
-    # wind_raster_clipped_reprojected_filePath = os.path.join(output_dir, f'wind_{region_name_clean}_{local_crs_tag}.tif')
-    # wind_raster_co_registered_filePath = os.path.join(output_dir, f'wind_{region_name_clean}_{local_crs_tag}_resampled.tif')
-    # co_register(wind_raster_clipped_reprojected_filePath, processed_landcover_filePath, 'nearest', wind_raster_co_registered_filePath, dtype='float32')
-
-
-
-#global solar atlas (no check whether file already exists)
-if consider_solar_atlas == 1:
-    print('\nprocessing global solar atlas')
-    country_name_solar_atlas = config['country_name_solar_atlas']
-    solar_atlas_folder_path = os.path.join(wind_solar_atlas_folder, f'{country_name_solar_atlas}_solar_atlas')
-
-    solar_atlas_data_exists = False
-    for root, dirs, files in os.walk(solar_atlas_folder_path):
-        if "PVOUT.tif" in files:
-            solar_atlas_data_exists = True
-            break  # Stop searching once found   
-
-    if solar_atlas_data_exists == False:        
-        solar_atlas_measure = config['solar_atlas_measure']  
-        solar_atlas_folder_name = download_global_solar_atlas(country_name=country_name_solar_atlas, data_path=data_path, measure = solar_atlas_measure)
+            logging.warning(f"Polygon of study could not be simplified: {e}")
+        region.to_file(os.path.join(output_dir, f'{region_name_clean}_EPSG4326.geojson'), driver='GeoJSON', encoding='utf-8')
+
+
+        # calculate UTM zone based on representative point of country 
+        representative_point = region.representative_point().iloc[0]
+        latitude, longitude = representative_point.y, representative_point.x
+        EPSG = int(32700 - round((45 + latitude) / 90, 0) * 100 + round((183 + longitude) / 6, 0))
+        #if EPSG was set manual in the beginning then use that one
+        CRS_manual = config['CRS_manual']  #if None use empty string
+        if CRS_manual:
+            local_crs_obj = CRS.from_user_input(CRS_manual)  # Accepts 'EPSG:3035', 'ESRI:102003', WKT, or PROJ strings
+            logging.info(f'Using manually set CRS: {local_crs_obj.to_string()}')
+        else:
+            local_crs_obj = CRS.from_user_input(EPSG)
+            logging.info(f'Local CRS to be used: {local_crs_obj.to_string()}')
+        print(local_crs_obj)
+
+        # Extract tag for filename, e.g., 'EPSG3035' or 'ESRI102003'
+        auth = local_crs_obj.to_authority()
+        local_crs_tag = ''.join(auth) if auth else local_crs_obj.to_string().replace(":", "_")
+        # Save the CRS object as a pickle file
+        with open(os.path.join(output_dir, f'{region_name_clean}_local_CRS.pkl'), 'wb') as file:
+            pickle.dump(local_crs_obj, file)
+
+        # reproject country to defined projected CRS
+        region.to_crs(local_crs_obj, inplace=True) 
+        region.to_file(os.path.join(output_dir, f'{region_name_clean}_{local_crs_tag}.geojson'), driver='GeoJSON', encoding='utf-8')
+
+        # set global CRS EPSG:4326
+        global_crs_obj = CRS.from_user_input('4326')
+        auth = global_crs_obj.to_authority()
+        global_crs_tag = ''.join(auth) if auth else global_crs_obj.to_string().replace(":", "_")
+        # Save the CRS object as a pickle file
+        with open(os.path.join(output_dir, f'{region_name_clean}_global_CRS.pkl'), 'wb') as file:
+            pickle.dump(global_crs_obj, file)
+
+        #calculate bounding box with BOUNDING_BOX_BUFFER (region needs to be in projected CRS so meters are the unit)
+        region_copy = region
+        region_copy['buffered']=region_copy.buffer(BOUNDING_BOX_BUFFER)
+        region_buffered_4000 = region_copy.buffer(4000) #have DEM larger than study area to account for Ruggedness Index calculation (convert to 4326 below)
+        # Convert buffered region back to EPSC 4326 to get bounding box latitude and longitude 
+        region_buffered_4326 = region_copy.set_geometry('buffered').to_crs(global_crs_obj)
+        region_buffered_4000 = region_buffered_4000.to_crs(global_crs_obj)
+        bounding_box = region_buffered_4326['buffered'].total_bounds 
+        logging.info(f"Bounding box in EPSG 4326: \nminx: {bounding_box[0]}, miny: {bounding_box[1]}, maxx: {bounding_box[2]}, maxy: {bounding_box[3]}")
+
+        # Convert region back to EPSC 4326 to trim raster files and clip polygons
+        region.to_crs(global_crs_obj, inplace=True) 
+
+        # everything the stages need about the region and the shared inputs
+        ctx = SimpleNamespace(
+            config=config,
+            config_advanced=config_advanced,
+            datasets=datasets,
+            # cache for preprocessed layers (shared between regions), keyed by source files, region geometry and parameters
+            layer_cache=LayerCache(config_advanced.get('layer_cache_dir') or os.path.join(dirname, 'data', '.layer_cache')),
+            data_path=data_path,
+            output_dir=output_dir,
+            OSM_output_dir=os.path.join(output_dir, 'OSM_Infrastructure'),
+            OSM_data_path=(os.path.join(data_path, 'OSM', config['OSM_folder_name']) if config['OSM_source'] == 'geofabrik'
+                           else os.path.join(data_path, 'OSM', config['OSM_pbf_filename']) if config['OSM_source'] == 'pbf' else None),
+            demRasterPath=os.path.join(data_path, 'DEM', config['DEM_filename']),
+            region_name_clean=region_name_clean,
+            country_code=config['country_code'],
+            region=region,
+            region_buffered_4000=region_buffered_4000,
+            bounding_box=bounding_box,
+            aoi_path=aoi_path,
+            local_crs_obj=local_crs_obj,
+            local_crs_tag=local_crs_tag,
+            global_crs_obj=global_crs_obj,
+            global_crs_tag=global_crs_tag,
+            #block size in pixels for windowed raster clipping and reprojection (None processes whole rasters in memory)
+            raster_block_size=config_advanced.get('raster_block_size'),
+        )
+
+        # download the enabled global datasets concurrently before the stages need them
+        datasets.prefetch(config, max_workers=config_advanced.get('download_workers', 4))
+
+        # run the stages; independent stages run concurrently if data_prep_workers > 1
+        stages = [
+            Stage('coastlines', lambda: prep_coastlines(ctx), outputs=['coastlines']),
+            Stage('osm', lambda: prep_osm(ctx), outputs=['osm']),
+            # on the exclusion grid the proximity stage needs the pixel size of the landcover
+            Stage('proximity', lambda: prep_proximity(ctx), inputs=['osm', 'coastlines'] + (['landcover'] if config_advanced.get('proximity_grid') else []), outputs=['proximity']),
+            Stage('additional_exclusion_polygons', lambda: prep_additional_exclusion_polygons(ctx), outputs=['additional_exclusion_polygons']),
+            Stage('additional_exclusion_rasters', lambda: prep_additional_exclusion_rasters(ctx), outputs=['additional_exclusion_rasters']),
+            Stage('population', lambda: prep_population(ctx), outputs=['population']),
+            Stage('landcover', lambda: prep_landcover(ctx), outputs=['landcover']),
+            Stage('DEM', lambda: prep_dem(ctx), outputs=['DEM', 'DEM_derivatives']),
+            Stage('protected_areas', lambda: prep_protected_areas(ctx), outputs=['protected_areas']),
+            Stage('forest_density', lambda: prep_forest_density(ctx), outputs=['forest_density']),
+            Stage('wind_atlas', lambda: prep_wind_atlas(ctx), outputs=['wind']),
+            Stage('solar_atlas', lambda: prep_solar_atlas(ctx), outputs=['solar']),
+        ]
+        stage_timings = run_stages(stages, max_workers=config_advanced.get('data_prep_workers', 1))
+        print_stage_timings(stage_timings)
+
+
+        print("\nDone!")
+
+        elapsed = time.time() - start_time
+        logging.info(f'elapsed seconds: {round(elapsed,2)}')
+        print(f'elapsed time: {elapsed}')
+
+    finally:
+        logging.getLogger().removeHandler(file_handler)
+        file_handler.close()
+        if own_datasets:
+            datasets.close()
+
+    # Print all error messages from the log file
+    with open(log_file_path, "r") as log_file:
+        content = log_file.read()
+        if "ERROR" in content:
+            print("\nErrors for following data:")
+            log_file.seek(0)
+            for line in log_file:
+                if "ERROR" in line:
+                    print(line.strip())
+
+    return stage_timings
+
+
+def prepare_regions(region_names, config, config_advanced=None):
+    """
+    Preps several study regions in one process. The global datasets are loaded once and reused for all regions.
+
+    Parameters:
+        region_names (list of str): Names of the study regions. With a dynamic custom study area filename the name fills "{region_name}",
+                                    otherwise it is looked up in GADM at GADM_level of the config (which must be > 0 for several names).
+        config (dict): Main config.
+        config_advanced (dict, optional): Advanced data prep settings. Loaded from the configs folder if None.
+
+    Returns:
+        dict: Region name -> wall time in seconds per stage (None for regions which failed).
+
+    Raises:
+        ValueError: If the names do not select different study areas (see validate_region_names).
+    """
+    if config_advanced is None:
+        config_advanced = load_configs()[1]
+    timings = {}
+    with GlobalDatasets(data_path, raw_data_cache_dir=config_advanced.get('raw_data_cache_dir')) as datasets:
+        validate_region_names(region_names, config, datasets)
+        for region_name in region_names:
+            print(f"\n----- {region_name} -----")
+            try:
+                region, aoi_path = load_region(config, region_name, gadm_region_name=region_name, datasets=datasets)
+                timings[region_name] = prepare_region(region, config, config_advanced, region_name=region_name, datasets=datasets, aoi_path=aoi_path)
+            except Exception as e:
+                logging.error(f"data prep of {region_name} failed: {e}")
+                timings[region_name] = None
+    return timings
+
+
+if __name__ == "__main__":
+    config, config_advanced = load_configs()
+    study_region_name = config['study_region_name'] # this defines the folder where the data is saved and the prefix in the files. 
+
+    #Initialize parser for command line arguments and define arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--region", default=clean_region_name(study_region_name), help="study region name")
+    parser.add_argument("--regions", nargs='+', help="names of several study regions which are prepped one after another in this process")
+    parser.add_argument("--method",default="manual", help="method to run the script, e.g., snakemake or manual")
+    args = parser.parse_args()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setLevel(logging.WARNING)  # terminal only shows WARNING and above
+    logging.basicConfig(
+        handlers=[stream_handler],
+        level=logging.INFO,  # minimum level for logger; handlers override this; each region adds a handler for its log file
+        format="%(levelname)s:%(name)s:%(message)s"
+        ) #source: https://stackoverflow.com/questions/13733552/logger-configuration-to-log-to-file-and-print-to-stdout
+
+    if args.regions:
+        print(f"Running {len(args.regions)} regions: {', '.join(args.regions)}")
+        prepare_regions(args.regions, config, config_advanced)
     else:
-        print(f"Global solar atlas data already downloaded")
-    
-    solar_raster_filePath = os.path.join(wind_solar_atlas_folder, solar_atlas_folder_path, os.listdir(solar_atlas_folder_path)[0], 'PVOUT.tif')
-    #clip raster
-    # clip_raster(solar_raster_filePath, region_name_clean, region, output_dir, 'solar')
-    #clip and reproject to local CRS (also saves file which is only clipped but not reprojected)
-    clip_reproject_raster(solar_raster_filePath, region_name_clean, region, 'solar', local_crs_obj, 'bilinear', 'float32', output_dir)
-    #co-register raster to land cover
-    # solar_raster_clipped_reprojected_filePath = os.path.join(output_dir, f'solar_{region_name_clean}_{local_crs_tag}.tif')
-    # solar_raster_co_registered_filePath = os.path.join(output_dir, f'solar_{region_name_clean}_{local_crs_tag}_resampled.tif')
-    # co_register(solar_raster_clipped_reprojected_filePath, processed_landcover_filePath, 'nearest', solar_raster_co_registered_filePath, dtype='float32')
-
-
-
-print("\nDone!")
-
-elapsed = time.time() - start_time
-logging.info(f'elapsed seconds: {round(elapsed,2)}')
-print(f'elapsed time: {elapsed}')
-
-# Print all error messages from the log file
-with open(log_file_path, "r") as log_file:
-    content = log_file.read()
-    if "ERROR" in content:
-        print("\nErrors for following data:")
-        log_file.seek(0)
-        for line in log_file:
-            if "ERROR" in line:
-                print(line.strip())
\ No newline at end of file
+        # If running via Snakemake, use the region name and folder name from command line arguments
+        if args.method == "snakemake":
+            region_name = args.region
+            print(region_name)
+            print(f"Running via snakemake - measures: region={clean_region_name(region_name)}")
+        else:
+            region_name = study_region_name
+            print(f"Running manually - measures: region={clean_region_name(region_name)}")
+        region, aoi_path = load_region(config, region_name)
+        prepare_region(region, config, config_advanced, region_name=region_name, aoi_path=aoi_path)
@@ -255,7 +255,8 @@ distributed_area = {}
 tech_grades = {}
 for tech in suitability_techs:
     # Utility scale area (with areas greater than the minimum size)
-    potential_filtered[tech] = area_filter(potential[tech], min_size_distributed)
+    potential_filtered[tech] = area_filter(potential[tech], min_size_distributed, tile_size=config_suitability.get('area_filter_tile_size'),
+                                           max_workers=config_suitability.get('area_filter_workers') or 1)
     # Small distributed areas
     distributed_area[tech] = diff(potential[tech], potential_filtered[tech])
 
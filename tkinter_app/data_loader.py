@@ -118,6 +118,12 @@ CONFIG_SECTION_DEFINITIONS: List[Dict[str, Any]] = [
             {"key": "country_code", "type": "string", "description": "Three-letter ISO code."},
             {"key": "scenario", "type": "string", "description": "Scenario tag for filenames."},
             {"key": "technology", "type": "string", "description": "Technology label for filenames."},
+            {"key": "exclusion_layer_cache", "type": "boolean", "description": "Reuse the exclusion masks of unchanged layers between scenarios."},
+            {"key": "exclusion_buffer_mode", "type": "string", "description": "Vector buffers: geometry or distance (distance fields)."},
+            {"key": "exclusion_max_distance", "type": "number", "description": "Distance mode: max. distance of features outside the region (m)."},
+            {"key": "exclusion_workers", "type": "number", "description": "Number of exclusion layers processed at the same time."},
+            {"key": "exclusion_tile_size", "type": "number", "description": "Optional tile size (px) for country-scale exclusion grids."},
+            {"key": "exclusion_tile_workers", "type": "number", "description": "Number of exclusion tiles processed at the same time."},
             {"key": "tech", "type": "string", "description": "Technology dataset key."},
             {"key": "tech_derate", "type": "number", "description": "Technology derate factor."},
             {"key": "model_areas_filename", "type": "string", "description": "Model areas filename."},
@@ -149,8 +155,9 @@ CONFIG_SECTION_DEFINITIONS: List[Dict[str, Any]] = [
         "displayName": "OSM Data",
         "description": "OpenStreetMap sources and layer toggles.",
         "parameters": [
-            {"key": "OSM_source", "type": "string", "description": "OSM source ('geofabrik' or 'overpass')."},
+            {"key": "OSM_source", "type": "string", "description": "OSM source ('geofabrik', 'overpass' or 'pbf')."},
             {"key": "OSM_folder_name", "type": "string", "description": "Geofabrik OSM folder name."},
+            {"key": "OSM_pbf_filename", "type": "string", "description": "Name of the local .osm.pbf extract."},
             {"key": "railways", "type": "boolean", "description": "Toggle railways OSM feature."},
             {"key": "roads", "type": "boolean", "description": "Toggle roads OSM feature."},
             {"key": "airports", "type": "boolean", "description": "Toggle airports OSM feature."},
@@ -201,6 +208,8 @@ CONFIG_SECTION_DEFINITIONS: List[Dict[str, Any]] = [
         "parameters": [
             {"key": "compute_substation_proximity", "type": "boolean", "description": "Compute substation proximity layer."},
             {"key": "compute_road_proximity", "type": "boolean", "description": "Compute road proximity layer."},
+            {"key": "compute_transmission_line_proximity", "type": "boolean", "description": "Compute transmission line proximity layer."},
+            {"key": "compute_coast_proximity", "type": "boolean", "description": "Compute coast proximity layer (needs coastlines)."},
             {"key": "compute_terrain_ruggedness", "type": "boolean", "description": "Compute terrain ruggedness layer."},
         ],
     },
@@ -274,6 +283,8 @@ CONFIG_SECTION_DEFINITIONS: List[Dict[str, Any]] = [
         "description": "Available area and cost tier settings.",
         "parameters": [
             {"key": "min_area_rg", "type": "number", "description": "Minimum area share per grade."},
+            {"key": "area_filter_tile_size", "type": "number", "description": "Optional tile size (px) of the area filter."},
+            {"key": "area_filter_workers", "type": "number", "description": "Number of area filter tiles labelled at the same time."},
             {"key": "tiers", "type": "array", "description": "Cost tier breakpoints."},
             {"key": "average_sub_dist", "type": "array", "description": "Average substation distance (m)."},
         ],
@@ -27,9 +27,12 @@ NUMERIC_FLAG_KEYS = {
     # Computation step toggles
     "compute_substation_proximity",
     "compute_road_proximity",
+    "compute_transmission_line_proximity",
+    "compute_coast_proximity",
     "compute_terrain_ruggedness",
     # Behavior flags
     "force_osm_download",
+    "exclusion_layer_cache",
     "heat_demand_constant",
 }
 
@@ -3,15 +3,21 @@ import geopandas as gpd
 import geonamescache
 import json
 import rasterio
+from rasterio.io import DatasetReader
+from rasterio.dtypes import typename_fwd, dtype_rev
 from rasterio.mask import mask
+from rasterio.features import geometry_mask, geometry_window
+from rasterio.windows import Window
+from rasterio.windows import transform as window_transform
 from shapely.geometry import mapping
+from shapely.affinity import affine_transform
+from shapely.ops import unary_union
+import shapely
 from unidecode import unidecode
 from rasterio.warp import calculate_default_transform, reproject, Resampling
 import numpy as np
 
-import zipfile
 import requests
-import io
 import fiona
 import urllib.parse
 from pyproj import CRS
@@ -20,9 +26,22 @@ import rasterstats
 from datetime import datetime, timedelta
 
 import logging
+from contextlib import contextmanager
+from xml.sax.saxutils import escape
 
+from utils.raster_io import raster_profile, create_raster
+from utils.download import download_file, download_and_extract_zip, DownloadError
 
-def download_worldpop(country_code: str, year: int, output_dir: str):
+
+# base URLs of the downloaded global datasets (can be passed to the download functions, e.g. to use a local mirror)
+WORLDPOP_BASE_URL = "https://data.worldpop.org/GIS/Population/Global_2015_2030"
+GOAS_WFS_URL = "https://geo.vliz.be/geoserver/MarineRegions/wfs"
+WDPA_BASE_URL = "https://d1gam3xoknrgr2.cloudfront.net/current"
+GWA_BASE_URL = "https://globalwindatlas.info/api/gis/country"
+GSA_BASE_URL = "https://api.globalsolaratlas.info/download"
+
+
+def download_worldpop(country_code: str, year: int, output_dir: str, base_url: str = WORLDPOP_BASE_URL):
     """
     Downloads WorldPop population data for a given country and year.
     
@@ -30,6 +49,7 @@ def download_worldpop(country_code: str, year: int, output_dir: str):
         country_code (str): ISO 3166-1 alpha-3 country code (e.g., "DEU", "KEN").
         year (int): Year of the population data (e.g., 2020).
         output_dir (str): Directory where the file will be saved.
+        base_url (str): Base URL of the WorldPop data (can be replaced e.g. by a local server).
     
     Returns:
         str: Path to the downloaded file if successful, None otherwise.
@@ -45,7 +65,7 @@ def download_worldpop(country_code: str, year: int, output_dir: str):
     data_type = "constrained"
     
     # Construct the URL
-    url = (f"https://data.worldpop.org/GIS/Population/Global_2015_2030/R{release}/"
+    url = (f"{base_url}/R{release}/"
            f"{year}/{country_upper}/v{version}/{resolution}/{data_type}/"
            f"{country_lower}_pop_{year}_CN_{resolution}_R{release}_v{version}.tif")
     
@@ -55,18 +75,9 @@ def download_worldpop(country_code: str, year: int, output_dir: str):
     output_path = os.path.join(output_dir, filename)
     
     try:
-        response = requests.get(url, timeout=300)
-        
-        if response.status_code == 200:
-            with open(output_path, "wb") as f:
-                f.write(response.content)
-            return output_path
-        else:
-            logging.error(f"Failed to download. HTTP status: {response.status_code}")
-            return None
-            
-    except requests.Timeout:
-        logging.error(f"Download timed out after 300 seconds for '{country_code}'.")
+        return download_file(url, output_path, timeout=300)
+    except DownloadError as e:
+        logging.error(f"Failed to download WorldPop data: {e}")
         return None
     except Exception as e:
         logging.error(f"Error downloading WorldPop data: {e}")
@@ -92,9 +103,11 @@ def get_country_bounds_from_code(country_code):
     return [bbox["minlng"], bbox["minlat"], bbox["maxlng"], bbox["maxlat"]]
 
 
-def goas_download(output_dir):
-    base_url = "https://geo.vliz.be/geoserver/MarineRegions/wfs"
-
+def goas_download(output_dir, base_url=GOAS_WFS_URL):
+    """
+    Downloads the global oceans and seas (GOAS) from the Marine Regions WFS and saves them as goas.gpkg in output_dir.
+    The GeoJSON response is streamed to disk and converted from there.
+    """
     # Parameters for WFS request - using GeoJSON output
     params = {
         'service': 'WFS',
@@ -105,17 +118,20 @@ def goas_download(output_dir):
         'outputFormat': 'application/json'
     }
 
-    response = requests.get(base_url, params=params, timeout=300)
-
-    if response.status_code == 200:
-        gdf = gpd.read_file(response.text)
-        gpkg_path = os.path.join(output_dir, "goas.gpkg")
-        gdf.to_file(gpkg_path, driver="GPKG")
-    else:
-        logging.error(f"GOAS download failed: {response.status_code}")
+    os.makedirs(output_dir, exist_ok=True)
+    json_path = os.path.join(output_dir, "goas.geojson")
+    try:
+        download_file(base_url, json_path, params=params, timeout=300)
+    except DownloadError as e:
+        logging.error(f"GOAS download failed: {e}")
+        return
+    gdf = gpd.read_file(json_path)
+    gpkg_path = os.path.join(output_dir, "goas.gpkg")
+    gdf.to_file(gpkg_path, driver="GPKG")
+    os.remove(json_path)
 
 
-def retrieve_wdpa_url(country_code):
+def retrieve_wdpa_url(country_code, base_url=WDPA_BASE_URL):
     """
     Attempts to locate the latest available WDPA zip file by checking
     the current month, previous month, and next month. Returns the
@@ -123,7 +139,7 @@ def retrieve_wdpa_url(country_code):
     """
 
     def check_file_exists(url):
-        response = requests.head(url)
+        response = requests.head(url, timeout=60)
         return response.status_code == 200
 
     # month formats: e.g., Jan2025
@@ -134,7 +150,7 @@ def retrieve_wdpa_url(country_code):
     ]
 
     for bYYYY in month_candidates:
-        url = f"https://d1gam3xoknrgr2.cloudfront.net/current/WDPA_WDOECM_{bYYYY}_Public_{country_code}.zip"
+        url = f"{base_url}/WDPA_WDOECM_{bYYYY}_Public_{country_code}.zip"
         if check_file_exists(url):
             logging.info(f"Found WDPA file for {bYYYY} from WDPA for {country_code}")
             return url, bYYYY
@@ -146,15 +162,12 @@ def retrieve_wdpa_url(country_code):
 
 #download WDPA functions
 def download_unpack_zip(url, output_dir):
-    response = requests.get(url)
-    # Check if the download was successful
-    if response.status_code == 200:
-        # Open the downloaded content as a zipfile
-        logging.info("Download complete, extracting files...")
-        with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-            z.extractall(path=output_dir)
-    else:
-        logging.error(f"WDPA file download failed: {response.status_code}")
+    # stream the zip file to output_dir and extract it there
+    try:
+        download_and_extract_zip(url, output_dir)
+        logging.info("Download complete, files extracted")
+    except DownloadError as e:
+        logging.error(f"WDPA file download failed: {e}")
 
 # Function to find the geodatabase folder
 def find_folder(directory, file_ending=None, string_in_name=None):
@@ -192,13 +205,13 @@ def save_richdem_file(richdem_file, base_dem_FilePath, outFilePath):
     # For the new file's profile, we start with the profile of the source
     profile = file_profile
 
-    profile.update(
+    profile = raster_profile(
+        profile,
         dtype=rasterio.int16,
         count=1,
-        compress='DEFLATE',
         nodata=richdem_file.no_data) 
     #save raster file
-    with rasterio.open(outFilePath, 'w', **profile) as dst:
+    with create_raster(outFilePath, profile) as dst:
         dst.write(richdem_file, 1)  #richdem_file.astype(rasterio.int16)
 
 
@@ -219,25 +232,163 @@ def geopandas_clip_reproject(geopandas_file, gdf, target_crs_obj):
     return geopandas_clipped
 
 
-def clip_raster(input_raster_path, region_name_clean, gdf, output_dir, data_name=None):
+def _split_geometry(geometry, max_vertices, depth=0):
+    """
+    Recursively splits a geometry into quadrants of its bounding box until each part has at most max_vertices vertices.
+    """
+    if depth == 0 and not geometry.is_valid:
+        geometry = shapely.make_valid(geometry)
+    if shapely.get_num_coordinates(geometry) <= max_vertices or depth >= 16:
+        return [geometry]
+    minx, miny, maxx, maxy = geometry.bounds
+    midx, midy = (minx + maxx) / 2, (miny + maxy) / 2
+    parts = []
+    for rect in [(minx, miny, midx, midy), (midx, miny, maxx, midy), (minx, midy, midx, maxy), (midx, midy, maxx, maxy)]:
+        # intersection instead of clip_by_rect, which may return invalid geometries (the parts are unioned again later)
+        part = geometry.intersection(shapely.box(*rect))
+        if geometry.geom_type in ('Polygon', 'MultiPolygon') and part.geom_type == 'GeometryCollection':
+            # drop lines and points where the polygon only touches the quadrant border
+            part = shapely.MultiPolygon([g for g in shapely.get_parts(part) if g.geom_type == 'Polygon'])
+        if not part.is_empty:
+            parts.extend(_split_geometry(part, max_vertices, depth + 1))
+    return parts
+
+
+def split_vector_file(input_path, output_path, max_vertices=5000):
+    """
+    One-time pre-split of a vector file with very large features (e.g. the ocean polygons of GOAS) into small parts.
+    The parts keep the attributes of their feature and are written to a GeoPackage with spatial index (R-tree),
+    so a bounding box read (see read_vector_bbox) only loads the parts close to the study region.
+
+    Parameters:
+    - input_path (str): Path to the vector file.
+    - output_path (str): Path of the GeoPackage with the split features.
+    - max_vertices (int): Maximum number of vertices of a part.
+    """
+    gdf = gpd.read_file(input_path)
+    gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+    parts = [_split_geometry(geometry, max_vertices) for geometry in gdf.geometry]
+    split_gdf = gpd.GeoDataFrame(
+        gdf.drop(columns=gdf.geometry.name).loc[gdf.index.repeat([len(p) for p in parts])].reset_index(drop=True),
+        geometry=[part for p in parts for part in p],
+        crs=gdf.crs)
+    # write to a temporary file first so an interrupted split does not leave an incomplete store behind
+    tmp_path = f'{output_path}.tmp.gpkg'
+    split_gdf.to_file(tmp_path, driver='GPKG', encoding='utf-8', SPATIAL_INDEX='YES')
+    os.replace(tmp_path, output_path)
+    logging.info(f'split {len(gdf)} features of {input_path} into {len(split_gdf)} parts')
+
+
+def read_vector_bbox(path, bbox, dissolve=False):
+    """
+    Reads only the features of a vector file which intersect a bounding box (uses the spatial index of the file)
+    and clips them to the bounding box.
+
+    Parameters:
+    - path (str): Path to the vector file.
+    - bbox (tuple): (minx, miny, maxx, maxy) in the CRS of the file.
+    - dissolve (bool): Merge parts with identical attributes again (for files written by split_vector_file).
+
+    Returns:
+    - GeoDataFrame with the clipped features.
+    """
+    bbox = tuple(float(b) for b in bbox)
+    gdf = gpd.read_file(path, bbox=bbox)
+    gdf = gdf.clip(bbox)
+    if dissolve and not gdf.empty:
+        attribute_columns = [c for c in gdf.columns if c != gdf.geometry.name]
+        if attribute_columns:
+            gdf = gdf.dissolve(by=attribute_columns, dropna=False, as_index=False)
+        else:
+            gdf = gdf.dissolve()
+    return gdf
+
+
+def block_windows(width, height, block_size):
+    """
+    Yields windows of at most block_size x block_size pixels which together cover a raster of the given size.
+
+    Parameters:
+    - width (int): Width of the raster in pixels.
+    - height (int): Height of the raster in pixels.
+    - block_size (int): Edge length of the blocks in pixels.
+    """
+    for row_off in range(0, height, block_size):
+        for col_off in range(0, width, block_size):
+            yield Window(col_off, row_off, min(block_size, width - col_off), min(block_size, height - row_off))
+
+
+def _clip_raster_blocks(src, shapes, output_path, block_size):
+    """
+    Clips an open raster to the given geometries block by block and writes the result to output_path.
+    Produces the same output as rasterio.mask.mask(..., crop=True) while only holding one block in memory.
+    """
+    crop_window = geometry_window(src, shapes)
+    crop_col_off, crop_row_off = int(crop_window.col_off), int(crop_window.row_off)
+    width, height = int(crop_window.width), int(crop_window.height)
+    crop_transform = src.window_transform(crop_window)
+    nodata = src.nodata if src.nodata is not None else 0
+
+    out_meta = src.meta.copy()
+    out_meta.update({
+        'height': height,
+        'width': width,
+        'transform': crop_transform
+    })
+
+    with create_raster(output_path, raster_profile(out_meta)) as dest:
+        for block in block_windows(width, height, block_size):
+            src_window = Window(crop_col_off + block.col_off, crop_row_off + block.row_off, block.width, block.height)
+            data = src.read(window=src_window)
+            # True for pixels outside of the geometries
+            outside = geometry_mask(shapes, out_shape=(block.height, block.width), transform=window_transform(block, crop_transform))
+            data[:, outside] = nodata
+            dest.write(data, window=block)
+
+
+@contextmanager
+def open_raster(raster):
+    """
+    Opens a raster path for reading. An already opened rasterio dataset is passed through and left open,
+    so callers can keep global rasters open across many regions.
+    """
+    if isinstance(raster, DatasetReader):
+        yield raster
+    else:
+        with rasterio.open(raster) as src:
+            yield src
+
+
+def clip_raster(input_raster_path, region_name_clean, gdf, output_dir, data_name=None, block_size=None):
     """
     Clips a raster to the geometry defined in a GeoDataFrame and saves the clipped raster.
 
     Parameters:
-    - input_raster_path (str): Path to the input raster file.
+    - input_raster_path (str or DatasetReader): Path to the input raster file or an opened rasterio dataset.
     - region_name_clean (str): Cleaned name of the region for filename purposes.
     - gdf (GeoDataFrame): GeoDataFrame containing the geometry to clip to.
     - output_dir (str): Directory to save the clipped raster.
+    - block_size (int, optional): If set, the raster is read, masked and written in blocks of block_size x block_size pixels 
+      so memory stays bounded for large rasters. If None, the whole clipped raster is held in memory.
 
     Returns:
     - None. Saves the clipped raster as a new GeoTIFF in the output directory.
     """
 
     #get the filename from file path and remove its extension
-    filename = os.path.basename(input_raster_path)
-    filename = os.path.splitext(filename)[0]
+    if data_name is None:
+        data_name = os.path.splitext(os.path.basename(input_raster_path if isinstance(input_raster_path, str) else input_raster_path.name))[0]
+
+    with open_raster(input_raster_path) as src:
+        ori_raster_crs = str(src.crs)
+        ori_raster_crs = ori_raster_crs.replace(":", "")
+        #print(f'original raster CRS: {src.crs}')
+        output_path = os.path.join(output_dir, f'{data_name}_{region_name_clean}_{ori_raster_crs}.tif')
+
+        if block_size:
+            _clip_raster_blocks(src, list(gdf.geometry.apply(mapping)), output_path, block_size)
+            return
 
-    with rasterio.open(input_raster_path) as src:
         # Mask the raster using the vector file's geometry
         out_image, out_transform = mask(src, gdf.geometry.apply(mapping), crop=True)
         # Copy the metadata from the source raster
@@ -249,32 +400,77 @@ def clip_raster(input_raster_path, region_name_clean, gdf, output_dir, data_name
             'transform': out_transform
         })
 
-        ori_raster_crs = str(src.crs)
-        ori_raster_crs = ori_raster_crs.replace(":", "")
-        #print(f'original raster CRS: {src.crs}')
         # Save the clipped raster as a new GeoTIFF file
-        if data_name is None:
-            with rasterio.open(os.path.join(output_dir, f'{filename}_{region_name_clean}_{ori_raster_crs}.tif'), 'w', **out_meta) as dest:
-                dest.write(out_image)
-        else:
-            with rasterio.open(os.path.join(output_dir, f'{data_name}_{region_name_clean}_{ori_raster_crs}.tif'), 'w', **out_meta) as dest:
-                dest.write(out_image)
+        with create_raster(output_path, raster_profile(out_meta)) as dest:
+            dest.write(out_image)
 
 
 
 
-def clip_reproject_raster(input_raster_path, region_name_clean, gdf, data_name, target_crs, resampling_method, dtype, output_dir):
+def _window_vrt(src, window):
+    """
+    Returns the XML of a VRT which shows a window of an open raster as a dataset of its own (same bands, dtype and nodata),
+    e.g. to warp only the window without writing it to a file first.
+    """
+    col_off, row_off, width, height = int(window.col_off), int(window.row_off), int(window.width), int(window.height)
+    t = src.window_transform(window)
+    bands = []
+    for i, dtype in enumerate(src.dtypes, start=1):
+        nodata = f'<NoDataValue>{src.nodata!r}</NoDataValue>' if src.nodata is not None else ''
+        bands.append(
+            f'<VRTRasterBand dataType="{typename_fwd[dtype_rev[dtype]]}" band="{i}">{nodata}<SimpleSource>'
+            f'<SourceFilename relativeToVRT="0">{escape(src.name)}</SourceFilename><SourceBand>{i}</SourceBand>'
+            f'<SrcRect xOff="{col_off}" yOff="{row_off}" xSize="{width}" ySize="{height}"/>'
+            f'<DstRect xOff="0" yOff="0" xSize="{width}" ySize="{height}"/></SimpleSource></VRTRasterBand>')
+    return (f'<VRTDataset rasterXSize="{width}" rasterYSize="{height}"><SRS>{escape(src.crs.to_wkt())}</SRS>'
+            f'<GeoTransform>{t.c!r}, {t.a!r}, {t.b!r}, {t.f!r}, {t.d!r}, {t.e!r}</GeoTransform>{"".join(bands)}</VRTDataset>')
+
+
+def _warp_to_file(src, output_path, kwargs, **warp_options):
+    """
+    Reprojects all bands of an open raster onto the grid described by kwargs (crs, transform, width, height, dtype) and writes them to output_path.
+    GDAL warps straight into the output file in chunks bounded by its warp memory limit, reading only the source pixels needed
+    for each chunk, so memory does not depend on the size of the raster.
+    Additional warp_options (e.g. CUTLINE) are passed on to the GDAL warper.
+    """
+    resampling = kwargs.pop('resampling')
+
+    with create_raster(output_path, raster_profile(kwargs)) as dst:
+        for i in range(1, src.count + 1):
+            reproject(
+                source=rasterio.band(src, i),
+                destination=rasterio.band(dst, i),
+                src_transform=src.transform,
+                src_crs=src.crs,
+                src_nodata=src.nodata,
+                dst_transform=kwargs['transform'],
+                dst_crs=kwargs['crs'],
+                dst_nodata=src.nodata,
+                resampling=resampling,
+                **warp_options)
+
+
+def clip_reproject_raster(input_raster_path, region_name_clean, gdf, data_name, target_crs, resampling_method, dtype, output_dir, block_size=None, write_geographic=True):
     """
         Reads a TIFF raster, clips it to the extent of a GeoPandas DataFrame, reprojects it to a given CRS considerung the set resampling method,
         and saves the clipped raster in a specified output folder.
     
-        :param input_raster_path: Path to the input TIFF raster file.
+        :param input_raster_path: Path to the input TIFF raster file or an opened rasterio dataset.
         :param region_name_clean: in main script cleaned region name
         :param gdf: The GeoPandas DataFrame to use for clipping the raster.
         :param data_name: string with "landcover" or "elevation" or "wind" or "solar" or any other name which specifies the data. 
         :param target_crs: The target CRS to reproject the raster to (e.g., 'EPSG:3035').
         :param resampling_method: resampling method to be used (string)
         :param output_dir: output directory (defined in main script)
+        :param block_size: optional edge length in pixels of the blocks in which the raster is clipped (read, masked and written).
+                           Peak memory is then bounded by the block size instead of the size of the region. None clips the whole raster at once.
+                           The warp is streamed by GDAL in both cases and gives the same output.
+        :param write_geographic: if True, the clipped raster is also saved in its original CRS (e.g. EPSG4326) and reprojected from that file.
+                                 If False, the raster is warped straight from the source through a cutline of the clipping geometry
+                                 and no intermediate file is written. Both produce the same raster in the target CRS for sources with a
+                                 nodata value. For sources without one, the clipped file fills the pixels outside of the geometry with 0
+                                 as valid value, which bilinear or mode resampling mixes into pixels at the edge of the geometry, while
+                                 the cutline leaves these source pixels out; only such edge pixels differ.
         """
     
     # get CRS tag as clean string
@@ -297,24 +493,39 @@ def clip_reproject_raster(input_raster_path, region_name_clean, gdf, data_name,
         'float64': rasterio.float64
     }
 
-    with rasterio.open(input_raster_path) as src:
-        # Mask the raster using the vector file's geometry
-        out_image, out_transform = mask(src, gdf.geometry.apply(mapping), crop=True)
-        # Copy the metadata from the source raster
-        out_meta = src.meta.copy()
-        # Update the metadata for the clipped raster
-        out_meta.update({
-            'height': out_image.shape[1],
-            'width': out_image.shape[2],
-            'transform': out_transform
-        })
-
+    # Create the output file path
+    output_path = os.path.join(output_dir, f'{data_name}_{region_name_clean}_{crs_tag}.tif')
+
+    if not write_geographic:
+        shapes = list(gdf.geometry.apply(mapping))
+        with open_raster(input_raster_path) as src:
+            # the source is read through a VRT of the window the clipped raster (rasterio.mask.mask(crop=True)) would have,
+            # so the target grid and GDAL's sampling of the source are exactly those of the path through the clipped file
+            crop_window = geometry_window(src, shapes)
+            with rasterio.open(_window_vrt(src, crop_window)) as crop:
+                transform, width, height = calculate_default_transform(
+                    crop.crs, target_crs, crop.width, crop.height, *crop.bounds)
+                kwargs = src.meta.copy()
+                kwargs.update({
+                    'crs': target_crs,
+                    'transform': transform,
+                    'width': width,
+                    'height': height,
+                    'dtype': dtype_options[dtype],
+                    'resampling': resampling_options[resampling_method]
+                })
+                # GDAL expects the cutline in pixel/line coordinates of the source raster
+                inverse = ~crop.transform
+                cutline = affine_transform(unary_union(gdf.geometry), [inverse.a, inverse.b, inverse.d, inverse.e, inverse.xoff, inverse.yoff])
+                _warp_to_file(crop, output_path, kwargs, CUTLINE=cutline.wkt)
+        return
+
+    # clip raster and save it in its original CRS
+    clip_raster(input_raster_path, region_name_clean, gdf, output_dir, data_name, block_size=block_size)
+
+    with open_raster(input_raster_path) as src:
         ori_raster_crs = str(src.crs)
         ori_raster_crs = ori_raster_crs.replace(":", "")
-        #print(f'original raster CRS: {src.crs}')
-        # Save the clipped raster as a new GeoTIFF file
-        with rasterio.open(os.path.join(output_dir, f'{data_name}_{region_name_clean}_{ori_raster_crs}.tif'), 'w', **out_meta) as dest:
-            dest.write(out_image)
 
     # reproject landcover raster to local UTM CRS
     with rasterio.open(os.path.join(output_dir, f'{data_name}_{region_name_clean}_{ori_raster_crs}.tif')) as src:
@@ -327,27 +538,14 @@ def clip_reproject_raster(input_raster_path, region_name_clean, gdf, data_name,
             'transform': transform, 
             'width': width,
             'height': height,
-            'dtype': dtype_options[dtype]
+            'dtype': dtype_options[dtype],
+            'resampling': resampling_options[resampling_method]
         })
 
-        
-        # Create the output file path
-        output_path = os.path.join(output_dir, f'{data_name}_{region_name_clean}_{crs_tag}.tif')
-
-
         # Reproject and save the raster
-        with rasterio.open(output_path, 'w', **kwargs, compress='DEFLATE') as dst:
-            for i in range(1, src.count + 1):
-                reproject(
-                    source=rasterio.band(src, i),
-                    destination=rasterio.band(dst, i),
-                    src_transform=src.transform,
-                    src_crs=src.crs,
-                    dst_transform=transform,
-                    dst_crs=target_crs,
-                    resampling=resampling_options[resampling_method])
-                
-            #print(f'reprojected raster CRS: {dst.crs}')
+        _warp_to_file(src, output_path, kwargs)
+            
+        #print(f'reprojected raster CRS: {dst.crs}')
     
 
 
@@ -389,7 +587,7 @@ def reproject_raster(input_raster_path, region_name_clean, target_crs, resamplin
 
 
         # Reproject and save the raster
-        with rasterio.open(output_path, 'w', **kwargs, compress='DEFLATE') as dst:
+        with create_raster(output_path, raster_profile(kwargs)) as dst:
             for i in range(1, src.count + 1):
                 reproject(
                     source=rasterio.band(src, i),
@@ -471,13 +669,13 @@ def co_register(infile, match, resampling_method, outfile, dtype): #source: http
             height=dst_height,
             dtype=dtype_options[dtype],
             count=1,
-            nodata=-9999,
-            compress='DEFLATE') 
+            nodata=-9999) 
+        dst_profile = raster_profile(dst_profile)
         
 
         #print("Coregistered to shape:", dst_height,dst_width,'\n Affine',dst_transform)
         # open output
-        with rasterio.open(outfile, "w", **dst_profile) as dst:
+        with create_raster(outfile, dst_profile) as dst:
             # iterate through bands and write using reproject function
             for i in range(1, src.count + 1):
                 reproject(
@@ -533,11 +731,11 @@ def create_north_facing_pixels(slopeFilePath, aspectFilePath, region_name_clean,
         condition = (slope > X) & ((aspect >= Y) | (aspect <= Z))
         result = np.where(condition, 1, 0) # Create a new raster with the filtered results
 
-        profile.update(dtype=rasterio.int16, count=1, nodata=0, compress='DEFLATE') # Update the profile for the output raster
+        profile = raster_profile(profile, dtype=rasterio.int16, count=1, nodata=0) # Update the profile for the output raster
 
         if result.sum() > 0:
             # Write the result to a new raster file
-            with rasterio.open(os.path.join(richdem_helper_dir, f'north_facing_{region_name_clean}_EPSG{EPSG_slope}{resampled}.tif'), 'w', **profile) as dst:
+            with create_raster(os.path.join(richdem_helper_dir, f'north_facing_{region_name_clean}_EPSG{EPSG_slope}{resampled}.tif'), profile) as dst:
                 dst.write(result.astype(rasterio.int16), 1)
         if result.sum() == 0:
             logging.info('no north-facing pixel exceeding threshold slope')
@@ -548,7 +746,7 @@ def create_north_facing_pixels(slopeFilePath, aspectFilePath, region_name_clean,
 
 
 #download global wind atlas
-def download_global_wind_atlas(country_code: str, height: int, data_path: str = None):
+def download_global_wind_atlas(country_code: str, height: int, data_path: str = None, base_url: str = GWA_BASE_URL):
     """
     Downloads wind speed data from the Global Wind Atlas API for a given country and height.
 
@@ -560,20 +758,16 @@ def download_global_wind_atlas(country_code: str, height: int, data_path: str =
     Returns:
         bool: True if successful, False otherwise.
     """
-    url = f"https://globalwindatlas.info/api/gis/country/{country_code}/wind-speed/{height}"
+    url = f"{base_url}/{country_code}/wind-speed/{height}"
     
     try:
         print(f"Downloading wind data for '{country_code}' from: {url}")
-        response = requests.get(url)
-        if response.ok:
-            filePath = os.path.join(data_path, 'global_solar_wind_atlas', f"{country_code}_wind_speed_{height}.tif")
-            with open(filePath, "wb") as f:
-                f.write(response.content)
-            #print(f"Downloaded to: {filePath}")
-            return True
-        else:
-            print(f"Failed to download. HTTP status: {response.status_code}")
-            return False
+        filePath = os.path.join(data_path, 'global_solar_wind_atlas', f"{country_code}_wind_speed_{height}.tif")
+        download_file(url, filePath)
+        return True
+    except DownloadError as e:
+        print(f"Failed to download: {e}")
+        return False
     except Exception as e:
         logging.error(f'global wind atlas download failed: {e}')
         return False
@@ -581,7 +775,7 @@ def download_global_wind_atlas(country_code: str, height: int, data_path: str =
 
 
 #download global solar atlas
-def download_global_solar_atlas(country_name: str, data_path: str, measure = 'LTAym_YearlyMonthlyTotals'):
+def download_global_solar_atlas(country_name: str, data_path: str, measure = 'LTAym_YearlyMonthlyTotals', base_url: str = GSA_BASE_URL):
     """
     Downloads and extracts the GIS data (GeoTIFF) ZIP file for the specified country from https://globalsolaratlas.info/download.
 
@@ -598,11 +792,11 @@ def download_global_solar_atlas(country_name: str, data_path: str, measure = 'LT
 
     # Construct the download URL
     # single country
-    url = f"https://api.globalsolaratlas.info/download/{encoded_country_name}/{country_name_with_hyphens}_GISdata_{measure}_GlobalSolarAtlas-v2_GEOTIFF.zip"
+    url = f"{base_url}/{encoded_country_name}/{country_name_with_hyphens}_GISdata_{measure}_GlobalSolarAtlas-v2_GEOTIFF.zip"
     timeout = 300 # 5 Minutes
     # or whole world
     if country_name=='world':
-        url = 'https://api.globalsolaratlas.info/download/World/World_GHI_GISdata_LTAy_AvgDailyTotals_GlobalSolarAtlas-v2_GEOTIFF.zip'
+        url = f'{base_url}/World/World_GHI_GISdata_LTAy_AvgDailyTotals_GlobalSolarAtlas-v2_GEOTIFF.zip'
         print("Attention: solar atlas whole world is a very big file! (ca. 350MB)")
         timeout = 900 # 15 Minutes
     print(f"Downloading solar data for '{country_name}' from: {url}")
@@ -613,23 +807,15 @@ def download_global_solar_atlas(country_name: str, data_path: str, measure = 'LT
     
     # download  
     try:
-        response = requests.get(url, timeout=timeout)  
-        if response.status_code == 200:
-            print("Download successful. Extracting files...")
-
-            with zipfile.ZipFile(io.BytesIO(response.content)) as zip_ref:
-                zip_ref.extractall(extract_folder)
-
-            #print(f"Files extracted to '{extract_folder}'")
-
-            # Assuming the zip contains a single folder (standard GSA structure)
-            folder_name = zip_ref.namelist()[0].split('/')[0]  # top-level folder name
-            return folder_name
-        else:
-            print(f"Failed to download data for '{country_name}'. Status code: {response.status_code}")
-            
-    except requests.Timeout:
-        logging.warning(f"Download solar atlas data timed out after {timeout} seconds for '{country_name}'.")
+        # streamed to extract_folder (resumed if interrupted) and extracted there
+        top_level_names = download_and_extract_zip(url, extract_folder, timeout=timeout)
+        print("Download successful. Files extracted.")
+
+        # Assuming the zip contains a single folder (standard GSA structure)
+        folder_name = top_level_names[0]  # top-level folder name
+        return folder_name
+    except DownloadError as e:
+        logging.warning(f"Download solar atlas data failed for '{country_name}': {e}")
         return None
     except Exception as e:
         logging.error(f"solar atlas download failed: {e}")
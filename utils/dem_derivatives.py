@@ -0,0 +1,172 @@
+"""
+Terrain derivatives of a DEM (slope, aspect, north-facing pixels, terrain ruggedness index) computed in one pass.
+
+The DEM is read once in tiles with a halo of neighbouring pixels, all derivatives of a tile are computed with
+vectorized kernels and written to their output files before the next tile is read, so memory is bounded by the tile
+size instead of the size of the DEM. The results match the previously used libraries:
+- slope and aspect as in richdem (Horn 1981; slope_degrees and aspect, 0 = north, clockwise, -1 = flat), saved as int16.
+  Cells on the raster edge and nodata cells are nodata; nodata neighbours are replaced by the value of the centre cell.
+- terrain ruggedness index as in xdem (Riley et al. 1999): square root of the sum of squared elevation differences
+  between the centre cell and all cells in the window. Cells with nodata in their window are nodata.
+"""
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from utils.data_preprocessing import block_windows
+from utils.raster_io import raster_profile, build_overviews
+
+
+SLOPE_ASPECT_NODATA = -9999
+TRI_NODATA = -99999
+
+
+def _read_with_halo(src, window, halo):
+    """
+    Reads a tile of band 1 with `halo` extra pixels on every side as float64.
+    Nodata cells and pixels outside of the raster are NaN.
+    """
+    col_off, row_off = window.col_off - halo, window.row_off - halo
+    width, height = window.width + 2 * halo, window.height + 2 * halo
+    # part of the padded window inside the raster
+    col_start, row_start = max(col_off, 0), max(row_off, 0)
+    col_stop, row_stop = min(col_off + width, src.width), min(row_off + height, src.height)
+
+    data = np.full((height, width), np.nan)
+    inner = src.read(1, window=Window(col_start, row_start, col_stop - col_start, row_stop - row_start)).astype(np.float64)
+    if src.nodata is not None:
+        inner[inner == src.nodata] = np.nan
+    data[row_start - row_off:row_stop - row_off, col_start - col_off:col_stop - col_off] = inner
+    return data
+
+
+def _shifted(z, halo, dy, dx):
+    """View of z shifted by (dy, dx) pixels, cropped to the tile without halo."""
+    height, width = z.shape[0] - 2 * halo, z.shape[1] - 2 * halo
+    return z[halo + dy:halo + dy + height, halo + dx:halo + dx + width]
+
+
+def horn_gradients(z, cellsize_x, cellsize_y):
+    """
+    Elevation gradients after Horn (1981) for the inner cells of z (z has a halo of one pixel).
+    NaN neighbours are replaced by the value of the centre cell.
+
+    Returns:
+        tuple: (dzdx, dzdy) arrays of the shape of z without halo.
+    """
+    centre = _shifted(z, 1, 0, 0)
+
+    def neighbour(dy, dx):
+        values = _shifted(z, 1, dy, dx)
+        return np.where(np.isnan(values), centre, values)
+
+    a, b, c = neighbour(-1, -1), neighbour(-1, 0), neighbour(-1, 1)
+    d, f = neighbour(0, -1), neighbour(0, 1)
+    g, h, i = neighbour(1, -1), neighbour(1, 0), neighbour(1, 1)
+    dzdx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * cellsize_x)
+    dzdy = ((g + 2 * h + i) - (a + 2 * b + c)) / (8 * cellsize_y)
+    return dzdx, dzdy
+
+
+def slope_degrees(dzdx, dzdy):
+    """Slope in degrees from the elevation gradients."""
+    return np.degrees(np.arctan(np.hypot(dzdx, dzdy)))
+
+
+def aspect_degrees(dzdx, dzdy):
+    """Aspect in degrees (0 = north, clockwise) from the elevation gradients; flat cells are -1."""
+    aspect = np.degrees(np.arctan2(dzdy, -dzdx))
+    aspect = np.where(aspect < 0, 90 - aspect, np.where(aspect > 90, 360 - aspect + 90, 90 - aspect))
+    return np.where((dzdx == 0) & (dzdy == 0), -1, aspect)
+
+
+def riley_tri(z, window_size):
+    """
+    Terrain ruggedness index after Riley et al. (1999) for the inner cells of z (z has a halo of window_size // 2 pixels).
+    Cells with a NaN in their window are NaN.
+    """
+    halo = window_size // 2
+    centre = _shifted(z, halo, 0, 0)
+    squared_sum = np.zeros_like(centre)
+    for dy in range(-halo, halo + 1):
+        for dx in range(-halo, halo + 1):
+            if dy or dx:
+                squared_sum += (_shifted(z, halo, dy, dx) - centre) ** 2  # NaN propagates
+    return np.sqrt(squared_sum)
+
+
+def _open_output(path, src, dtype, nodata):
+    return rasterio.open(path, 'w', **raster_profile(src.profile, dtype=dtype, count=1, nodata=nodata))
+
+
+def compute_slope_aspect(dem_path, slope_path, aspect_path=None, north_facing_path=None, north_facing_thresholds=None, tile_size=1024):
+    """
+    Computes slope, aspect and the north-facing mask of a DEM in a projected CRS in one tiled pass.
+
+    Parameters:
+        dem_path (str): Path to the DEM (projected CRS, units in meters).
+        slope_path (str): Output path of the slope in degrees (int16).
+        aspect_path (str, optional): Output path of the aspect in degrees (int16).
+        north_facing_path (str, optional): Output path of the north-facing mask (int16, 1 = north-facing, nodata 0).
+        north_facing_thresholds (tuple, optional): (X, Y, Z): pixels with slope > X and aspect >= Y or aspect <= Z are north-facing.
+        tile_size (int): Edge length of the tiles in pixels.
+
+    Returns:
+        int: Number of north-facing pixels (0 if north_facing_path is None).
+    """
+    north_facing_count = 0
+    with rasterio.open(dem_path) as src:
+        cellsize_x, cellsize_y = abs(src.transform.a), abs(src.transform.e)
+        outputs = {'slope': _open_output(slope_path, src, 'int16', SLOPE_ASPECT_NODATA)}
+        if aspect_path:
+            outputs['aspect'] = _open_output(aspect_path, src, 'int16', SLOPE_ASPECT_NODATA)
+        if north_facing_path:
+            outputs['north_facing'] = _open_output(north_facing_path, src, 'int16', 0)
+        try:
+            for window in block_windows(src.width, src.height, tile_size):
+                z = _read_with_halo(src, window, halo=1)
+                dzdx, dzdy = horn_gradients(z, cellsize_x, cellsize_y)
+
+                # nodata: cells without elevation and cells on the raster edge
+                invalid = np.isnan(_shifted(z, 1, 0, 0))
+                rows = np.arange(window.row_off, window.row_off + window.height)[:, None]
+                cols = np.arange(window.col_off, window.col_off + window.width)[None, :]
+                invalid |= (rows == 0) | (rows == src.height - 1) | (cols == 0) | (cols == src.width - 1)
+
+                # int16 like the files written for richdem (values are truncated)
+                slope = np.where(invalid, SLOPE_ASPECT_NODATA, slope_degrees(dzdx, dzdy)).astype(np.int16)
+                aspect = np.where(invalid, SLOPE_ASPECT_NODATA, aspect_degrees(dzdx, dzdy)).astype(np.int16)
+                outputs['slope'].write(slope, 1, window=window)
+                if aspect_path:
+                    outputs['aspect'].write(aspect, 1, window=window)
+                if north_facing_path:
+                    X, Y, Z = north_facing_thresholds
+                    north_facing = ~invalid & (slope > X) & ((aspect >= Y) | (aspect <= Z))
+                    north_facing_count += int(north_facing.sum())
+                    outputs['north_facing'].write(north_facing.astype(np.int16), 1, window=window)
+            for dst in outputs.values():
+                build_overviews(dst)
+        finally:
+            for dst in outputs.values():
+                dst.close()
+    return north_facing_count
+
+
+def compute_tri(dem_path, tri_path, window_size=9, tile_size=1024):
+    """
+    Computes the terrain ruggedness index of a DEM in one tiled pass and saves it rounded to integers (float32).
+
+    Parameters:
+        dem_path (str): Path to the DEM (projected CRS). Should be buffered, the outermost window_size // 2 pixels are nodata.
+        tri_path (str): Output path of the terrain ruggedness index.
+        window_size (int): Edge length of the window in pixels (odd).
+        tile_size (int): Edge length of the tiles in pixels.
+    """
+    with rasterio.open(dem_path) as src:
+        with _open_output(tri_path, src, 'float32', TRI_NODATA) as dst:
+            for window in block_windows(src.width, src.height, tile_size):
+                z = _read_with_halo(src, window, halo=window_size // 2)
+                tri = np.rint(riley_tri(z, window_size))
+                dst.write(np.where(np.isnan(tri), TRI_NODATA, tri).astype(np.float32), 1, window=window)
+            build_overviews(dst)
@@ -0,0 +1,161 @@
+"""
+Streaming downloads of the raw input data (WorldPop, WDPA, global wind and solar atlas, GOAS).
+
+Files are streamed to disk in chunks (<output>.part) instead of being held in memory. An interrupted download is resumed
+with an HTTP Range request on the next attempt, the result is validated against the expected size (Content-Length or
+given size) and only then renamed to its final path. A partial file is therefore never mistaken for a complete download.
+The sources publish no checksums; the SHA-256 of each download is recorded in the raw data manifest instead.
+
+The base URLs of the sources are defined in utils/data_preprocessing.py and can be passed to the download functions,
+e.g. to test against a local HTTP server.
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import zipfile
+import logging
+
+import requests
+
+
+CHUNK_SIZE = 256 * 1024  # bytes written per chunk; an interrupted download loses at most the unwritten chunk
+
+
+class DownloadError(Exception):
+    """Raised if a download fails or the downloaded file does not match the expected size."""
+
+
+def sha256_of_file(path: str) -> str:
+    """Returns the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _validate(path, expected_size=None):
+    size = os.path.getsize(path)
+    if expected_size is not None and size != expected_size:
+        raise DownloadError(f'{path}: size {size} bytes, expected {expected_size} bytes')
+
+
+def download_file(url, output_path, params=None, expected_size=None, timeout=300, retries=3, session=None):
+    """
+    Streams url to output_path, resuming an interrupted download and validating the result.
+
+    Parameters:
+        url (str): URL of the file.
+        output_path (str): Path of the downloaded file. If it exists and matches expected_size, nothing is downloaded.
+        params (dict, optional): Query parameters of the request.
+        expected_size (int, optional): Expected size in bytes. Defaults to the size announced by the server.
+        timeout (int): Timeout in seconds for connecting and for each read.
+        retries (int): Number of additional attempts after a failed attempt (each one resumes where the previous stopped).
+        session (requests.Session, optional): Session used for the requests.
+
+    Returns:
+        str: output_path
+
+    Raises:
+        DownloadError: If the download fails after all attempts or the file does not validate.
+    """
+    if os.path.exists(output_path):
+        if expected_size is None:
+            return output_path
+        try:
+            _validate(output_path, expected_size)
+            return output_path
+        except DownloadError as e:
+            logging.warning(f'{e}; downloading again')
+            os.remove(output_path)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    part_path = f'{output_path}.part'
+    http = session or requests
+
+    for attempt in range(retries + 1):
+        try:
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            with http.get(url, params=params, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416:
+                    # the part file is already complete (or larger than the file); start over if it does not validate
+                    response.close()
+                    try:
+                        _validate(part_path, expected_size)
+                        break
+                    except DownloadError:
+                        os.remove(part_path)
+                        continue
+                response.raise_for_status()
+                if response.status_code == 206:
+                    mode = 'ab'
+                    total = response.headers.get('Content-Range', '').rpartition('/')[2]
+                    total = int(total) if total.isdigit() else None
+                else:
+                    # server ignored the range request, download from the start
+                    mode = 'wb'
+                    offset = 0
+                    length = response.headers.get('Content-Length')
+                    total = int(length) if length and 'Content-Encoding' not in response.headers else None
+                if expected_size is None:
+                    expected_size = total
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+            if expected_size is not None and os.path.getsize(part_path) < expected_size:
+                raise DownloadError(f'{url}: connection closed after {os.path.getsize(part_path)} of {expected_size} bytes')
+            _validate(part_path, expected_size)
+            break
+        except (requests.RequestException, DownloadError) as e:
+            if isinstance(e, DownloadError) and os.path.exists(part_path) and expected_size is not None \
+                    and os.path.getsize(part_path) >= expected_size:
+                # complete but corrupt, resuming would not help
+                os.remove(part_path)
+            if attempt == retries:
+                raise DownloadError(f'download of {url} failed: {e}') from e
+            logging.warning(f'download of {url} interrupted ({e}), retrying')
+            time.sleep(min(2 ** attempt, 30))
+
+    os.replace(part_path, output_path)
+    return output_path
+
+
+def extract_zip(zip_path, output_dir, remove=True):
+    """
+    Extracts a zip file to output_dir without loading it into memory.
+
+    Parameters:
+        zip_path (str): Path to the zip file.
+        output_dir (str): Folder to extract to.
+        remove (bool): Delete the zip file after extraction.
+
+    Returns:
+        list of str: Names of the top-level entries of the zip file.
+    """
+    with zipfile.ZipFile(zip_path) as z:
+        names = z.namelist()
+        z.extractall(path=output_dir)
+    if remove:
+        os.remove(zip_path)
+    return list(dict.fromkeys(name.split('/')[0] for name in names))
+
+
+def download_and_extract_zip(url, output_dir, params=None, timeout=300, session=None):
+    """
+    Streams a zip file into output_dir, extracts it there and deletes the zip file.
+
+    Returns:
+        list of str: Names of the top-level entries of the zip file.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    zip_name = os.path.basename(requests.utils.urlparse(url).path) or 'download.zip'
+    zip_path = os.path.join(output_dir, zip_name)
+    download_file(url, zip_path, params=params, timeout=timeout, session=session)
+    try:
+        return extract_zip(zip_path, output_dir)
+    except zipfile.BadZipFile as e:
+        shutil.move(zip_path, f'{zip_path}.corrupt')
+        raise DownloadError(f'{url}: not a valid zip file ({e})') from e
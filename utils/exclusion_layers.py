@@ -0,0 +1,774 @@
+"""
+Exclusion engine: eligible area of a region on the exclusion grid, without atlite.
+
+ExclusionEngine takes the layer registrations of atlite.ExclusionContainer (add_raster(), add_geometry(), and
+add_landcover() for landcover classes with buffers), computes every layer as a bit-plane on the exclusion grid and
+combines them with bitwise ORs. Layers can be cached and processed in threads, and tiled_availability() computes
+country-scale grids tile by tile. compare_with_atlite() checks the result against atlite.gis.shape_availability.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import geopandas as gpd
+from pyproj import Transformer
+from affine import Affine
+from rasterio import open as open_raster
+from rasterio.crs import CRS
+from rasterio.io import DatasetReader
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window
+from rasterio.errors import WindowError
+from rasterio.features import geometry_mask, geometry_window
+from scipy.ndimage import distance_transform_cdt, distance_transform_edt
+from shapely.geometry import box
+
+from utils.data_preprocessing import block_windows
+from utils.layer_cache import file_fingerprint, geometry_fingerprint
+from utils.raster_io import raster_profile, create_raster
+from utils.proximity_calc import distance_array, exclusion_grid
+
+
+def exclusion_grid_of(geometry, res: float):
+    """Transform and shape of the exclusion grid of a region (GeoSeries in the CRS of the grid), as in atlite."""
+    transform, width, height = exclusion_grid(geometry, geometry.crs, res)
+    return transform, (height, width)
+
+
+def _source_fingerprint(source) -> str:
+    if isinstance(source, (gpd.GeoDataFrame, gpd.GeoSeries)):
+        return geometry_fingerprint(source)
+    if isinstance(source, DatasetReader):
+        source = source.name
+    return file_fingerprint(str(source))
+
+
+class ValueRange:
+    """
+    Codes of a raster layer selecting a range of values (also usable as callable codes of atlite.ExclusionContainer.add_raster).
+
+    Usage:
+        excluder.add_raster(slopeRasterPath, codes=ValueRange(min=15), crs=global_crs_obj)  # slope of 15 degrees or more
+        excluder.add_raster(windRasterPath, codes=ValueRange(4.5, 25, outside=True), crs=global_crs_obj)  # below 4.5 or above 25
+
+    Parameters:
+        min (float, optional): Lower bound, None for no lower bound.
+        max (float, optional): Upper bound, None for no upper bound.
+        include_min (bool): Whether values equal to min are in the range.
+        include_max (bool): Whether values equal to max are in the range.
+        outside (bool): Select the values below min or above max instead of the values within the range.
+                        NaN is never selected.
+    """
+
+    def __init__(self, min=None, max=None, include_min=True, include_max=True, outside=False):
+        self.min = min
+        self.max = max
+        self.include_min = include_min
+        self.include_max = include_max
+        self.outside = outside
+
+    def _params(self):
+        return (self.min, self.max, self.include_min, self.include_max, self.outside)
+
+    def __call__(self, values):
+        if self.outside:
+            selected = np.zeros(values.shape, dtype=bool)
+            if self.min is not None:
+                selected |= (values < self.min) if self.include_min else (values <= self.min)
+            if self.max is not None:
+                selected |= (values > self.max) if self.include_max else (values >= self.max)
+        else:
+            selected = np.ones(values.shape, dtype=bool)
+            if self.min is not None:
+                selected &= (values >= self.min) if self.include_min else (values > self.min)
+            if self.max is not None:
+                selected &= (values <= self.max) if self.include_max else (values < self.max)
+        return selected
+
+    def __eq__(self, other):
+        return isinstance(other, ValueRange) and self._params() == other._params()
+
+    def __hash__(self):
+        return hash(self._params())
+
+    def __repr__(self):
+        return (f"ValueRange(min={self.min!r}, max={self.max!r}, include_min={self.include_min}, "
+                f"include_max={self.include_max}, outside={self.outside})")
+
+
+def lookup_groups(values, groups):
+    """
+    Group index of every pixel of a class raster (e.g. landcover) from one lookup table pass.
+
+    Parameters:
+        values (numpy.ndarray): Class codes (also float, e.g. after warping; non-integer values and NaN are in no group).
+        groups (list of lists): Non-negative integer class codes of every group.
+
+    Returns:
+        numpy.ndarray: uint8 index of the group of each pixel (1 for the first group, 0 for classes in no group).
+    """
+    lut = np.zeros(int(max(code for codes in groups for code in codes)) + 2, dtype=np.uint8)  # last entry: no class code
+    for i, codes in enumerate(groups, start=1):
+        lut[np.asarray(codes, dtype=np.intp)] = i
+    index = np.full(values.shape, len(lut) - 1, dtype=np.intp)
+    valid = (values >= 0) & (values < len(lut) - 1) & (values == np.floor(values))
+    index[valid] = values[valid]
+    return lut[index]
+
+
+def select_codes(values, codes):
+    """
+    Pixels of a raster with one of the codes, same result as numpy.isin(values, codes). Non-negative integer codes
+    (e.g. a range of slopes) are selected with one lookup table pass instead of sorting the values.
+    """
+    code_list = [codes] if np.isscalar(codes) else list(codes)
+    if code_list and all(isinstance(code, (int, np.integer)) and 0 <= code < 2**16 for code in code_list):
+        return lookup_groups(values, [code_list]).astype(bool)
+    return np.isin(values, codes)
+
+
+def _layer_name(source) -> str:
+    return os.path.basename(str(source)) if isinstance(source, (str, os.PathLike)) else type(source).__name__
+
+
+def _open_raster(d: dict):
+    """Opens the raster of a layer and sets its CRS if the file has none (like ExclusionContainer.open_files)."""
+    raster = d['raster'] if isinstance(d['raster'], DatasetReader) else open_raster(d['raster'])
+    if raster.crs is None or not (raster.crs.is_geographic or raster.crs.is_projected):
+        if not d.get('crs'):
+            raise ValueError(f"CRS of {raster.name} is neither geographic nor projected, please provide it manually:\n{raster.crs}")
+        raster._crs = CRS.from_user_input(d['crs'])
+    return raster
+
+
+def buffer_mask(mask, buffer: float, res: float, buffer_geometry: str = 'diamond'):
+    """
+    Buffer around the True pixels of a mask like atlite.
+
+    'diamond' is atlite's binary dilation with int(buffer / res) + 1 iterations, i.e. all pixels within this taxicab
+    distance, computed with one distance transform instead of one pass per iteration. 'circular' uses the Euclidean distance.
+    """
+    if not mask.any():
+        return mask  # no distances to measure (the distance transforms would measure them to the border)
+    if buffer_geometry == 'circular':
+        return distance_transform_edt(~mask) <= buffer / res
+    return distance_transform_cdt(~mask, metric='taxicab') <= int(buffer / res) + 1
+
+
+def buffer_pixels(buffer: float, res: float, buffer_geometry: str = 'diamond') -> int:
+    """Number of pixels by which buffer_mask() grows a mask."""
+    if buffer_geometry == 'circular':
+        return int(buffer / res)
+    return int(buffer / res) + 1
+
+
+def source_pixels(transform, shape, crs, src_crs, src_transform, step: int = 16):
+    """
+    Row and column of the source pixel under every pixel centre of a grid (nearest neighbour).
+
+    The source coordinates are computed exactly on a lattice of every step-th pixel and interpolated linearly in
+    between. The lattice is anchored to the absolute pixel indices of grids aligned to multiples of their resolution
+    (like the exclusion grid), so a pixel gets the same source pixel in every tile of the grid. Other grids are
+    transformed pixel by pixel.
+    """
+    height, width = shape
+    col_offset, row_offset = transform.c / transform.a, transform.f / transform.e
+    if not (np.isclose(col_offset, round(col_offset), atol=1e-6) and np.isclose(row_offset, round(row_offset), atol=1e-6)):
+        step = 1
+        col_offset, row_offset = 0, 0
+        transform_of_index = transform
+    else:
+        col_offset, row_offset = int(round(col_offset)), int(round(row_offset))
+        transform_of_index = Affine(transform.a, 0, 0, 0, transform.e, 0)
+    cols = col_offset + np.arange(width)
+    rows = row_offset + np.arange(height)
+    node_cols = np.arange(cols[0] // step * step, cols[-1] + step, step)
+    node_rows = np.arange(rows[0] // step * step, rows[-1] + step, step)
+
+    # exact source pixel coordinates of the lattice
+    x, y = transform_of_index * np.meshgrid(node_cols + 0.5, node_rows + 0.5)
+    if CRS.from_user_input(crs) != CRS.from_user_input(src_crs):
+        x, y = Transformer.from_crs(crs, src_crs, always_xy=True).transform(x, y)
+    src_cols, src_rows = ~src_transform * (x, y)
+
+    # linear interpolation along the columns, then along the rows
+    def interpolate(values):
+        i, weight = np.divmod(cols - node_cols[0], step)
+        weight = weight / step
+        values = values[:, i] * (1 - weight) + values[:, np.minimum(i + 1, len(node_cols) - 1)] * weight
+        i, weight = np.divmod(rows - node_rows[0], step)
+        weight = (weight / step)[:, None]
+        return values[i] * (1 - weight) + values[np.minimum(i + 1, len(node_rows) - 1)] * weight
+
+    return np.floor(interpolate(src_rows)).astype(np.int32), np.floor(interpolate(src_cols)).astype(np.int32)
+
+
+def warp_to_grid(raster, geometry, transform, shape, crs, nodata=255, allow_no_overlap=False, pixels=None):
+    """
+    Values of a raster on a grid, nodata outside of the geometry (the values of atlite.gis.projected_mask).
+
+    As in atlite, the raster is cropped to the geometry (rasterio.mask.mask: pixels outside of the geometry and
+    nodata pixels are set to nodata) and every pixel takes the value of the source pixel under its centre. Only the
+    part of the crop under the grid is read and the source pixels are found with source_pixels() (or given as pixels),
+    so the value of a pixel does not depend on the extent of the grid (e.g. a tile of the exclusion grid), unlike
+    GDAL's warp. Integer rasters keep their dtype if the nodata value fits, all others are returned as float64.
+    """
+    if geometry.crs != raster.crs:
+        geometry = geometry.to_crs(raster.crs)
+    fill = np.nan if nodata is None else nodata
+    try:
+        crop = geometry_window(raster, geometry)
+    except WindowError:
+        if not allow_no_overlap:
+            raise ValueError('Input shapes do not overlap raster.')
+        return np.full(shape, fill)
+
+    rows, cols = pixels if pixels is not None else source_pixels(transform, shape, crs, raster.crs, raster.transform)
+    row0, col0, height, width = int(crop.row_off), int(crop.col_off), int(crop.height), int(crop.width)
+    outside = (rows < row0) | (rows >= row0 + height) | (cols < col0) | (cols >= col0 + width)
+    rows = np.clip(rows, row0, row0 + height - 1)
+    cols = np.clip(cols, col0, col0 + width - 1)
+
+    # part of the crop under the grid
+    row0, col0 = int(rows.min()), int(cols.min())
+    window = Window(col0, row0, int(cols.max()) - col0 + 1, int(rows.max()) - row0 + 1)
+    source = raster.read(1, window=window, masked=True)
+    source.mask = source.mask | geometry_mask(geometry, source.shape, raster.window_transform(window))
+    source = source.filled(nodata if nodata is not None else (raster.nodata if raster.nodata is not None else 0))
+
+    dtype = source.dtype
+    if not (dtype.kind in 'iu' and nodata is not None and np.can_cast(np.min_scalar_type(nodata), dtype)):
+        dtype = np.float64
+    values = source.astype(dtype, copy=False).ravel()[(rows - row0).astype(np.int64) * window.width + (cols - col0)]
+    values = values.reshape(shape)
+    values[outside] = fill
+    return values
+
+
+def pack(mask):
+    """Bit-plane of a boolean mask (rows packed to 8 pixels per byte)."""
+    return np.packbits(mask, axis=1)
+
+
+def unpack(bits, shape):
+    """Boolean mask of a bit-plane."""
+    return np.unpackbits(bits, axis=1, count=shape[1]).view(bool)
+
+
+class ExclusionEngine:
+    """
+    Exclusion layers of a technology and their eligible area on the exclusion grid of a region.
+
+    Usage:
+        excluder = ExclusionEngine(crs=local_crs_obj, res=res, cache_dir='data/Region/.exclusion_layer_cache')
+        excluder.add_landcover(landcoverPath, {50: 500, 70: 0}, crs=global_crs_obj)
+        excluder.add_raster(slopeRasterPath, codes=ValueRange(min=15), crs=global_crs_obj)
+        excluder.add_geometry(roadsPath, buffer=100)
+        masked, transform = excluder.shape_availability(region.geometry)
+
+    Parameters:
+        crs: CRS of the exclusion grid.
+        res (float): Resolution of the exclusion grid in CRS units.
+        cache_dir (str, optional): Folder of the cached masks. None computes all layers without caching.
+        buffer_mode (str): 'geometry' buffers the vector layers like atlite, 'distance' compares cached distance fields with the
+                           buffers (exact to about one pixel, other buffers of the same layer need no vector processing).
+        max_distance (float): Distance fields consider features up to this distance outside of the exclusion grid.
+                              Larger buffers are made geometrically.
+        max_workers (int): Number of layers processed at the same time (threads).
+    """
+
+    def __init__(self, crs=3035, res=100, cache_dir=None, buffer_mode='geometry', max_distance=10000, max_workers=1):
+        if buffer_mode not in ('geometry', 'distance'):
+            raise ValueError(f"Invalid buffer_mode: '{buffer_mode}'. Must be one of 'geometry' or 'distance'.")
+        self.crs = crs
+        self.res = res
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.buffer_mode = buffer_mode
+        self.max_distance = max_distance
+        self.max_workers = max_workers
+        self.rasters = []
+        self.geometries = []
+        self.landcover = []
+        self._distance_fields = {}  # key -> distance field, shared by the layers of one source
+        self._distance_locks = {}
+        self._warped = {}  # warp key -> values of rasters used by several layers and source pixels, during shape_availability()
+        self._warp_locks = {}
+        self._shared_warps = set()
+        self._lock = threading.Lock()
+        self.layer_stats = []  # (layer, cached, seconds) of the last shape_availability()
+
+    def add_raster(self, raster, codes=None, buffer=0, buffer_geometry='diamond', invert=False, nodata=255,
+                   allow_no_overlap=False, crs=None):
+        """
+        Registers a raster layer (same parameters as atlite.ExclusionContainer.add_raster).
+
+        Parameters:
+            raster (str/rasterio.DatasetReader): Raster or its path.
+            codes (int/list/ValueRange/callable): Values to exclude. None excludes all non-zero values.
+            buffer (float): Buffer around the excluded pixels in units of the engine CRS.
+            buffer_geometry (str): 'diamond' (atlite's binary dilation) or 'circular' (Euclidean distance).
+            invert (bool): Exclude the pixels which do not match the codes instead.
+            nodata (int): Value of pixels outside of the region. None uses the nodata value of the raster.
+            allow_no_overlap (bool): Allow that the raster does not overlap the region.
+            crs: CRS of the raster, if the file has none.
+        """
+        if buffer_geometry not in ('diamond', 'circular'):
+            raise ValueError(f"Invalid buffer_geometry: '{buffer_geometry}'. Must be one of 'diamond' or 'circular'.")
+        self.rasters.append({'raster': raster, 'codes': codes, 'buffer': buffer, 'buffer_geometry': buffer_geometry,
+                             'invert': invert, 'nodata': nodata, 'allow_no_overlap': allow_no_overlap, 'crs': crs})
+
+    def add_geometry(self, geometry, buffer=0, invert=False):
+        """
+        Registers a vector layer (same parameters as atlite.ExclusionContainer.add_geometry).
+
+        Parameters:
+            geometry (str/geopandas.GeoDataFrame/geopandas.GeoSeries): Features or the path of their file.
+            buffer (float): Buffer around the features in units of the engine CRS.
+            invert (bool): Exclude everything outside of the (buffered) features instead.
+        """
+        self.geometries.append({'geometry': geometry, 'buffer': buffer, 'invert': invert})
+
+    def add_landcover(self, raster, codes: dict, nodata=255, allow_no_overlap=False, crs=None):
+        """
+        Registers landcover classes to exclude, same result as add_raster(raster, codes=code, buffer=buffer) for every class.
+
+        Parameters:
+            raster (str/rasterio.DatasetReader): Landcover raster or its path.
+            codes (dict): Class code -> buffer around the class in units of the engine CRS (0 or None for no buffer).
+            nodata (int): Value of pixels outside of the region.
+            allow_no_overlap (bool): Allow that the raster does not overlap the region.
+            crs: CRS of the raster, if the file has none.
+        """
+        for code in codes:
+            if int(code) != code or code < 0:
+                raise ValueError(f'landcover codes need to be non-negative integers, got {code!r}')
+        self.landcover.append({'raster': raster, 'codes': dict(codes), 'nodata': nodata,
+                               'allow_no_overlap': allow_no_overlap, 'crs': crs})
+
+    def __getstate__(self):
+        # locks and per-run values are not passed to the worker processes of tiled_availability()
+        state = self.__dict__.copy()
+        for key in ('_lock', '_distance_locks', '_distance_fields', '_warped', '_warp_locks', '_shared_warps', 'layer_stats'):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._distance_locks = {}
+        self._distance_fields = {}
+        self._warped = {}
+        self._warp_locks = {}
+        self._shared_warps = set()
+        self.layer_stats = []
+
+    def __repr__(self):
+        return (f"ExclusionEngine\n registered rasters: {len(self.rasters)}\n registered landcover rasters: {len(self.landcover)}"
+                f"\n registered geometry collections: {len(self.geometries)}\n CRS: {self.crs} - Resolution: {self.res}")
+
+    def layer_key(self, kind: str, d: dict, grid_key: str):
+        """Key of the mask of a layer on a grid, or None if the layer cannot be keyed (callable codes other than ValueRange)."""
+        if callable(d.get('codes')) and not isinstance(d['codes'], ValueRange):
+            return None
+        source = d['raster'] if kind == 'raster' else d['geometry']
+        params = {k: (repr(v) if isinstance(v, range) else v) for k, v in d.items() if k not in ('raster', 'geometry')}
+        payload = json.dumps({'kind': kind, 'grid': grid_key, 'source': _source_fingerprint(source), 'params': params},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def _warp_key(d: dict):
+        source = d['raster'].name if isinstance(d['raster'], DatasetReader) else str(d['raster'])
+        return (source, d['nodata'], d['allow_no_overlap'], str(d['crs']))
+
+    def warped_values(self, d: dict, geometry, transform, shape):
+        """Values of a raster layer on the exclusion grid (nodata outside of the region), warped once per run if several layers use the raster."""
+        key = self._warp_key(d)
+        with self._lock:
+            shared = key in self._shared_warps
+            lock = self._warp_locks.setdefault(key, threading.Lock())
+        with lock:
+            if shared and key in self._warped:
+                return self._warped[key]
+            raster = _open_raster(d)
+            try:
+                values = warp_to_grid(raster, geometry, transform, shape, self.crs, d['nodata'], d['allow_no_overlap'],
+                                      self.source_pixels(raster, transform, shape))
+            finally:
+                if raster is not d['raster']:
+                    raster.close()
+            if shared:
+                self._warped[key] = values
+            return values
+
+    def source_pixels(self, raster, transform, shape):
+        """Source pixels of a raster under the pixels of a grid (source_pixels()), computed once per run for every source grid."""
+        key = ('source_pixels', raster.crs.to_wkt(), tuple(raster.transform)[:6])
+        with self._lock:
+            lock = self._warp_locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._warped:
+                self._warped[key] = source_pixels(transform, shape, self.crs, raster.crs, raster.transform)
+            return self._warped[key]
+
+    def raster_layer_mask(self, d: dict, geometry, transform, shape):
+        """Exclusion mask of a raster layer on the exclusion grid (True is excluded)."""
+        values = self.warped_values(d, geometry, transform, shape)
+        codes = d['codes']
+        if codes:
+            mask = codes(values).astype(bool) if callable(codes) else select_codes(values, codes)
+        else:
+            mask = values.astype(bool)
+        if d['invert']:
+            mask = ~mask
+        if d['buffer']:
+            mask = buffer_mask(mask, d['buffer'], self.res, d.get('buffer_geometry', 'diamond'))
+        return mask
+
+    def read_features(self, source, transform, shape, margin: float = 0):
+        """
+        Features of a vector layer in the engine CRS. Files are only read within margin around the grid (a tile of a
+        country-scale grid then only reads the features near it).
+        """
+        if isinstance(source, (gpd.GeoDataFrame, gpd.GeoSeries)):
+            return source.geometry.to_crs(self.crs)
+        left, top = transform * (0, 0)
+        right, bottom = transform * (shape[1], shape[0])
+        area = box(min(left, right) - margin, min(top, bottom) - margin, max(left, right) + margin, max(top, bottom) + margin)
+        # densified, so the bounding box in the CRS of the file covers the curved edges of the reprojected area
+        bbox = gpd.GeoSeries([area.segmentize(max(area.bounds[2] - area.bounds[0], area.bounds[3] - area.bounds[1]) / 16)], crs=self.crs)
+        return gpd.read_file(source, bbox=bbox).geometry.to_crs(self.crs)
+
+    def vector_layer_mask(self, d: dict, transform, shape):
+        """Exclusion mask of a vector layer on the exclusion grid (True is excluded)."""
+        geometry = self.read_features(d['geometry'], transform, shape, margin=abs(d['buffer']) + self.res)
+        geometry = geometry[geometry.notna() & ~geometry.is_empty]
+        if geometry.empty:
+            return np.full(shape, bool(d['invert']))
+        if d['buffer']:
+            geometry = geometry.buffer(d['buffer'])
+        return ~geometry_mask(geometry, shape, transform, invert=d['invert'])
+
+    def _load(self, key, shape):
+        path = os.path.join(self.cache_dir, f'{key}.bits.npy')
+        if not os.path.exists(path):
+            return None
+        try:
+            bits = np.load(path)
+        except (OSError, ValueError) as e:
+            logging.warning(f'cached exclusion mask {path} could not be read: {e}')
+            return None
+        return bits if bits.shape == (shape[0], (shape[1] + 7) // 8) else None
+
+    def _store(self, key, bits):
+        path = os.path.join(self.cache_dir, f'{key}.bits.npy')
+        # write to a temporary file first, parallel scenario runs may store the same mask
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, bits)
+        os.replace(tmp_path, path)
+
+    def uses_distance_field(self, kind: str, d: dict) -> bool:
+        """True if the buffer of a layer is taken from its distance field."""
+        return kind == 'geometry' and self.buffer_mode == 'distance' and 0 < d['buffer'] <= self.max_distance
+
+    def distance_field(self, d: dict, transform, shape, grid_key: str):
+        """Distance of every pixel of the exclusion grid to the nearest feature of a vector layer (inf if there is none)."""
+        payload = json.dumps({'grid': grid_key, 'source': _source_fingerprint(d['geometry']), 'max_distance': self.max_distance})
+        key = hashlib.sha256(payload.encode()).hexdigest()
+        with self._lock:
+            lock = self._distance_locks.setdefault(key, threading.Lock())
+        # layers of the same source in other threads wait for the field instead of computing it again
+        with lock:
+            if key in self._distance_fields:
+                return self._distance_fields[key]
+            t0 = time.time()
+            path = os.path.join(self.cache_dir, f'{key}.distance.npy') if self.cache_dir else None
+            cached = bool(path) and os.path.exists(path)
+            if cached:
+                field = np.load(path, mmap_mode='r')
+            else:
+                # padded grid, so features near the region count for the pixels at its border
+                pad = int(np.ceil(self.max_distance / self.res))
+                padded_transform = transform * Affine.translation(-pad, -pad)
+                geometry = self.read_features(d['geometry'], padded_transform, (shape[0] + 2 * pad, shape[1] + 2 * pad), margin=self.res)
+                field = distance_array(geometry, padded_transform, shape[1] + 2 * pad, shape[0] + 2 * pad)
+                if field is None:
+                    field = np.full(shape, np.inf, dtype=np.float32)
+                else:
+                    field = np.ascontiguousarray(field[pad:pad + shape[0], pad:pad + shape[1]])
+                if path:
+                    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                    with open(tmp_path, 'wb') as f:
+                        np.save(f, field)
+                    os.replace(tmp_path, path)
+            self._distance_fields[key] = field
+            self.layer_stats.append((f"{_layer_name(d['geometry'])} (distance)", cached, time.time() - t0))
+            return field
+
+    def layer_bits(self, kind: str, d: dict, geometry, transform, shape, grid_key: str):
+        """Bit-plane of the exclusion mask of a raster or vector layer, from the cache if possible."""
+        if self.uses_distance_field(kind, d):
+            mask = self.distance_field(d, transform, shape, grid_key) <= d['buffer']
+            return pack(~mask if d['invert'] else mask)
+
+        t0 = time.time()
+        key = self.layer_key(kind, d, grid_key) if self.cache_dir else None
+        bits = self._load(key, shape) if key else None
+        cached = bits is not None
+        if not cached:
+            mask = self.raster_layer_mask(d, geometry, transform, shape) if kind == 'raster' else self.vector_layer_mask(d, transform, shape)
+            bits = pack(mask)
+            if key:
+                self._store(key, bits)
+        self.layer_stats.append((_layer_name(d['raster'] if kind == 'raster' else d['geometry']), cached, time.time() - t0))
+        return bits
+
+    def landcover_bits(self, d: dict, geometry, transform, shape, grid_key: str):
+        """Bit-plane of the exclusion mask of the landcover classes of add_landcover(), with one cached mask per distinct buffer."""
+        groups = {}
+        for code, buffer in d['codes'].items():
+            groups.setdefault(buffer or 0, []).append(int(code))
+        buffers = sorted(groups)
+
+        exclusions = np.zeros((shape[0], (shape[1] + 7) // 8), dtype=np.uint8)
+        group_index = None  # landcover read, warped and looked up only if a group is not cached
+        for i, buffer in enumerate(buffers, start=1):
+            t0 = time.time()
+            # same key as an add_raster() layer with these codes and buffer
+            group = {**{k: v for k, v in d.items() if k != 'codes'}, 'codes': sorted(groups[buffer]), 'buffer': buffer,
+                     'buffer_geometry': 'diamond', 'invert': False}
+            key = self.layer_key('raster', group, grid_key) if self.cache_dir else None
+            bits = self._load(key, shape) if key else None
+            cached = bits is not None
+            if not cached:
+                if group_index is None:
+                    group_index = lookup_groups(self.warped_values(d, geometry, transform, shape), [groups[b] for b in buffers])
+                mask = group_index == i
+                if buffer:
+                    mask = buffer_mask(mask, buffer, self.res)
+                bits = pack(mask)
+                if key:
+                    self._store(key, bits)
+            self.layer_stats.append((f"{_layer_name(d['raster'])} {group['codes']} (buffer {buffer})", cached, time.time() - t0))
+            exclusions |= bits
+        return exclusions
+
+    def exclusion_bits(self, geometry, transform, shape):
+        """Bit-plane of all exclusions (outside of the geometry and all layers) on a grid."""
+        grid_key = json.dumps({'crs': CRS.from_user_input(self.crs).to_wkt(), 'transform': list(transform)[:6],
+                               'shape': list(shape), 'region': geometry_fingerprint(geometry)})
+        tasks = ([lambda d=d: self.landcover_bits(d, geometry, transform, shape, grid_key) for d in self.landcover]
+                 + [lambda d=d: self.layer_bits('raster', d, geometry, transform, shape, grid_key) for d in self.rasters]
+                 + [lambda d=d: self.layer_bits('geometry', d, geometry, transform, shape, grid_key) for d in self.geometries])
+
+        warp_keys = [self._warp_key(d) for d in self.landcover + self.rasters]
+        self._shared_warps = {key for key in warp_keys if warp_keys.count(key) > 1}
+        outside = geometry_mask(geometry, shape, transform)
+        if outside.all():
+            return pack(outside)  # e.g. a tile outside of the region
+        exclusions = pack(outside)
+        try:
+            if self.max_workers > 1:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    for bits in executor.map(lambda task: task(), tasks):
+                        exclusions |= bits
+            else:
+                for task in tasks:
+                    exclusions |= task()
+        finally:
+            self._warped.clear()
+        return exclusions
+
+    def shape_availability(self, geometry):
+        """
+        Eligible area in the geometry, the result of atlite.gis.shape_availability(geometry, excluder) (see compare_with_atlite()).
+
+        Parameters:
+            geometry (geopandas.GeoSeries): Region in the CRS of the engine.
+
+        Returns:
+            tuple: (mask with eligible pixels True, transform)
+        """
+        assert geometry.crs == self.crs
+        transform, shape = exclusion_grid_of(geometry, self.res)
+        self.layer_stats = []
+        exclusions = self.exclusion_bits(geometry, transform, shape)
+
+        n_cached = sum(cached for _, cached, _ in self.layer_stats)
+        print(f'exclusion layers: {n_cached} from cache, {len(self.layer_stats) - n_cached} computed')
+        for layer, cached, seconds in self.layer_stats:
+            logging.info(f"exclusion layer {layer}: {'cached' if cached else 'computed'} in {seconds:.2f} s")
+        return ~unpack(exclusions, shape), transform
+
+    def halo(self) -> int:
+        """Pixels by which the largest raster buffer grows an exclusion, the margin around the tiles of tiled_availability()."""
+        pixels = [0]
+        for d in self.landcover:
+            pixels += [buffer_pixels(buffer, self.res) for buffer in d['codes'].values() if buffer]
+        for d in self.rasters:
+            if d['buffer']:
+                pixels.append(buffer_pixels(d['buffer'], self.res, d['buffer_geometry']))
+        return max(pixels)
+
+    def tile_availability(self, geometry, transform, shape, window, halo: int):
+        """
+        Eligible pixels of one window of the exclusion grid, computed on the window plus halo.
+
+        Returns:
+            tuple: (window, bit-plane of the eligible pixels of the window, number of eligible pixels)
+        """
+        row0, col0 = max(window.row_off - halo, 0), max(window.col_off - halo, 0)
+        row1 = min(window.row_off + window.height + halo, shape[0])
+        col1 = min(window.col_off + window.width + halo, shape[1])
+        tile_transform = transform * Affine.translation(col0, row0)
+        tile_shape = (row1 - row0, col1 - col0)
+
+        # the whole region, so every pixel of the tile is computed exactly like without tiles
+        exclusions = unpack(self.exclusion_bits(geometry, tile_transform, tile_shape), tile_shape)
+        eligible = ~exclusions[window.row_off - row0:window.row_off - row0 + window.height,
+                               window.col_off - col0:window.col_off - col0 + window.width]
+        return window, pack(eligible), int(eligible.sum())
+
+    def tiled_availability(self, geometry, output_path: str, tile_size: int = 4096, max_workers: int = 1):
+        """
+        Eligible area in the geometry like shape_availability(), computed tile by tile and written to a GeoTIFF
+        (1 eligible, 0 excluded) without holding the whole grid in memory.
+
+        Parameters:
+            geometry (geopandas.GeoSeries): Region in the CRS of the engine.
+            output_path (str): Path of the GeoTIFF.
+            tile_size (int): Edge length of the tiles in pixels (without the halo of the largest raster buffer).
+            max_workers (int): Number of tiles processed at the same time (worker processes). Layers need to be given
+                               as file paths or GeoDataFrames.
+
+        Returns:
+            tuple: (number of eligible pixels, transform, shape)
+        """
+        assert geometry.crs == self.crs
+        t0 = time.time()
+        transform, shape = exclusion_grid_of(geometry, self.res)
+        halo = self.halo()
+        windows = list(block_windows(shape[1], shape[0], tile_size))
+        print(f'exclusion grid {shape[1]} x {shape[0]} px in {len(windows)} tiles of up to {tile_size} px (halo {halo} px)')
+
+        profile = raster_profile(dtype='uint8', nodata=0, width=shape[1], height=shape[0], count=1, crs=self.crs, transform=transform)
+        eligible_pixels = 0
+        with create_raster(output_path, profile) as dst:
+            def write(window, bits, count):
+                nonlocal eligible_pixels
+                dst.write(unpack(bits, (window.height, window.width)).astype(np.uint8), 1, window=window)
+                eligible_pixels += count
+
+            if max_workers > 1:
+                with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_tile_worker,
+                                         initargs=(self, geometry, transform, shape, halo)) as executor:
+                    # only a few tiles in flight, finished tiles are written right away
+                    pending = set()
+                    for window in windows:
+                        pending.add(executor.submit(_tile_worker, window))
+                        if len(pending) >= 2 * max_workers:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                write(*future.result())
+                    for future in pending:
+                        write(*future.result())
+            else:
+                for window in windows:
+                    write(*self.tile_availability(geometry, transform, shape, window, halo))
+        print(f'exclusion tiles done in {time.time() - t0:.1f} s')
+        return eligible_pixels, transform, shape
+
+    def to_atlite(self):
+        """
+        atlite.ExclusionContainer with the same layers (landcover classes as one raster layer each). Vector layers of
+        the distance buffer mode are buffered geometrically there.
+        """
+        import atlite  # only needed for the comparison
+
+        container = atlite.ExclusionContainer(crs=self.crs, res=self.res)
+        for d in self.landcover:
+            for code, buffer in d['codes'].items():
+                container.add_raster(d['raster'], codes=code, buffer=buffer or 0, nodata=d['nodata'],
+                                     allow_no_overlap=d['allow_no_overlap'], crs=d['crs'])
+        for d in self.rasters:
+            kwargs = {k: v for k, v in d.items() if k not in ('raster', 'buffer_geometry')}
+            if d['buffer_geometry'] != 'diamond':
+                kwargs['buffer_geometry'] = d['buffer_geometry']  # only in atlite versions with circular buffers
+            container.add_raster(d['raster'], **kwargs)
+        for d in self.geometries:
+            container.add_geometry(d['geometry'], buffer=d['buffer'], invert=d['invert'])
+        return container
+
+
+# engine and grid of the worker processes of ExclusionEngine.tiled_availability()
+_tile_job = None
+
+
+def _init_tile_worker(engine, geometry, transform, shape, halo):
+    global _tile_job
+    _tile_job = (engine, geometry, transform, shape, halo)
+
+
+def _tile_worker(window):
+    engine, geometry, transform, shape, halo = _tile_job
+    return engine.tile_availability(geometry, transform, shape, window, halo)
+
+
+def compare_tiled(engine: ExclusionEngine, geometry, tiled_path: str):
+    """
+    Compares the result of engine.tiled_availability(geometry, tiled_path, ...) with engine.shape_availability(geometry).
+    Both must be identical for any tile size.
+
+    Parameters:
+        engine (ExclusionEngine): Engine with the registered layers.
+        geometry (geopandas.GeoSeries): Region in the CRS of the engine.
+        tiled_path (str): GeoTIFF written by tiled_availability().
+
+    Returns:
+        int: Number of differing pixels.
+    """
+    available, transform = engine.shape_availability(geometry)
+    with open_raster(tiled_path) as src:
+        assert src.transform == transform and src.shape == available.shape
+        return int((src.read(1).astype(bool) != available).sum())
+
+
+def compare_with_atlite(engine: ExclusionEngine, geometry, available=None):
+    """
+    Computes the eligible area of the layers of an engine with atlite.gis.shape_availability and compares it.
+
+    Parameters:
+        engine (ExclusionEngine): Engine with the registered layers.
+        geometry (geopandas.GeoSeries): Region in the CRS of the engine.
+        available (numpy.ndarray, optional): Result of engine.shape_availability(geometry), computed if not given.
+
+    Returns:
+        dict: Number and share of differing pixels, eligible pixels of both and the run times in seconds.
+    """
+    from atlite.gis import shape_availability  # only needed for the comparison
+
+    t0 = time.time()
+    if available is None:
+        available, _ = engine.shape_availability(geometry)
+    engine_seconds = time.time() - t0
+    t0 = time.time()
+    available_atlite, _ = shape_availability(geometry, engine.to_atlite())
+    atlite_seconds = time.time() - t0
+    differing = int((available != available_atlite).sum())
+    return {
+        'differing_pixels': differing,
+        'differing_share': differing / available.size,
+        'eligible_pixels': int(available.sum()),
+        'eligible_pixels_atlite': int(available_atlite.sum()),
+        'seconds': engine_seconds,
+        'seconds_atlite': atlite_seconds,
+    }
@@ -8,14 +8,27 @@ separate GeoPackage (.gpkg) files per region and feature. Each geometry type is
 in its own file, named as <region>_<feature>_<geometry>.gpkg.
 
 The script also tracks unsupported geometry types and saves a JSON summary per feature/region.
+
+osm_features_to_gpkg() fetches all features of a region with one combined Overpass query and splits the response
+locally into the per-feature GeoPackages. Overpass responses and Nominatim lookups are cached on disk for a
+configurable time (TTL), so reruns do not query the servers again. For large regions the query can be split into
+tiles (fetch_overpass_tiled()): tiles are queried concurrently at a limited request rate, a tile which fails
+(timeout, server error) is split into quadrants and the elements of all tiles are merged without duplicates.
+The raw JSON elements are converted with overpass_elements_to_gdf(), which builds the geometries of nodes and ways
+in bulk with shapely's vectorized constructors and keeps the tags in one JSON column.
 """
 
-import os, time, json
+import os, re, time, json, gzip, hashlib, threading
 from typing import Optional
-from shapely.geometry import shape
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import shapely
+from shapely.geometry import shape, box
 import geopandas as gpd
+import requests
 from OSMPythonTools.nominatim import Nominatim
 from OSMPythonTools.overpass import overpassQueryBuilder, Overpass
+from OSMPythonTools.element import Element
 from utils.data_preprocessing import rel_path
 import yaml
 
@@ -28,6 +41,277 @@ osm_logger.setLevel(logging.CRITICAL)
 # Suppress pyogrio INFO logs
 logging.getLogger("pyogrio").setLevel(logging.WARNING)
 
+
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+
+# Expected geometries for each supported feature
+default_geometries = {
+    "substations": ["Polygon"],
+    "plants": ["Polygon"],
+    "generators": ["Point"],
+    "transmission_lines": ["LineString"],
+    "roads": ["LineString"],
+    "railways": ["LineString"],
+    "airports": ["Polygon"],
+    "waterbodies": ["LineString", "Polygon"],  # LineString for rivers, Polygon for lakes
+    "military": ["Polygon"],
+}
+
+
+def cached_json(cache_dir: Optional[str], namespace: str, key: str, ttl: float, fetch):
+    """
+    Returns the JSON-serializable result of fetch() and caches it on disk (gzipped JSON).
+
+    Args:
+        cache_dir (str): Cache folder. None disables the cache.
+        namespace (str): Subfolder of the cache (e.g. "overpass", "nominatim").
+        key (str): Text identifying the request (e.g. the query); its hash is the file name.
+        ttl (float): Time to live of cached results in seconds. 0 always calls fetch().
+        fetch (callable): Returns the result if it is not cached.
+    """
+    if cache_dir is None:
+        return fetch()
+    path = os.path.join(cache_dir, namespace, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json.gz")
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < ttl:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    result = fetch()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(result, f)
+    os.replace(tmp_path, path)
+    return result
+
+
+def geocode_area_id(region_name: str, cache_dir: Optional[str] = None, ttl: float = 0):
+    """Returns the Overpass area id of a region name from Nominatim (None if not found); found ids are cached."""
+    def fetch():
+        location = Nominatim().query(region_name)
+        area_id = location.areaId() if location else None
+        if area_id is None:
+            raise LookupError(region_name)
+        return area_id
+    try:
+        return cached_json(cache_dir, "nominatim", f"areaId:{region_name}", ttl, fetch)
+    except LookupError:
+        return None
+
+
+def query_overpass(query: str, timeout: int = 200, endpoint: str = OVERPASS_URL, cache_dir: Optional[str] = None, ttl: float = 0) -> dict:
+    """
+    Runs an Overpass QL query (without settings) and returns the JSON response, cached for ttl seconds.
+
+    Raises:
+        RuntimeError: If the response reports an error (e.g. a timeout on the server).
+    """
+    def fetch():
+        data = f"[out:json][timeout:{timeout}];{query}"
+        response = requests.post(endpoint, data={"data": data}, timeout=timeout + 60)
+        response.raise_for_status()
+        result = response.json()
+        remark = result.get("remark", "")
+        if "error" in remark or "timed out" in remark:
+            raise RuntimeError(f"Overpass query failed: {remark}")
+        return result
+    return cached_json(cache_dir, "overpass", f"{endpoint}\n{query}", ttl, fetch)
+
+
+def query_specs_of(feature_spec) -> list:
+    """Returns the list of [category, category_element, element_type] query specs of a feature."""
+    # e.g., [["waterway", "river", ["way", "relation"]], ["water", "lake", ["way", "relation"]]]
+    if isinstance(feature_spec[0], list):
+        return feature_spec
+    # Single query spec: [category, category_element, element_type]
+    return [feature_spec]
+
+
+def overpass_selector(category, category_element) -> list:
+    """Overpass tag selector of a query spec."""
+    if category_element is None or category_element == "":
+    # just require the key to exist
+        return [f'"{category}"']
+    elif isinstance(category_element, (list, tuple)):
+    # build a regex that matches any of the values in the list
+    # e.g. ["primary", "secondary"] → ^(primary|secondary)$
+        joined = "|".join(category_element)
+        return [f'"{category}"~"^({joined})$"']
+    else:
+    # single value → exact match
+        return [f'"{category}"="{category_element}"']
+
+
+def tags_match(tags: dict, category, category_element) -> bool:
+    """True if the tags of an element match the tag selector of a query spec (same semantics as overpass_selector)."""
+    if category not in tags:
+        return False
+    if category_element is None or category_element == "":
+        return True
+    if isinstance(category_element, (list, tuple)):
+        return re.search(f"^({'|'.join(category_element)})$", tags[category]) is not None
+    return tags[category] == str(category_element)
+
+
+def build_union_query(polygon: Optional[list], features_dict: dict, bbox: Optional[tuple] = None) -> str:
+    """
+    Builds one Overpass query returning the elements of all features in features_dict within the polygon
+    ([[lat, lon], ...]) or, if polygon is None, within bbox (minx, miny, maxx, maxy in degrees).
+    """
+    if polygon is not None:
+        search_polygon = '(poly:"' + ' '.join([f'{lat} {lon}' for [lat, lon] in polygon]) + '")'
+    else:
+        minx, miny, maxx, maxy = bbox
+        search_polygon = f'({miny},{minx},{maxy},{maxx})'
+    statements = []
+    for feature_spec in features_dict.values():
+        for category, category_element, element_type in query_specs_of(feature_spec):
+            element_types = element_type if isinstance(element_type, list) else [element_type]
+            selector = ''.join(f'[{s}]' for s in overpass_selector(category, category_element))
+            statements.extend(f'{e}{selector}{search_polygon};' for e in element_types)
+    # identical statements of different features are only queried once
+    return '(' + ''.join(dict.fromkeys(statements)) + '); out body geom;'
+
+
+def split_elements(elements: list, features_dict: dict) -> dict:
+    """Assigns raw Overpass elements to the features whose query specs they match. Returns feature key -> elements."""
+    matched = {feature_key: [] for feature_key in features_dict}
+    for element in elements:
+        tags = element.get('tags', {})
+        for feature_key, feature_spec in features_dict.items():
+            for category, category_element, element_type in query_specs_of(feature_spec):
+                element_types = element_type if isinstance(element_type, list) else [element_type]
+                if element['type'] in element_types and tags_match(tags, category, category_element):
+                    matched[feature_key].append(element)
+                    break
+    return matched
+
+class RateLimiter:
+    """Spaces the start of requests by at least min_interval seconds across all threads."""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.min_interval
+        time.sleep(start - now)
+
+    def pause(self, seconds: float):
+        """Delays all following requests (e.g. after HTTP 429 Too Many Requests)."""
+        with self._lock:
+            self._next_start = max(self._next_start, time.monotonic() + seconds)
+
+
+def region_tiles(region_geometry, tile_size: float) -> list:
+    """Bounding boxes (minx, miny, maxx, maxy) of a grid of tile_size degrees which intersect the region geometry."""
+    minx, miny, maxx, maxy = region_geometry.bounds
+    xs = np.arange(minx, maxx, tile_size)
+    ys = np.arange(miny, maxy, tile_size)
+    tiles = [(float(x), float(y), float(min(x + tile_size, maxx)), float(min(y + tile_size, maxy))) for y in ys for x in xs]
+    shapely.prepare(region_geometry)
+    return [tile for tile in tiles if region_geometry.intersects(box(*tile))]
+
+
+def split_tile(tile: tuple, region_geometry) -> list:
+    """Quadrants of a tile which intersect the region geometry."""
+    minx, miny, maxx, maxy = tile
+    midx, midy = (minx + maxx) / 2, (miny + maxy) / 2
+    quadrants = [(minx, miny, midx, midy), (midx, miny, maxx, midy), (minx, midy, midx, maxy), (midx, midy, maxx, maxy)]
+    return [quadrant for quadrant in quadrants if region_geometry.intersects(box(*quadrant))]
+
+
+def elements_in_region(elements: list, region_geometry) -> list:
+    """Keeps the elements whose bounding box intersects the region geometry (tiles are queried by bounding box)."""
+    if not elements:
+        return elements
+    bounds = np.array([
+        [e['bounds']['minlon'], e['bounds']['minlat'], e['bounds']['maxlon'], e['bounds']['maxlat']] if 'bounds' in e
+        else [e.get('lon', np.nan), e.get('lat', np.nan), e.get('lon', np.nan), e.get('lat', np.nan)]
+        for e in elements])
+    keep = shapely.intersects(shapely.box(bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3]), region_geometry)
+    return [element for element, k in zip(elements, keep) if k]
+
+
+def fetch_overpass_tiled(
+    region_geometry,
+    features_dict: dict,
+    tile_size: float = 1.0,
+    max_split_depth: int = 3,
+    max_workers: int = 2,
+    min_interval: float = 1.0,
+    timeout: int = 200,
+    endpoint: str = OVERPASS_URL,
+    cache_dir: Optional[str] = None,
+    cache_ttl: float = 0,
+    max_rate_limit_retries: int = 5,
+) -> list:
+    """
+    Fetch the elements of all features in features_dict within a region by querying tiles of its bounding box.
+
+    Tiles are queried concurrently by a pool of max_workers threads with at least min_interval seconds between
+    request starts. A tile which fails (timeout, server error) is split into four quadrants which are queried
+    instead, up to max_split_depth times. A tile answered with HTTP 429 (Too Many Requests) pauses all requests
+    and is queried again. Elements found in several tiles are merged by (type, id).
+
+    Args:
+        region_geometry (shapely geometry): Region in EPSG:4326.
+        features_dict (dict): A dictionary mapping feature keys to [category, category_element, element_type].
+        tile_size (float): Edge length of the initial tiles in degrees.
+        max_split_depth (int): How often a failing tile is split before the fetch fails.
+        max_workers (int): Number of concurrent requests.
+        min_interval (float): Minimum time in seconds between the start of two requests.
+        timeout (int): Timeout for each Overpass query in seconds.
+        endpoint (str): URL of the Overpass interpreter.
+        cache_dir (str): Folder for cached tile responses. None disables the cache.
+        cache_ttl (float): Time in seconds after which cached responses are fetched again.
+        max_rate_limit_retries (int): How often a tile is queried again after HTTP 429.
+
+    Returns:
+        list: Raw Overpass elements (dicts) intersecting the region.
+
+    Raises:
+        RuntimeError: If a tile still fails at max_split_depth.
+    """
+    limiter = RateLimiter(min_interval)
+
+    def fetch_tile(tile, depth):
+        query = build_union_query(None, features_dict, bbox=tile)
+        for attempt in range(max_rate_limit_retries + 1):
+            limiter.wait()
+            try:
+                return query_overpass(query, timeout=timeout, endpoint=endpoint, cache_dir=cache_dir, ttl=cache_ttl)['elements'], []
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code != 429 or attempt == max_rate_limit_retries:
+                    error = e
+                    break
+                retry_after = e.response.headers.get('Retry-After', '')
+                limiter.pause(float(retry_after) if retry_after.isdigit() else 10 * (attempt + 1))
+            except (requests.RequestException, RuntimeError, ValueError) as e:
+                error = e
+                break
+        if depth >= max_split_depth:
+            raise RuntimeError(f"Overpass query of tile {tile} failed: {error}")
+        logging.info(f"Overpass query of tile {tile} failed ({error}), splitting it")
+        return [], [(quadrant, depth + 1) for quadrant in split_tile(tile, region_geometry)]
+
+    elements = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(fetch_tile, tile, 0) for tile in region_tiles(region_geometry, tile_size)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                tile_elements, subtiles = future.result()
+                for element in tile_elements:
+                    # elements crossing tile borders are returned by several tiles
+                    elements.setdefault((element['type'], element['id']), element)
+                pending |= {executor.submit(fetch_tile, subtile, depth) for subtile, depth in subtiles}
+    return elements_in_region(list(elements.values()), region_geometry)
+
+
 def osm_to_gpkg(
     region_name: str,
     polygon: list,
@@ -56,15 +340,8 @@ def osm_to_gpkg(
     if feature_key not in features_dict:
         raise ValueError(f"'{feature_key}' not found in features_dict.")
 
-    feature_spec = features_dict[feature_key]
-    
     # Check if this is a multi-query feature (list of queries)
-    # e.g., [["waterway", "river", ["way", "relation"]], ["water", "lake", ["way", "relation"]]]
-    if isinstance(feature_spec[0], list):
-        query_specs = feature_spec
-    else:
-        # Single query spec: [category, category_element, element_type]
-        query_specs = [feature_spec]
+    query_specs = query_specs_of(features_dict[feature_key])
 
     start_time = time.time()
     os.makedirs(output_dir, exist_ok=True)
@@ -87,18 +364,7 @@ def osm_to_gpkg(
     # Process each query specification
     for query_spec in query_specs:
         category, category_element, element_type = query_spec
-
-        if category_element is None or category_element == "":
-        # just require the key to exist
-            selector = [f'"{category}"']
-        elif isinstance(category_element, (list, tuple)):
-        # build a regex that matches any of the values in the list
-        # e.g. ["primary", "secondary"] → ^(primary|secondary)$
-            joined = "|".join(category_element)
-            selector = [f'"{category}"~"^({joined})$"']
-        else:
-        # single value → exact match
-            selector = [f'"{category}"="{category_element}"']
+        selector = overpass_selector(category, category_element)
 
         # some spatial elements like airports or waterbodies can be represented as both ways and relations
         element_types = element_type if isinstance(element_type, list) else [element_type]
@@ -117,27 +383,31 @@ def osm_to_gpkg(
     if not all_elements:
         print(f"No elements found for {feature_key} in {region_name}")
         return {}
-    
 
-    # Expected geometries for each supported feature
-    default_geometries = {
-        "substations": ["Polygon"],
-        "plants": ["Polygon"],
-        "generators": ["Point"],
-        "transmission_lines": ["LineString"],
-        "roads": ["LineString"],
-        "railways": ["LineString"],
-        "airports": ["Polygon"],
-        "waterbodies": ["LineString", "Polygon"],  # LineString for rivers, Polygon for lakes
-        "military": ["Polygon"],
-    }
+    unsupported_counts = elements_to_gpkg(all_elements, feature_key, output_dir, EPSG, relevant_geometries_override)
 
-    relevant_geometries = (
+    #print(f"✅ Finished '{feature_key}' for {region_name} in {time.time() - start_time:.2f} seconds.")
+    return unsupported_counts
+
+
+def relevant_geometries_of(feature_key: str, relevant_geometries_override: Optional[dict] = None) -> list:
+    """Geometry types which are saved for a feature."""
+    return (
         relevant_geometries_override[feature_key]
         if relevant_geometries_override and feature_key in relevant_geometries_override
         else default_geometries.get(feature_key, ["Point", "LineString", "Polygon"])
     )
 
+
+def elements_to_gpkg(all_elements: list, feature_key: str, output_dir: str, EPSG: Optional[int] = 4326, relevant_geometries_override: Optional[dict] = None) -> dict:
+    """
+    Converts OSMPythonTools elements of a feature to geometries and saves them to <output_dir>/<feature_key>.gpkg.
+
+    Returns:
+        dict: A dictionary of unsupported geometry types and their counts.
+    """
+    relevant_geometries = relevant_geometries_of(feature_key, relevant_geometries_override)
+
     geoms_dict = {g: [] for g in relevant_geometries}  # Store features by geometry type
     unsupported_counts = {}  # Track unsupported geometry types
     seen_ids = set()  # Track seen element IDs to avoid duplicates across queries
@@ -201,10 +471,207 @@ def osm_to_gpkg(
         count_str = ", ".join([f"{count} {geom_type}(s)" for geom_type, count in geom_counts.items()])
         print(f"Saved {len(gdf)} features to {rel_path(gpkg_path)} ({count_str})")
 
-    #print(f"✅ Finished '{feature_key}' for {region_name} in {time.time() - start_time:.2f} seconds.")
     return unsupported_counts
 
 
+def osm_features_to_gpkg(
+    region_name: str,
+    polygon: list,
+    features_dict: dict,
+    output_dir: str = "OSM_Infrastructure",
+    EPSG: Optional[int] = 4326,
+    timeout: Optional[int] = 200,
+    relevant_geometries_override: Optional[dict] = None,
+    endpoint: str = OVERPASS_URL,
+    cache_dir: Optional[str] = None,
+    cache_ttl: float = 7 * 24 * 3600,
+    region_geometry=None,
+    tile_size: Optional[float] = None,
+    tile_options: Optional[dict] = None,
+    promoted_tags=("name",),
+):
+    """
+    Fetch all features of features_dict for a region with one combined Overpass query and save one GeoPackage per feature.
+
+    Args:
+        region_name (str): Name of the region to query (e.g., "Inner Mongolia").
+        polygon (list): Polygon of the region as [[lat, lon], ...]. Not used if tile_size is given.
+        features_dict (dict): A dictionary mapping feature keys to [category, category_element, element_type].
+        output_dir (str): Directory where the GeoPackage files will be saved.
+        EPSG (str): EPSG code for the coordinate reference system (default is "EPSG:4326").
+        timeout (int): Optional timeout for the Overpass query (default is 200 seconds).
+        relevant_geometries_override (dict): Optional dict mapping feature_key to list of geometries.
+        endpoint (str): URL of the Overpass interpreter.
+        cache_dir (str): Folder for cached Overpass responses and Nominatim lookups. None disables the cache.
+        cache_ttl (float): Time in seconds after which cached responses are fetched again (0 always fetches).
+        region_geometry (shapely geometry): Region in EPSG:4326, needed if tile_size is given.
+        tile_size (float): If given, the region is queried in tiles of this size in degrees (see fetch_overpass_tiled).
+        tile_options (dict): Further arguments of fetch_overpass_tiled (max_split_depth, max_workers, min_interval).
+        promoted_tags (iterable): Tag keys saved as separate columns besides the selector keys of each feature; all tags are in the JSON column 'tags'.
+
+    Returns:
+        dict: Feature key -> dictionary of unsupported geometry types and their counts.
+    """
+    if not features_dict:
+        return {}
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Geocode region to check that it exists (cached)
+    if geocode_area_id(region_name, cache_dir, cache_ttl) is None:
+        print(f"Region '{region_name}' not found.")
+        return {}
+
+    if tile_size:
+        all_elements = fetch_overpass_tiled(region_geometry, features_dict, tile_size=tile_size, timeout=timeout, endpoint=endpoint,
+                                            cache_dir=cache_dir, cache_ttl=cache_ttl, **(tile_options or {}))
+    else:
+        query = build_union_query(polygon, features_dict)
+        all_elements = query_overpass(query, timeout=timeout, endpoint=endpoint, cache_dir=cache_dir, ttl=cache_ttl).get('elements', [])
+
+    return features_elements_to_gpkg(all_elements, features_dict, region_name, output_dir, EPSG, relevant_geometries_override, promoted_tags)
+
+
+def features_elements_to_gpkg(all_elements: list, features_dict: dict, region_name: str, output_dir: str, EPSG: Optional[int] = 4326,
+                              relevant_geometries_override: Optional[dict] = None, promoted_tags=("name",)) -> dict:
+    """
+    Splits raw elements (Overpass JSON format) into the features of features_dict and saves one GeoPackage per feature.
+
+    Returns:
+        dict: Feature key -> dictionary of unsupported geometry types and their counts.
+    """
+    unsupported_summary = {}
+    for feature_key, elements in split_elements(all_elements, features_dict).items():
+        if not elements:
+            print(f"No elements found for {feature_key} in {region_name}")
+            continue
+        # the tag keys of the feature's selectors and the configured tags get their own columns
+        feature_tags = [category for category, _, _ in query_specs_of(features_dict[feature_key])]
+        unsupported = raw_elements_to_gpkg(elements, feature_key, output_dir, EPSG, relevant_geometries_override,
+                                           promoted_tags=list(dict.fromkeys([*feature_tags, *promoted_tags])))
+        if unsupported:
+            unsupported_summary[feature_key] = unsupported
+    return unsupported_summary
+
+
+def _way_geometries(ways: list) -> np.ndarray:
+    """Geometries of ways with geometry ('out geom'): closed ways are polygons, open ways linestrings."""
+    counts = np.fromiter((len(way['geometry']) for way in ways), dtype=np.int64, count=len(ways))
+    coords = np.fromiter((value for way in ways for c in way['geometry'] for value in (c['lon'], c['lat'])),
+                         dtype=np.float64, count=2 * int(counts.sum())).reshape(-1, 2)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    ends = starts + counts - 1
+    closed = (counts >= 4) & np.all(coords[starts] == coords[ends], axis=1)
+
+    geometries = np.empty(len(ways), dtype=object)
+    way_of_coord = np.repeat(np.arange(len(ways)), counts)
+    for is_closed, constructor in ((True, lambda c, i: shapely.polygons(shapely.linearrings(c, indices=i))), (False, lambda c, i: shapely.linestrings(c, indices=i))):
+        selected = closed == is_closed
+        if selected.any():
+            coord_mask = selected[way_of_coord]
+            # consecutive output indices for the selected ways
+            indices = np.repeat(np.arange(selected.sum()), counts[selected])
+            geometries[selected] = constructor(coords[coord_mask], indices)
+    return geometries
+
+
+def _relation_geometry(relation: dict):
+    """
+    (Multi)polygon of a relation built from the member geometries of 'out geom' (outer rings minus inner rings).
+    Returns None if the outer members do not form a closed ring.
+    """
+    lines = {'outer': [], 'inner': []}
+    for member in relation.get('members', []):
+        geometry = member.get('geometry') or []
+        if member.get('type') == 'way' and member.get('role') in lines and len(geometry) >= 2 and None not in geometry:
+            lines[member['role']].append(shapely.linestrings([(c['lon'], c['lat']) for c in geometry]))
+    if not lines['outer']:
+        return None
+    # polygonize joins the member ways into rings
+    outer = shapely.union_all(shapely.get_parts(shapely.polygonize(lines['outer'])))
+    if outer.is_empty:
+        return None
+    if lines['inner']:
+        outer = outer.difference(shapely.union_all(shapely.get_parts(shapely.polygonize(lines['inner']))))
+    return outer if outer.geom_type in ('Polygon', 'MultiPolygon') else None
+
+
+def overpass_elements_to_gdf(elements: list, relevant_geometries: list, promoted_tags=(), EPSG: Optional[int] = 4326):
+    """
+    Converts raw Overpass JSON elements ('out body geom') to a GeoDataFrame.
+
+    Node and way geometries are built in bulk with shapely's vectorized constructors; relations (multipolygons) are
+    assembled from the geometries of their members in the response. The tags of each element are kept as one JSON string column ('tags'),
+    tags in promoted_tags get their own column.
+
+    Args:
+        elements (list): Raw Overpass elements (dicts).
+        relevant_geometries (list): Geometry types which are kept (e.g. ["LineString", "Polygon"]).
+        promoted_tags (iterable): Tag keys which are saved as separate columns.
+        EPSG (int): EPSG code of the coordinates.
+
+    Returns:
+        tuple: (GeoDataFrame, dictionary of unsupported geometry types and their counts)
+    """
+    # Skip duplicates (elements can appear in multiple queries)
+    elements = list({(e['type'], e['id']): e for e in elements}.values())
+
+    nodes = [e for e in elements if e['type'] == 'node' and 'lat' in e and 'lon' in e]
+    # ways without complete geometry cannot be built (like element.geometry() failing in elements_to_gpkg)
+    ways = [e for e in elements if e['type'] == 'way' and len(e.get('geometry') or []) >= 2 and None not in e['geometry']]
+    relations = [e for e in elements if e['type'] == 'relation']
+
+    parts = []
+    if nodes:
+        parts.append((nodes, shapely.points([e['lon'] for e in nodes], [e['lat'] for e in nodes])))
+    if ways:
+        parts.append((ways, _way_geometries(ways)))
+    if relations:
+        relation_geometries = [_relation_geometry(e) for e in relations]
+        # relations whose rings cannot be closed are skipped (like element.geometry() failing in elements_to_gpkg)
+        relation_elements = [e for e, g in zip(relations, relation_geometries) if g is not None]
+        parts.append((relation_elements, np.array([g for g in relation_geometries if g is not None], dtype=object)))
+
+    kept_elements = [e for part_elements, _ in parts for e in part_elements]
+    geometries = np.concatenate([part_geometries for _, part_geometries in parts]) if parts else np.array([], dtype=object)
+    geometry_types = shapely.get_type_id(geometries)
+    type_names = np.array(["Point", "LineString", "LinearRing", "Polygon", "MultiPoint", "MultiLineString", "MultiPolygon", "GeometryCollection"])
+    geometry_type_names = type_names[geometry_types] if len(geometries) else np.array([], dtype=str)
+
+    relevant = np.isin(geometry_type_names, relevant_geometries)
+    unsupported_names, unsupported_numbers = np.unique(geometry_type_names[~relevant], return_counts=True)
+    unsupported_counts = {str(name): int(number) for name, number in zip(unsupported_names, unsupported_numbers)}
+
+    kept_elements = [e for e, k in zip(kept_elements, relevant) if k]
+    columns = {
+        'osm_id': [str(e['id']) for e in kept_elements],
+        'osm_type': [e['type'] for e in kept_elements],
+    }
+    for key in promoted_tags:
+        columns[key] = [e.get('tags', {}).get(key) for e in kept_elements]
+    columns['tags'] = [json.dumps(e.get('tags', {}), ensure_ascii=False) for e in kept_elements]
+    gdf = gpd.GeoDataFrame(columns, geometry=geometries[relevant], crs=f"EPSG:{EPSG}")
+    return gdf, unsupported_counts
+
+
+def raw_elements_to_gpkg(elements: list, feature_key: str, output_dir: str, EPSG: Optional[int] = 4326,
+                         relevant_geometries_override: Optional[dict] = None, promoted_tags=()) -> dict:
+    """
+    Converts raw Overpass elements of a feature with overpass_elements_to_gdf() and saves them to <output_dir>/<feature_key>.gpkg.
+
+    Returns:
+        dict: A dictionary of unsupported geometry types and their counts.
+    """
+    gdf, unsupported_counts = overpass_elements_to_gdf(elements, relevant_geometries_of(feature_key, relevant_geometries_override), promoted_tags, EPSG)
+    if not gdf.empty:
+        gpkg_path = os.path.join(output_dir, f"{feature_key}.gpkg")
+        gdf.to_file(gpkg_path, driver="GPKG", encoding="utf-8")
+
+        # Count by geometry type for reporting
+        geom_counts = gdf.geometry.geom_type.value_counts().to_dict()
+        count_str = ", ".join([f"{count} {geom_type}(s)" for geom_type, count in geom_counts.items()])
+        print(f"Saved {len(gdf)} features to {rel_path(gpkg_path)} ({count_str})")
+    return unsupported_counts
+
 
 if __name__ == "__main__":
 
@@ -0,0 +1,222 @@
+"""
+Global input datasets of the spatial data prep which are shared between study regions.
+
+When many regions are prepped in one process (see prepare_regions() in spatial_data_prep.py), the global datasets are
+downloaded, read and opened only once: vector files (WDPA) are kept in memory after the first read, rasters
+(DEM, population, landcover, wind and solar atlas) are kept open and GADM boundaries are fetched once per country and level.
+GOAS is not kept in memory; it is split once into small, spatially indexed parts which are read by bounding box.
+The downloads of independent sources can be started concurrently with prefetch() before the regions are processed.
+Downloaded datasets are recorded in the manifest of a RawDataCache (see utils/raw_data_cache.py), which can be shared
+between checkouts; a dataset in the manifest is used without any network request.
+"""
+
+import os
+import threading
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import geopandas as gpd
+import pygadm
+import rasterio
+
+from utils.data_preprocessing import (goas_download, split_vector_file, download_worldpop, retrieve_wdpa_url,
+                                      download_unpack_zip, find_folder, convert_gdb_to_gpkg, download_global_wind_atlas,
+                                      download_global_solar_atlas, GOAS_WFS_URL, WORLDPOP_BASE_URL, GWA_BASE_URL, GSA_BASE_URL)
+from utils.raw_data_cache import RawDataCache
+
+
+class GlobalDatasets:
+    """
+    Registry of global datasets which are loaded lazily and kept resident for all regions prepped in this process.
+
+    Rasters are shared as open rasterio datasets. GDAL dataset handles must not be read from several threads at the
+    same time, so raster() hands a dataset out under a lock for the duration of the with-block.
+
+    Parameters:
+        data_path (str): Folder with the raw spatial data (Raw_Spatial_Data).
+        raw_data_cache_dir (str, optional): Folder of the downloaded datasets (GOAS, WorldPop, WDPA, wind and solar atlas)
+                                            with their manifest. Defaults to data_path.
+    """
+
+    def __init__(self, data_path: str, raw_data_cache_dir: str = None):
+        self.data_path = data_path
+        self.raw_data = RawDataCache(raw_data_cache_dir or data_path)
+        self._vectors = {}
+        self._rasters = {}
+        self._gadm = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+
+    def _lock(self, key) -> threading.Lock:
+        with self._registry_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def vector(self, path: str) -> gpd.GeoDataFrame:
+        """Returns the GeoDataFrame of a vector file; the file is only read on the first call. Do not modify it in place."""
+        path = os.path.abspath(path)
+        with self._lock(('vector', path)):
+            if path not in self._vectors:
+                logging.info(f'loading {path}')
+                self._vectors[path] = gpd.read_file(path)
+            return self._vectors[path]
+
+    @contextmanager
+    def raster(self, path: str):
+        """Yields the open rasterio dataset of a raster file; the file is only opened on the first call."""
+        path = os.path.abspath(path)
+        with self._lock(('raster', path)):
+            if path not in self._rasters:
+                self._rasters[path] = rasterio.open(path)
+            yield self._rasters[path]
+
+    def gadm(self, country_code: str, level: int = 0) -> gpd.GeoDataFrame:
+        """Returns the GADM boundaries of a country at an administrative level (in EPSG:4326)."""
+        with self._lock(('gadm', country_code, level)):
+            if (country_code, level) not in self._gadm:
+                if level == 0:
+                    items = pygadm.Items(admin=country_code)
+                else:
+                    items = pygadm.Items(admin=country_code, content_level=level)
+                #pygadm lib extracts information from the GADM dataset as GeoPandas GeoDataFrame. GADM.org provides files in coordinate reference system is longitude/latitude and the WGS84 datum.
+                items.set_crs('epsg:4326', inplace=True)
+                self._gadm[(country_code, level)] = items
+            return self._gadm[(country_code, level)].copy()
+
+    def goas_path(self) -> str:
+        """Path to the global oceans and seas file, downloaded if missing."""
+        goas_folder = self.raw_data.path('GOAS')
+        path = os.path.join(goas_folder, 'goas.gpkg')
+
+        def download():
+            print('downloading global oceans and seas (coastlines)')
+            goas_download(output_dir=goas_folder)
+            return {'url': GOAS_WFS_URL}
+
+        return self.raw_data.fetch('goas', path, download)
+
+    def goas_split_path(self) -> str:
+        """
+        Path to the GOAS file split into small parts with spatial index (see split_vector_file).
+        The split is done once and redone when the downloaded GOAS file is newer.
+        """
+        goas_raw_filePath = self.goas_path()
+        path = self.raw_data.path('GOAS', 'goas_split.gpkg')
+        with self._lock(('download', path)):
+            if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(goas_raw_filePath):
+                print('splitting global oceans and seas into indexed parts (only done once)')
+                split_vector_file(goas_raw_filePath, path)
+        return path
+
+    def population_path(self, country_code: str, year: int, download: bool = True) -> str:
+        """Path to the WorldPop raster of a country and year, downloaded if missing and download is True."""
+        population_folder = self.raw_data.path('population')
+        path = os.path.join(population_folder, f'population_{country_code}_{year}.tif')
+        if not download:
+            # local file provided by the user
+            return os.path.join(self.data_path, 'population', f'population_{country_code}_{year}.tif')
+
+        def download_population():
+            download_worldpop(country_code=country_code, year=year, output_dir=population_folder)
+            return {'url': WORLDPOP_BASE_URL, 'version': str(year)}
+
+        return self.raw_data.fetch(f'worldpop/{country_code}/{year}', path, download_population)
+
+    def wdpa_path(self, country_code: str) -> str:
+        """Path to the WDPA protected areas of a country, downloaded and converted to GeoPackage if missing."""
+        WDPA_country_folder = self.raw_data.path('protected_areas', f'WDPA_{country_code}')
+        path = os.path.join(WDPA_country_folder, f'{country_code}_WDPA.gpkg')
+
+        def download():
+            # the month of the latest release is only probed when the country is not in the manifest yet
+            try:
+                os.makedirs(WDPA_country_folder, exist_ok=True)
+                wdpa_url, source_month = retrieve_wdpa_url(country_code)
+                download_unpack_zip(wdpa_url, WDPA_country_folder)
+                gdb_folder = find_folder(WDPA_country_folder, file_ending='.gdb') #gdb means geodatabase
+                convert_gdb_to_gpkg(gdb_folder, WDPA_country_folder, f'{country_code}_WDPA.gpkg')
+                print(f'WDPA downloaded for {source_month}')
+                return {'url': wdpa_url, 'version': source_month}
+            except Exception as e:
+                logging.error(f'WDPA download and conversion failed: {e}')
+
+        return self.raw_data.fetch(f'wdpa/{country_code}', path, download)
+
+    def wind_atlas_path(self, country_code: str, height: int = 100) -> str:
+        """Path to the global wind atlas raster of a country, downloaded if missing."""
+        path = self.raw_data.path('global_solar_wind_atlas', f'{country_code}_wind_speed_{height}.tif')
+
+        def download():
+            download_global_wind_atlas(country_code=country_code, height=height, data_path=self.raw_data.root) #global wind atlas apparently uses 3 letter ISO code
+            return {'url': f'{GWA_BASE_URL}/{country_code}/wind-speed/{height}'}
+
+        return self.raw_data.fetch(f'wind_atlas/{country_code}/{height}', path, download)
+
+    def solar_atlas_path(self, country_name: str, measure: str) -> str:
+        """Path to the PVOUT raster of the global solar atlas of a country, downloaded if missing."""
+        solar_atlas_folder_path = self.raw_data.path('global_solar_wind_atlas', f'{country_name}_solar_atlas')
+
+        def download():
+            download_global_solar_atlas(country_name=country_name, data_path=self.raw_data.root, measure=measure)
+            return {'url': GSA_BASE_URL, 'version': measure}
+
+        def pvout_exists(folder):
+            return any("PVOUT.tif" in files for root, dirs, files in os.walk(folder))
+
+        self.raw_data.fetch(f'solar_atlas/{country_name}/{measure}', solar_atlas_folder_path, download, complete=pvout_exists)
+        return os.path.join(solar_atlas_folder_path, os.listdir(solar_atlas_folder_path)[0], 'PVOUT.tif')
+
+    def prefetch(self, config: dict, max_workers: int = 4) -> dict:
+        """
+        Downloads the global datasets enabled in config concurrently (GOAS, WorldPop, WDPA, wind and solar atlas).
+        The downloads are independent of each other and mostly wait for the network, so they run in threads;
+        the getters hold a lock per file, so stages asking for the same file later wait for the download instead of repeating it.
+
+        Parameters:
+            config (dict): Study region config.
+            max_workers (int): Number of concurrent downloads.
+
+        Returns:
+            dict: Paths of the prefetched datasets by name (None if the download failed).
+        """
+        country_code = config['country_code']
+        jobs = {}
+        if config.get('coastlines') == 1:
+            jobs['coastlines'] = self.goas_split_path
+        if config.get('population_source') == 'worldpop':
+            jobs['population'] = lambda: self.population_path(country_code, config['population_year'])
+        if config.get('protected_areas_source') == 'WDPA':
+            jobs['protected_areas'] = lambda: self.wdpa_path(country_code)
+        if config.get('wind_atlas') == 1:
+            jobs['wind'] = lambda: self.wind_atlas_path(country_code, height=100)
+        if config.get('solar_atlas') == 1:
+            jobs['solar'] = lambda: self.solar_atlas_path(config['country_name_solar_atlas'], config['solar_atlas_measure'])
+        if not jobs:
+            return {}
+
+        paths = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+            futures = {executor.submit(job): name for name, job in jobs.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    paths[name] = future.result()
+                except Exception as e:
+                    # the stage of the dataset reports the error again when it needs the file
+                    logging.error(f'download of {name} failed: {e}')
+                    paths[name] = None
+        return paths
+
+    def close(self):
+        """Closes all open rasters and releases the loaded vector data."""
+        for src in self._rasters.values():
+            src.close()
+        self._rasters.clear()
+        self._vectors.clear()
+        self._gadm.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
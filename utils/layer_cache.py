@@ -0,0 +1,189 @@
+"""
+Content-addressed cache for preprocessed layers of the spatial data prep.
+
+Every cached layer is stored under a key which is a hash of its source files, the study region geometry and the
+processing parameters. A changed source file, region polygon or parameter (e.g. buffer distance) therefore results
+in a new key and the layer is recomputed, while unchanged layers are restored from the cache. The cache folder is
+shared between regions, so a region with the same inputs as a previous run reuses the outputs of that run.
+
+Every entry folder holds an entry.json with the layer name, the cached files and the creation time. It is written
+last and atomically, so an entry is only used once all its files are cached, and processes sharing the cache folder
+never rewrite a common file.
+
+Files are copied into and out of the cache, never hard-linked, so writing to a restored output in place (e.g. a raster
+opened with 'r+' or a GeoPackage append) does not change the cached copy used by other regions and runs.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from datetime import datetime
+
+from shapely.ops import unary_union
+
+
+# bytes read from the start and the end of a source file to fingerprint its content
+_FINGERPRINT_SAMPLE_SIZE = 1024 * 1024
+
+
+def file_fingerprint(path: str) -> str:
+    """
+    Returns a hash of a source file based on its size, modification time and the content of its first and last MiB.
+    This avoids reading multi-GB rasters completely while still detecting replaced or re-downloaded files.
+
+    Parameters:
+        path (str): Path to the file.
+
+    Returns:
+        str: Hex digest of the fingerprint.
+    """
+    digest = hashlib.sha256()
+    stat = os.stat(path)
+    digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(_FINGERPRINT_SAMPLE_SIZE))
+        if stat.st_size > 2 * _FINGERPRINT_SAMPLE_SIZE:
+            f.seek(-_FINGERPRINT_SAMPLE_SIZE, os.SEEK_END)
+            digest.update(f.read(_FINGERPRINT_SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def geometry_fingerprint(gdf) -> str:
+    """
+    Returns a hash of the (dissolved) geometry and CRS of a GeoDataFrame or GeoSeries.
+    """
+    geometry = unary_union(list(gdf.geometry)).normalize()
+    digest = hashlib.sha256(geometry.wkb)
+    digest.update(str(gdf.crs).encode())
+    return digest.hexdigest()
+
+
+class LayerCache:
+    """
+    Cache of preprocessed layer files keyed by a hash of their inputs.
+
+    Usage:
+        key = cache.key('goas', sources=[raw_path], geometry=region, params={'buffer': 1000})
+        if not cache.restore(key, [output_path]):
+            ... compute output_path ...
+            cache.store(key, 'goas', [output_path])
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, layer: str, sources=(), geometry=None, params=None) -> str:
+        """
+        Builds the cache key of a layer.
+
+        Parameters:
+            layer (str): Name of the layer (e.g. 'goas', 'population').
+            sources (list of str): Paths to the source files the layer is derived from.
+            geometry (GeoDataFrame or GeoSeries, optional): Study region the layer is clipped to.
+            params (dict, optional): Processing parameters which influence the output. Must be JSON serializable (str() is used otherwise).
+
+        Returns:
+            str: Hex digest used as cache key.
+        """
+        description = {
+            'layer': layer,
+            'sources': [file_fingerprint(path) for path in sources],
+            'geometry': geometry_fingerprint(geometry) if geometry is not None else None,
+            'params': params or {},
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _read_entry(self, key: str):
+        entry_path = os.path.join(self._entry_dir(key), 'entry.json')
+        if not os.path.exists(entry_path):
+            return None
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f'layer cache entry {key[:12]} could not be read and will be recomputed: {e}')
+            return None
+
+    @staticmethod
+    def _replace(write, path: str):
+        """Writes a file with write(tmp_path) next to path and moves it to path in one step."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def restore(self, key: str, output_paths: list) -> bool:
+        """
+        Restores the cached files of a key to output_paths.
+        If the key is not cached, existing files at output_paths are removed because they stem from other inputs.
+
+        Parameters:
+            key (str): Cache key from LayerCache.key().
+            output_paths (list of str): Paths where the layer files are expected, in the same order as passed to store().
+
+        Returns:
+            bool: True if the layer was restored from the cache, False if it needs to be computed.
+        """
+        entry = self._read_entry(key)
+
+        cached_files = {}
+        if entry is not None:
+            cached_files = {int(i): os.path.join(self._entry_dir(key), name) for i, name in entry['files'].items()}
+            if not all(os.path.exists(path) for path in cached_files.values()):
+                logging.warning(f"layer cache entry of '{entry['layer']}' is incomplete and will be recomputed")
+                entry = None
+                cached_files = {}
+
+        for i, output_path in enumerate(output_paths):
+            cached_path = cached_files.get(i)
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            if cached_path is not None:
+                shutil.copy2(cached_path, output_path)
+
+        if entry is not None:
+            logging.info(f"restored '{entry['layer']}' from layer cache ({key[:12]})")
+        return entry is not None
+
+    def store(self, key: str, layer: str, output_paths: list):
+        """
+        Adds the files at output_paths to the cache under key. Paths which do not exist are recorded as not produced
+        (e.g. no coastline in the study region), so restoring the key does not recompute them either.
+
+        Parameters:
+            key (str): Cache key from LayerCache.key().
+            layer (str): Name of the layer (for the entry file).
+            output_paths (list of str): Paths of the computed layer files.
+        """
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        files = {}
+        for i, output_path in enumerate(output_paths):
+            if not os.path.exists(output_path):
+                continue
+            name = f'{i}_{os.path.basename(output_path)}'
+            self._replace(lambda tmp_path, output_path=output_path: shutil.copy2(output_path, tmp_path), os.path.join(entry_dir, name))
+            files[str(i)] = name
+
+        entry = {
+            'layer': layer,
+            'files': files,
+            'created': datetime.now().isoformat(timespec='seconds'),
+        }
+
+        def write_entry(tmp_path):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, indent=2)
+        self._replace(write_entry, os.path.join(entry_dir, 'entry.json'))
@@ -1,8 +1,82 @@
 import os
+import numpy as np
 import geopandas as gpd
 from pyproj import CRS
 
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import pyarrow  # needed for the GeoParquet store
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# Geofabrik shapefile of each OSM layer
+OSM_LAYER_FILES = {
+    'railways': 'gis_osm_railways_free_1.shp',
+    'roads': 'gis_osm_roads_free_1.shp',
+    'airports': 'gis_osm_transport_a_free_1.shp',
+    'waterbodies': 'gis_osm_water_a_free_1.shp',
+    'military': 'gis_osm_landuse_a_free_1.shp',
+}
+
+def osm_store_path(OSM_data_path, input_shp_filename):
+    """Path of the GeoParquet store of a Geofabrik shapefile (in the subfolder parquet_store of the OSM data folder)."""
+    return os.path.join(OSM_data_path, 'parquet_store', f'{os.path.splitext(input_shp_filename)[0]}.parquet')
+
+
+def build_osm_parquet_store(input_filepath, store_filepath, row_group_size=20000):
+    """
+    One-time conversion of a Geofabrik shapefile into a GeoParquet file for fast region reads.
+
+    All columns of the shapefile are kept, so a region read from the store equals one read from the shapefile.
+    The features are sorted by fclass and then along a Hilbert curve, so every row group holds one (or few) fclass and
+    a spatially compact set of features. Together with the bbox covering column, the min/max statistics of the row
+    groups let read_osm_parquet_store skip all row groups outside the region bounding box or with other fclasses.
+
+    Parameters:
+        input_filepath (str): Path to the Geofabrik shapefile.
+        store_filepath (str): Path of the GeoParquet file to write.
+        row_group_size (int): Number of features per row group.
+    """
+    OSM_file = gpd.read_file(input_filepath)
+    if not OSM_file.empty:
+        order = np.lexsort((OSM_file.hilbert_distance(), OSM_file['fclass'].to_numpy()))
+        OSM_file = OSM_file.iloc[order]
+    os.makedirs(os.path.dirname(store_filepath), exist_ok=True)
+    # write to a temporary file first so an interrupted conversion does not leave an incomplete store behind
+    tmp_filepath = f'{store_filepath}.{os.getpid()}.tmp'
+    OSM_file.to_parquet(tmp_filepath, index=False, write_covering_bbox=True, row_group_size=row_group_size)
+    os.replace(tmp_filepath, store_filepath)
+    logging.info(f'OSM GeoParquet store written: {store_filepath} ({len(OSM_file)} features)')
+
+
+def osm_store_is_current(store_filepath, input_filepath):
+    """True if the GeoParquet store exists, is newer than the shapefile and has all of its columns."""
+    if not os.path.exists(store_filepath) or os.path.getmtime(store_filepath) < os.path.getmtime(input_filepath):
+        return False
+    # stores of older versions kept only some columns
+    shp_columns = gpd.read_file(input_filepath, rows=0).columns
+    return set(shp_columns) <= set(pyarrow.parquet.read_schema(store_filepath).names)
+
+
+def read_osm_parquet_store(store_filepath, bbox, fclasses=None):
+    """
+    Reads the features of a GeoParquet store which intersect bbox and, if given, have one of the fclasses.
+    Both predicates are pushed down to the row groups.
+
+    Parameters:
+        store_filepath (str): Path to the store written by build_osm_parquet_store.
+        bbox (tuple): (minx, miny, maxx, maxy) in EPSG:4326.
+        fclasses (list of str, optional): fclass values to keep. None keeps all.
+
+    Returns:
+        GeoDataFrame
+    """
+    filters = [('fclass', 'in', list(fclasses))] if fclasses is not None else None
+    return gpd.read_parquet(store_filepath, bbox=tuple(float(b) for b in bbox), filters=filters)
 
 
 
@@ -13,7 +87,8 @@ def process_single_local_osm_layer(config,
                              region_name='', 
                              output_dir='',
                              target_crs=None,
-                             OSM_data_path=''):
+                             OSM_data_path='',
+                             use_store=True):
     """
     Generic function to process and filter OSM layers based on configuration.
     Processes only if config['consider_<layer_name>'] == 1.
@@ -29,6 +104,8 @@ def process_single_local_osm_layer(config,
         output_dir (str): Directory to save processed output.
         target_crs (str or pyproj.CRS, optional): Output CRS for reprojection (e.g., 'EPSG:3857').
         OSM_data_path (str): Directory containing the raw OSM shapefiles.
+        use_store (bool): Read from the GeoParquet store of the shapefile (built on first use, rebuilt if the shapefile is newer or has more columns).
+                          Falls back to reading the shapefile if pyarrow is not installed.
     """
     if config.get(f'{layer_name}') != 1:
         return
@@ -54,13 +131,25 @@ def process_single_local_osm_layer(config,
     input_filepath = os.path.join(OSM_data_path, input_shp_filename)
 
     try:
-        OSM_file = gpd.read_file(input_filepath)
-        clipped_data = gpd.clip(OSM_file, clip_region)
-
-        if layer_fclasses is not None:
-            filtered_data = clipped_data[clipped_data['fclass'].isin(layer_fclasses)]
+        if use_store and pyarrow is None:
+            logging.warning('pyarrow is not installed, OSM shapefiles are read without GeoParquet store')
+            use_store = False
+
+        if use_store:
+            store_filepath = osm_store_path(OSM_data_path, input_shp_filename)
+            if not osm_store_is_current(store_filepath, input_filepath):
+                print(f"Converting {input_shp_filename} to GeoParquet (only done once)...")
+                build_osm_parquet_store(input_filepath, store_filepath)
+            OSM_file = read_osm_parquet_store(store_filepath, clip_region.total_bounds, layer_fclasses)
+            filtered_data = gpd.clip(OSM_file, clip_region)
         else:
-            filtered_data = clipped_data
+            OSM_file = gpd.read_file(input_filepath)
+            clipped_data = gpd.clip(OSM_file, clip_region)
+
+            if layer_fclasses is not None:
+                filtered_data = clipped_data[clipped_data['fclass'].isin(layer_fclasses)]
+            else:
+                filtered_data = clipped_data
 
         if target_crs:
             filtered_data = filtered_data.to_crs(crs)
@@ -77,58 +166,37 @@ def process_single_local_osm_layer(config,
 
 
 def process_all_local_osm_layer(config, region, region_name_clean, output_dir, OSM_data_path, target_crs=None):
+    """
+    Processes all OSM layers in OSM_LAYER_FILES which are enabled in config.
+    The layers are independent, so with config['osm_workers'] > 1 they are processed concurrently in a thread pool.
+    Errors are logged per layer and do not stop the other layers.
+    """
+    use_store = bool(config.get('osm_parquet_store', 1))
+    max_workers = max(1, int(config.get('osm_workers', 1) or 1))
+
+    def process_layer(layer_name, input_shp_filename):
+        process_single_local_osm_layer(
+        config,
+        layer_name=layer_name,
+        input_shp_filename=input_shp_filename,
+        clip_region=region,
+        region_name=region_name_clean,
+        output_dir=output_dir,
+        target_crs=target_crs,
+        OSM_data_path = OSM_data_path,
+        use_store=use_store
+        )
+
+    if max_workers == 1:
+        for layer_name, input_shp_filename in OSM_LAYER_FILES.items():
+            process_layer(layer_name, input_shp_filename)
+        return
 
-    process_single_local_osm_layer(
-    config,
-    layer_name='railways',
-    input_shp_filename='gis_osm_railways_free_1.shp',
-    clip_region=region,
-    region_name=region_name_clean,
-    output_dir=output_dir,
-    target_crs=target_crs,
-    OSM_data_path = OSM_data_path
-    )
-
-    process_single_local_osm_layer(
-    config,
-    layer_name='roads',
-    input_shp_filename='gis_osm_roads_free_1.shp',
-    clip_region=region,
-    region_name=region_name_clean,
-    output_dir=output_dir,
-    target_crs=target_crs,
-    OSM_data_path = OSM_data_path
-    )
-    
-    process_single_local_osm_layer(
-    config,
-    layer_name='airports',
-    input_shp_filename='gis_osm_transport_a_free_1.shp',
-    clip_region=region,
-    region_name=region_name_clean,
-    output_dir=output_dir,
-    target_crs=target_crs,
-    OSM_data_path = OSM_data_path
-    )
-
-    process_single_local_osm_layer(
-    config,
-    layer_name='waterbodies',
-    input_shp_filename='gis_osm_water_a_free_1.shp',
-    clip_region=region,
-    region_name=region_name_clean,
-    output_dir=output_dir,
-    target_crs=target_crs,
-    OSM_data_path = OSM_data_path
-    )
-
-    process_single_local_osm_layer(
-    config,
-    layer_name='military',
-    input_shp_filename='gis_osm_landuse_a_free_1.shp',
-    clip_region=region,
-    region_name=region_name_clean,
-    output_dir=output_dir,
-    target_crs=target_crs,
-    OSM_data_path = OSM_data_path
-    )
\ No newline at end of file
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(process_layer, layer_name, input_shp_filename): layer_name
+                   for layer_name, input_shp_filename in OSM_LAYER_FILES.items()}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(f"Error processing {futures[future]}: {e}")
@@ -0,0 +1,110 @@
+"""
+OSM features from a local .osm.pbf extract (e.g. a Geofabrik country extract) with the tag selectors of osm_features_config.
+
+The extract is read with pyosmium. All selected features are collected while streaming through the file (osmium reads
+the relations once more beforehand to assemble multipolygons) and converted to the same element format as the Overpass
+responses, so the features are split and saved exactly like in the Overpass union query (see utils/fetch_OSM.py).
+No network access is needed and the result only depends on the extract.
+"""
+
+import os
+import time
+import logging
+from typing import Optional
+
+try:
+    import osmium  # needed for reading .osm.pbf files
+except ImportError:
+    osmium = None
+
+from utils.fetch_OSM import query_specs_of, elements_in_region, features_elements_to_gpkg
+from utils.data_preprocessing import rel_path
+
+
+def _bounds(coords) -> dict:
+    lons = [c['lon'] for c in coords]
+    lats = [c['lat'] for c in coords]
+    return {'minlon': min(lons), 'minlat': min(lats), 'maxlon': max(lons), 'maxlat': max(lats)}
+
+
+def _ring_coords(ring) -> list:
+    return [{'lat': node.lat, 'lon': node.lon} for node in ring]
+
+
+def read_pbf_elements(pbf_path: str, features_dict: dict) -> list:
+    """
+    Reads the nodes, ways and multipolygon relations with a tag key used in features_dict from a .osm.pbf file.
+
+    Returns:
+        list: Elements in the format of Overpass 'out body geom' responses (dicts with type, id, tags and
+              lat/lon, geometry or members with geometry, and bounds).
+    """
+    if osmium is None:
+        raise ImportError("pyosmium is needed to read .osm.pbf files (pip install osmium)")
+    keys = sorted({category for feature_spec in features_dict.values() for category, _, _ in query_specs_of(feature_spec)})
+
+    elements = []
+    processor = (osmium.FileProcessor(pbf_path)
+                 .with_locations()
+                 .with_areas()
+                 .with_filter(osmium.filter.KeyFilter(*keys)))
+    for obj in processor:
+        tags = {tag.k: tag.v for tag in obj.tags}
+        if obj.is_node():
+            if obj.location.valid():
+                elements.append({'type': 'node', 'id': obj.id, 'lat': obj.location.lat, 'lon': obj.location.lon, 'tags': tags})
+        elif obj.is_way():
+            if len(obj.nodes) < 2 or not all(node.location.valid() for node in obj.nodes):
+                continue  # way crosses the border of the extract
+            geometry = [{'lat': node.lat, 'lon': node.lon} for node in obj.nodes]
+            elements.append({'type': 'way', 'id': obj.id, 'tags': tags, 'geometry': geometry, 'bounds': _bounds(geometry)})
+        elif obj.is_area() and not obj.from_way():
+            # multipolygon relation assembled by osmium; its rings are passed as outer and inner members
+            members = []
+            for outer in obj.outer_rings():
+                members.append({'type': 'way', 'role': 'outer', 'geometry': _ring_coords(outer)})
+                members.extend({'type': 'way', 'role': 'inner', 'geometry': _ring_coords(inner)} for inner in obj.inner_rings(outer))
+            if members:
+                outer_coords = [c for member in members if member['role'] == 'outer' for c in member['geometry']]
+                elements.append({'type': 'relation', 'id': obj.orig_id(), 'tags': tags, 'members': members, 'bounds': _bounds(outer_coords)})
+    return elements
+
+
+def pbf_to_gpkg(
+    pbf_path: str,
+    region_name: str,
+    features_dict: dict,
+    output_dir: str = "OSM_Infrastructure",
+    region_geometry=None,
+    EPSG: Optional[int] = 4326,
+    relevant_geometries_override: Optional[dict] = None,
+    promoted_tags=("name",),
+) -> dict:
+    """
+    Extracts all features of features_dict from a .osm.pbf file in one pass and saves one GeoPackage per feature.
+
+    Args:
+        pbf_path (str): Path to the .osm.pbf extract.
+        region_name (str): Name of the region (for messages).
+        features_dict (dict): A dictionary mapping feature keys to [category, category_element, element_type].
+        output_dir (str): Directory where the GeoPackage files will be saved.
+        region_geometry (shapely geometry): If given (EPSG:4326), only elements whose bounding box intersects it are saved.
+        EPSG (int): EPSG code of the coordinates.
+        relevant_geometries_override (dict): Optional dict mapping feature_key to list of geometries.
+        promoted_tags (iterable): Tag keys saved as separate columns besides the selector keys of each feature.
+
+    Returns:
+        dict: Feature key -> dictionary of unsupported geometry types and their counts.
+    """
+    if not features_dict:
+        return {}
+    os.makedirs(output_dir, exist_ok=True)
+
+    start_time = time.time()
+    print(f"Reading {', '.join(features_dict)} from {rel_path(pbf_path)}")
+    elements = read_pbf_elements(pbf_path, features_dict)
+    if region_geometry is not None:
+        elements = elements_in_region(elements, region_geometry)
+    logging.info(f"read {len(elements)} OSM elements from {pbf_path} in {time.time() - start_time:.1f} s")
+
+    return features_elements_to_gpkg(elements, features_dict, region_name, output_dir, EPSG, relevant_geometries_override, promoted_tags)
@@ -5,104 +5,156 @@
 @date: 18-06-2025
 
 @description:
-Script to generate proximity (distance) rasters from OpenStreetMap (OSM) features using the 
-DistanceRaster tool from the distancerasters library.
+Script to generate proximity (distance) rasters from OpenStreetMap (OSM) features and other vector layers
+(e.g. substations, roads, transmission lines, coastlines).
 
-The script rasterizes vector features (e.g., substations), calculates the
-approximate geodesic distance from those features, and outputs the result as a GeoTIFF 
-distance raster.
+The vector features are rasterized in a projected CRS of the region at a configurable resolution and the distance
+of every pixel to the nearest feature pixel is computed with an exact Euclidean distance transform
+(scipy.ndimage.distance_transform_edt, linear in the number of pixels). Everything is done in memory and each
+distance raster is written once, already masked to the region. Several layers share the same grid, so one call
+can produce all proximity rasters of a region.
 
-The region of interest is specified by a vector file (e.g., a GeoJSON polygon). The 
-distance raster is clipped after calculation to match the region shape.
+Distances are in meters (units of the projected CRS). Pixels outside of the region are nodata.
+
+The grid is either an own grid of the region at a chosen resolution (proximity_grid) or the grid of the exclusion
+rasters (exclusion_grid, the padded grid of atlite.gis.shape_availability), so the distances can be used by the
+exclusion and suitability analysis without resampling.
 """
 
 
 import os
-import time
-from shapely.geometry import shape
-import geopandas as gpd
-import distancerasters as dr
-import rasterio
-from rasterio.mask import mask
 import numpy as np
+import rasterio
+import geopandas as gpd
+from affine import Affine
+from rasterio.features import rasterize, geometry_mask
+from scipy.ndimage import distance_transform_edt
+from utils.raster_io import raster_profile, create_raster
 
-def raster_conditional(rarray):
-    """
-    Default condition function for DistanceRaster.
-    Assumes the raster is binary and returns True where value == 1.
-    """
-    return (rarray == 1)
 
-def generate_distance_raster(shapefile_path, region_gdf, output_path, pixel_size=0.01, no_data_value=-9999):
+def proximity_grid(region_gdf, crs, resolution: float, padding: float = 0):
     """
-    Generate a proximity raster from vector data and clip it to a specified region.
+    Grid covering a region in a projected CRS, aligned to multiples of the resolution.
 
     Parameters:
-        shapefile_path (str): Path to the input shapefile (.shp or .gpkg).
-        region_gdf (geopandas.GeoDataFrame): Region boundary provided in-memory.
-        output_path (str): Path to save the clipped output raster (.tif).
-        pixel_size (float): Resolution of the output raster.
-        no_data_value (int): NoData value to use in the raster.
+        region_gdf (geopandas.GeoDataFrame): Region boundary.
+        crs: Projected CRS of the grid (units in meters).
+        resolution (float): Pixel size in CRS units.
+        padding (float): Extra margin around the region in CRS units (features just outside of the region are then
+                         considered for the distances of pixels close to the border).
+
+    Returns:
+        tuple: (transform, width, height)
     """
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    t0 = time.time()
+    minx, miny, maxx, maxy = region_gdf.to_crs(crs).total_bounds
+    minx = np.floor((minx - padding) / resolution) * resolution
+    miny = np.floor((miny - padding) / resolution) * resolution
+    maxx = np.ceil((maxx + padding) / resolution) * resolution
+    maxy = np.ceil((maxy + padding) / resolution) * resolution
+    transform = Affine(resolution, 0, minx, 0, -resolution, maxy)
+    return transform, int(round((maxx - minx) / resolution)), int(round((maxy - miny) / resolution))
 
-    #print("Loading input data...")
 
-    shp_gdf = gpd.read_file(shapefile_path)
+def exclusion_grid(region_gdf, crs, resolution: float):
+    """
+    Grid of the exclusion rasters of a region (same as atlite.gis.padded_transform_and_shape of the region bounds).
 
-    if shp_gdf.crs != region_gdf.crs:
-        raise ValueError(
-            f"CRS mismatch: region CRS is {region_gdf.crs}, but shp CRS is {shp_gdf.crs}"
-        )
+    Parameters:
+        region_gdf (geopandas.GeoDataFrame): Region boundary.
+        crs: CRS of the exclusion container (units in meters).
+        resolution (float): Resolution of the exclusion container.
 
-    region_bounds = region_gdf.total_bounds
-    region_geometries = [shape(geom) for geom in region_gdf.geometry]
+    Returns:
+        tuple: (transform, width, height)
+    """
+    minx, miny, maxx, maxy = region_gdf.to_crs(crs).total_bounds
+    left, bottom = (minx // resolution) * resolution, (miny // resolution) * resolution
+    right, top = (maxx // resolution + 1) * resolution, (maxy // resolution + 1) * resolution
+    transform = Affine(resolution, 0, left, 0, -resolution, top)
+    return transform, int((right - left) / resolution), int((top - bottom) / resolution)
 
-    temp_raster_path = os.path.join(os.path.dirname(output_path), "temp_rasterized.tif")
 
-    #print("Rasterizing shapefile...")
-    t1 = time.time()
-    rv_array, affine = dr.rasterize(
-        shp_gdf,
-        pixel_size=pixel_size,
-        bounds=region_bounds,
-        fill=0,
-        nodata=no_data_value,
-        output=temp_raster_path,
-    )
-    #print(f"✔ Rasterization completed in {time.time() - t1:.2f} seconds")
-
- 
-    #print("Calculating distance raster...")
-    t2 = time.time()
-    dr_obj = dr.DistanceRaster(
-        rv_array,
-        affine=affine,
-        output_path=output_path,
-        conditional=raster_conditional
-    )
-    #print(f"✔ Distance calculation completed in {time.time() - t2:.2f} seconds")
+def on_grid(raster_path: str, crs, transform, width: int, height: int) -> bool:
+    """True if an existing raster has the given CRS, transform and shape."""
+    with rasterio.open(raster_path) as src:
+        return (src.crs == crs and src.width == width and src.height == height
+                and src.transform.almost_equals(transform))
 
-    #print("Clipping raster to region...")
-    t3 = time.time()
-    with rasterio.open(output_path) as src:
-        out_image, out_transform = mask(src, region_geometries, crop=True)
-        out_meta = src.meta.copy()
 
-    out_meta.update({
-        "height": out_image.shape[1],
-        "width": out_image.shape[2],
-        "transform": out_transform,
-        "nodata": src.nodata
-    })
+def distance_array(features_gdf, transform, width: int, height: int):
+    """
+    Euclidean distance of every pixel centre of a grid to the nearest pixel touched by a feature.
+
+    Parameters:
+        features_gdf (geopandas.GeoDataFrame): Features in the CRS of the grid.
+        transform (Affine): Transform of the grid (north up).
+        width, height (int): Shape of the grid in pixels.
 
-    #print("Saving clipped raster...")
-    with rasterio.open(output_path, 'w', **out_meta) as dest:
-        dest.write(out_image)
-    #print(f"✔ Clipping and saving completed in {time.time() - t3:.2f} seconds")
+    Returns:
+        numpy.ndarray: float32 distances in CRS units, or None if no feature touches the grid.
+    """
+    geometries = [geom for geom in features_gdf.geometry if geom is not None and not geom.is_empty]
+    if not geometries:
+        return None
+    features = rasterize(geometries, out_shape=(height, width), transform=transform, fill=0, default_value=1,
+                         all_touched=True, dtype='uint8').astype(bool)
+    if not features.any():
+        return None
+    # distance_transform_edt measures the distance to the nearest zero, sampling gives the pixel size per axis
+    return distance_transform_edt(~features, sampling=(abs(transform.e), abs(transform.a))).astype(np.float32)
+
+
+def generate_proximity_rasters(sources: dict, region_gdf, crs, resolution: float = 100, padding: float = 0,
+                               no_data_value=-9999, grid=None) -> dict:
+    """
+    Generate proximity rasters of several vector layers on one grid and save them masked to the region.
+
+    Parameters:
+        sources (dict): Output path (.tif) -> vector file path or GeoDataFrame of the features.
+        region_gdf (geopandas.GeoDataFrame): Region boundary.
+        crs: Projected CRS of the output rasters (units in meters).
+        resolution (float): Pixel size in CRS units (ignored if grid is given).
+        padding (float): Extra margin around the region in CRS units (ignored if grid is given).
+        no_data_value (int): NoData value outside of the region.
+        grid (tuple, optional): (transform, width, height) of the output grid in crs instead of a grid from the region bounds.
+
+    Returns:
+        dict: Output path -> True if the raster was written, False if the layer has no features near the region.
+    """
+    transform, width, height = grid or proximity_grid(region_gdf, crs, resolution, padding)
+    region_local = region_gdf.to_crs(crs)
+    outside_region = geometry_mask(region_local.geometry, out_shape=(height, width), transform=transform)
+    profile = raster_profile(driver='GTiff', dtype='float32', count=1, width=width, height=height,
+                             crs=crs, transform=transform, nodata=no_data_value)
+
+    written = {}
+    for output_path, source in sources.items():
+        features_gdf = source if isinstance(source, gpd.GeoDataFrame) else gpd.read_file(source)
+        distances = distance_array(features_gdf.to_crs(crs), transform, width, height)
+        if distances is None:
+            written[output_path] = False
+            continue
+        distances[outside_region] = no_data_value
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with create_raster(output_path, profile) as dst:
+            dst.write(distances, 1)
+        written[output_path] = True
+    return written
+
+
+def generate_distance_raster(shapefile_path, region_gdf, output_path, crs, pixel_size=100, no_data_value=-9999):
+    """
+    Generate a proximity raster from vector data and mask it to a specified region.
 
-    #print(f"✅ Distance raster generation complete in {time.time() - t0:.2f} seconds.")
+    Parameters:
+        shapefile_path (str): Path to the input shapefile (.shp or .gpkg).
+        region_gdf (geopandas.GeoDataFrame): Region boundary provided in-memory.
+        output_path (str): Path to save the output raster (.tif).
+        crs: Projected CRS of the output raster.
+        pixel_size (float): Resolution of the output raster in CRS units (meters).
+        no_data_value (int): NoData value to use in the raster.
+    """
+    return generate_proximity_rasters({output_path: shapefile_path}, region_gdf, crs, pixel_size, no_data_value=no_data_value)[output_path]
 
 # Example usage
 if __name__ == "__main__":
@@ -113,4 +165,5 @@ if __name__ == "__main__":
         shapefile_path="data/NeiMongol/OSM_Infrastructure/substations.gpkg",
         region_gdf=region_demo,
         output_path="data/NeiMongol/proximity/substation_distance_raster.tif",
+        crs=region_demo.estimate_utm_crs(),
     )
@@ -1,4 +1,6 @@
 import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from scipy.ndimage import label
 import rasterio
 from rasterio.warp import reproject, Resampling
@@ -7,9 +9,30 @@ import geopandas as gpd
 from affine import Affine
 from rasterio.crs import CRS
 from rasterio.io import MemoryFile
+from utils.raster_io import raster_profile, create_raster
+from utils.data_preprocessing import block_windows
 
 # area filter
-def area_filter(boolean_array, min_size):
+def area_filter(boolean_array, min_size, tile_size=None, max_workers=1):
+    """
+    Keeps the connected areas (4-connectivity) with at least min_size pixels.
+
+    Parameters:
+        boolean_array (numpy.ndarray): Mask of the areas.
+        min_size (float): Minimum number of pixels of an area.
+        tile_size (int, optional): Label the mask in tiles of this size (see tiled_area_filter) instead of at once,
+                                   which needs int32 labels of the whole mask.
+        max_workers (int): Number of tiles labelled at the same time (worker processes, if tile_size is given).
+
+    Returns:
+        numpy.ndarray: Boolean mask of the kept areas.
+    """
+    if tile_size:
+        filtered_array = np.zeros(boolean_array.shape, dtype=bool)
+        for window, block in tiled_area_filter(boolean_array, min_size, tile_size, max_workers):
+            filtered_array[window.toslices()] = block
+        return filtered_array
+
     # Label connected components in the array
     labeled_array, num_features = label(boolean_array)
     
@@ -25,12 +48,156 @@ def area_filter(boolean_array, min_size):
     
     return filtered_array
 
+
+def area_filter_raster(input_path, output_path, min_size, tile_size=4096, max_workers=1):
+    """
+    Area filter of a mask raster (e.g. available land, values > 0) without reading it into memory at once.
+    The kept areas are written as uint8 GeoTIFF (1 kept, 0 nodata) on the grid of the input.
+
+    Parameters:
+        input_path (str): Path of the mask raster.
+        output_path (str): Path of the filtered raster.
+        min_size (float): Minimum number of pixels of an area.
+        tile_size (int): Edge length of the tiles in pixels.
+        max_workers (int): Number of tiles labelled at the same time (worker processes).
+
+    Returns:
+        int: Number of kept pixels.
+    """
+    with rasterio.open(input_path) as src:
+        profile = raster_profile(src.profile, dtype='uint8', nodata=0, count=1)
+    kept_pixels = 0
+    with create_raster(output_path, profile) as dst:
+        for window, block in tiled_area_filter(input_path, min_size, tile_size, max_workers):
+            dst.write(block.astype(np.uint8), 1, window=window)
+            kept_pixels += int(block.sum())
+    return kept_pixels
+
+
+def tiled_area_filter(source, min_size, tile_size=4096, max_workers=1):
+    """
+    Area filter (same result as area_filter) which labels tiles independently and merges the areas crossing tile
+    borders with a union-find of the tile labels. Only the labels of one tile per worker and the labels along the
+    tile borders are held in memory, so it works for grids larger than memory.
+
+    The tiles are labelled twice: first for the sizes of their areas and the labels along their borders, then again
+    to select the pixels of the kept areas (labelling is deterministic, so both passes give the same labels).
+
+    Parameters:
+        source (numpy.ndarray or str): Mask of the areas, or path of a mask raster (values > 0).
+        min_size (float): Minimum number of pixels of an area.
+        tile_size (int): Edge length of the tiles in pixels.
+        max_workers (int): Number of tiles labelled at the same time (worker processes).
+
+    Yields:
+        tuple: (rasterio.windows.Window, boolean mask of the kept areas in the window), tile by tile.
+    """
+    if isinstance(source, str):
+        with rasterio.open(source) as src:
+            height, width = src.height, src.width
+    else:
+        height, width = source.shape
+    n_rows, n_cols = -(-height // tile_size), -(-width // tile_size)
+    windows = list(block_windows(width, height, tile_size))  # row by row
+    # tiles of an array are passed to the workers, tiles of a raster are read by them
+    tile_source = (lambda window: source) if isinstance(source, str) else (lambda window: source[window.toslices()])
+
+    # first pass: area sizes and border labels of every tile
+    tiles = list(_map_tiles(_label_tile, ((tile_source(window), window) for window in windows), max_workers))
+
+    # global labels: label k > 0 of tile i is offsets[i] + k, 0 is the background of all tiles
+    offsets = np.zeros(len(tiles), dtype=np.int64)
+    offsets[1:] = np.cumsum([len(sizes) - 1 for sizes, _ in tiles])[:-1]
+    sizes = np.concatenate([[0]] + [tile_sizes[1:] for tile_sizes, _ in tiles])
+
+    # areas continuing in the tile below or in the tile to the right
+    pairs_a, pairs_b = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for i, (_, borders) in enumerate(tiles):
+        row, col = divmod(i, n_cols)
+        neighbours = []
+        if row + 1 < n_rows:
+            neighbours.append((i + n_cols, borders['bottom'], tiles[i + n_cols][1]['top']))
+        if col + 1 < n_cols:
+            neighbours.append((i + 1, borders['right'], tiles[i + 1][1]['left']))
+        for j, a, b in neighbours:
+            connected = (a > 0) & (b > 0)
+            pairs_a.append(a[connected] + offsets[i])
+            pairs_b.append(b[connected] + offsets[j])
+    roots = _union_find_roots(len(sizes), np.concatenate(pairs_a), np.concatenate(pairs_b))
+    keep = np.bincount(roots, weights=sizes, minlength=len(sizes))[roots] >= min_size
+
+    # second pass: pixels of the kept areas
+    keep_tiles = (np.concatenate([[False], keep[offsets[i] + 1:offsets[i] + len(tile_sizes)]]) for i, (tile_sizes, _) in enumerate(tiles))
+    args = ((tile_source(window), window, keep_tile) for window, keep_tile in zip(windows, keep_tiles))
+    yield from zip(windows, _map_tiles(_filter_tile, args, max_workers))
+
+
+def _map_tiles(fn, args, max_workers):
+    """Results of fn(*arg) for all args in order, computed in worker processes with only a few tiles in flight."""
+    if max_workers <= 1:
+        yield from (fn(*arg) for arg in args)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for arg in args:
+            pending.append(executor.submit(fn, *arg))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _read_tile(source, window):
+    if isinstance(source, str):
+        with rasterio.open(source) as src:
+            return src.read(1, window=window) > 0
+    return source.astype(bool)
+
+
+def _label_tile(source, window):
+    """Area sizes (index 0 is the background) and the labels along the four borders of a tile."""
+    labels, num_features = label(_read_tile(source, window))
+    sizes = np.bincount(labels.ravel(), minlength=num_features + 1)
+    borders = {'top': labels[0].copy(), 'bottom': labels[-1].copy(), 'left': labels[:, 0].copy(), 'right': labels[:, -1].copy()}
+    return sizes, borders
+
+
+def _filter_tile(source, window, keep):
+    """Pixels of a tile which belong to kept areas (keep: kept flag of every tile label)."""
+    labels, _ = label(_read_tile(source, window))
+    return keep[labels]
+
+
+def _union_find_roots(n, a, b):
+    """
+    Root of every label after joining the labels a[i] and b[i] (union-find on a parent array with vectorized hooking
+    of the larger root to the smaller one and path compression by pointer jumping).
+
+    Returns:
+        numpy.ndarray: Smallest label of the joined labels of each label.
+    """
+    parent = np.arange(n, dtype=np.int64)
+    while True:
+        root_a, root_b = parent[a], parent[b]
+        joined = root_a != root_b
+        if not joined.any():
+            return parent
+        low, high = np.minimum(root_a[joined], root_b[joined]), np.maximum(root_a[joined], root_b[joined])
+        np.minimum.at(parent, high, low)
+        # path compression: point every label to its root
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
     
 # Transform raster based on a given raster
 def align_to_reference(src, ref, resampling=Resampling.nearest):
     """
     Reproject and resample `src` to match `ref` (CRS, transform, shape).
     Returns a rasterio in-memory dataset aligned to `ref`.
+    If `src` is already on the grid of `ref` (e.g. proximity rasters computed on the exclusion grid), it is read as is.
 
     Parameters:
         src: rasterio dataset to reproject
@@ -42,6 +209,9 @@ def align_to_reference(src, ref, resampling=Resampling.nearest):
     dtype = src.dtypes[0]
     nodata = src.nodata if src.nodata is not None else 0
 
+    if src.crs == ref.crs and (src.height, src.width) == (ref.height, ref.width) and src.transform.almost_equals(ref.transform):
+        return src.read(1)
+
     dst_array = np.full((ref.height, ref.width), nodata, dtype=dtype)
 
     reproject(
@@ -154,9 +324,7 @@ def export_raster(array, path, ref, crs):
         path (str): The file path to save the raster.
         ref (rasterio.io.DatasetReader): Reference raster for CRS and transform.
     """
-    with rasterio.open(
-        path, 'w',
-        driver='GTiff',
+    profile = raster_profile(
         height=array.shape[0],
         width=array.shape[1],
         count=1,
@@ -164,7 +332,8 @@ def export_raster(array, path, ref, crs):
         crs=crs,
         transform=ref.transform,
         nodata=0
-    ) as dst:
+    )
+    with create_raster(path, profile) as dst:
         dst.write(array, 1)
 
 
@@ -0,0 +1,92 @@
+"""
+Shared write profile for all GeoTIFFs written by LAVA.
+
+All rasters are written as cloud-optimized-like GeoTIFFs: internally tiled (256 x 256), compressed with a predictor,
+multithreaded compression, BigTIFF when needed and internal overviews. Windowed reads (suitability, energy profiles,
+GUI) then only decode the tiles they touch, and overview reads make zoomed-out views cheap.
+
+Usage:
+    with create_raster(path, raster_profile(src.profile, dtype='float32', nodata=-9999)) as dst:
+        dst.write(array, 1)
+"""
+
+from contextlib import contextmanager
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+
+
+# compression of all written rasters ('ZSTD' is faster at similar size but needs a GDAL build with zstd support)
+RASTER_COMPRESSION = 'DEFLATE'
+RASTER_BLOCK_SIZE = 256
+
+# layout and creation options of source profiles which are replaced by the shared profile
+_LAYOUT_KEYS = ['tiled', 'blockxsize', 'blockysize', 'compress', 'predictor', 'interleave', 'num_threads', 'bigtiff', 'zlevel', 'zstd_level']
+
+
+def raster_profile(base=None, **updates) -> dict:
+    """
+    Returns a GeoTIFF write profile with the shared layout and compression.
+
+    Parameters:
+        base (dict, optional): Profile or meta to start from (e.g. src.profile); its layout and compression options are replaced.
+        **updates: Profile entries to set (e.g. dtype, nodata, width, height, transform, crs).
+
+    Returns:
+        dict: Profile for rasterio.open(path, 'w', **profile) or create_raster().
+    """
+    profile = {key: value for key, value in dict(base or {}).items() if key.lower() not in _LAYOUT_KEYS}
+    profile.update(updates)
+    profile['driver'] = 'GTiff'
+    profile.update(creation_options(profile.get('dtype', 'uint8')))
+    return profile
+
+
+def creation_options(dtype) -> dict:
+    """GeoTIFF creation options of the shared profile for a data type."""
+    # horizontal differencing for integers, floating point predictor for floats
+    predictor = 3 if np.issubdtype(np.dtype(dtype), np.floating) else 2
+    return {
+        'tiled': True,
+        'blockxsize': RASTER_BLOCK_SIZE,
+        'blockysize': RASTER_BLOCK_SIZE,
+        'compress': RASTER_COMPRESSION,
+        'predictor': predictor,
+        'num_threads': 'ALL_CPUS',
+        'bigtiff': 'IF_SAFER',
+    }
+
+
+def build_overviews(dst, resampling=None):
+    """
+    Adds internal overviews (factors 2, 4, 8, ... until the overview is smaller than one block) to an open dataset.
+    Integer rasters (masks, classes) use nearest neighbour, float rasters the average unless resampling is given.
+    """
+    factors = []
+    factor = 2
+    while max(dst.width, dst.height) / factor >= RASTER_BLOCK_SIZE:
+        factors.append(factor)
+        factor *= 2
+    if not factors:
+        return
+    if resampling is None:
+        resampling = Resampling.average if np.issubdtype(np.dtype(dst.dtypes[0]), np.floating) else Resampling.nearest
+    dst.build_overviews(factors, resampling)
+    dst.update_tags(ns='rio_overview', resampling=resampling.name)
+
+
+@contextmanager
+def create_raster(path, profile, overviews=True):
+    """
+    Opens a GeoTIFF for writing and adds internal overviews once the with-block is done.
+
+    Parameters:
+        path (str): Output path.
+        profile (dict): Write profile, usually from raster_profile().
+        overviews (bool): Build internal overviews after writing.
+    """
+    with rasterio.open(path, 'w', **profile) as dst:
+        yield dst
+        if overviews:
+            build_overviews(dst)
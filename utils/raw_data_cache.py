@@ -0,0 +1,165 @@
+"""
+Cache of the downloaded raw input data (WorldPop, WDPA, global wind and solar atlas, GOAS) with a manifest.
+
+The manifest (raw_data_manifest.sqlite in the cache root) records for every downloaded dataset its path, source URL,
+version (e.g. the WDPA month), size, SHA-256 hash and fetch time. A dataset with a valid manifest entry is used without
+any network request, so repeated runs neither download again nor probe for new versions (e.g. the HEAD requests of
+retrieve_wdpa_url()).
+
+The cache root defaults to Raw_Spatial_Data but can be set to a shared folder (raw_data_cache_dir in the advanced
+data prep settings), so several checkouts on one machine use the same downloads. Downloads are guarded by a lock file
+per dataset, so parallel workers (threads, processes or other checkouts) wait for a running download instead of
+starting their own.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from contextlib import contextmanager, closing
+
+from utils.download import sha256_of_file
+
+
+class RawDataCache:
+    """
+    Manifest of the downloaded raw datasets in a cache root.
+
+    Usage:
+        path = cache.fetch('wind_atlas/DEU/100', cache.path('global_solar_wind_atlas', 'DEU_wind_speed_100.tif'),
+                           lambda: download_global_wind_atlas('DEU', 100, cache.root))
+
+    Parameters:
+        root (str): Cache root folder.
+        lock_timeout (int): Seconds without a heartbeat after which a lock file is considered stale (its download crashed).
+        lock_heartbeat (int): Seconds between the heartbeats (mtime updates) of a held lock file.
+    """
+
+    def __init__(self, root: str, lock_timeout: int = 600, lock_heartbeat: int = 30):
+        self.root = os.path.abspath(root)
+        self.manifest_path = os.path.join(self.root, 'raw_data_manifest.sqlite')
+        self.lock_timeout = lock_timeout
+        self.lock_heartbeat = lock_heartbeat
+        os.makedirs(os.path.join(self.root, '.locks'), exist_ok=True)
+        with closing(self._connect()) as con, con:
+            con.execute('CREATE TABLE IF NOT EXISTS datasets ('
+                        'key TEXT PRIMARY KEY, path TEXT, url TEXT, version TEXT, size INTEGER, sha256 TEXT, fetched_at TEXT)')
+
+    def _connect(self):
+        # one connection per call, sqlite serializes writers of all processes
+        return sqlite3.connect(self.manifest_path, timeout=60)
+
+    def path(self, *parts) -> str:
+        """Path of a dataset inside the cache root."""
+        return os.path.join(self.root, *parts)
+
+    def entry(self, key: str):
+        """Returns the manifest entry of a dataset as dict or None."""
+        with closing(self._connect()) as con:
+            con.row_factory = sqlite3.Row
+            row = con.execute('SELECT * FROM datasets WHERE key = ?', (key,)).fetchone()
+        return dict(row) if row else None
+
+    def valid_entry(self, key: str, path: str):
+        """Returns the manifest entry of a dataset if it was recorded for path and path still has the recorded size, else None."""
+        entry = self.entry(key)
+        if entry and entry['path'] == os.path.abspath(path) and os.path.exists(path) and _size(path) == entry['size']:
+            return entry
+        return None
+
+    def record(self, key: str, path: str, url: str = None, version: str = None) -> dict:
+        """Adds or replaces the manifest entry of a downloaded dataset (file or folder)."""
+        path = os.path.abspath(path)
+        entry = {
+            'key': key,
+            'path': path,
+            'url': url,
+            'version': version,
+            'size': _size(path),
+            'sha256': sha256_of_file(path) if os.path.isfile(path) else None,
+            'fetched_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        }
+        with closing(self._connect()) as con, con:
+            con.execute('INSERT OR REPLACE INTO datasets VALUES (:key, :path, :url, :version, :size, :sha256, :fetched_at)', entry)
+        return entry
+
+    @contextmanager
+    def lock(self, key: str):
+        """
+        Lock of a dataset shared by all threads and processes using this cache root (a lock file created exclusively).
+        While the lock is held, a thread touches the lock file every lock_heartbeat seconds, so only the lock of a
+        crashed worker gets older than lock_timeout, however long the download takes.
+        """
+        lock_path = os.path.join(self.root, '.locks', hashlib.sha1(key.encode()).hexdigest() + '.lock')
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, f'{key} {os.getpid()}'.encode())
+                os.close(fd)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > self.lock_timeout:
+                        logging.warning(f'removing stale lock of {key}')
+                        os.remove(lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(1)
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_heartbeat, args=(lock_path, self.lock_heartbeat, stop), daemon=True)
+        heartbeat.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            heartbeat.join()
+            os.remove(lock_path)
+
+    def fetch(self, key: str, path: str, download, complete=os.path.exists) -> str:
+        """
+        Returns the path of a dataset, downloading it only if the manifest has no valid entry for it.
+
+        Parameters:
+            key (str): Key of the dataset in the manifest (e.g. 'wdpa/DEU').
+            path (str): Path of the dataset file or folder in the cache root.
+            download (callable): Downloads the dataset to path. May return a dict with 'url' and 'version' for the manifest.
+            complete (callable): Returns True if path holds a complete download (default: path exists).
+
+        Returns:
+            str: path (which does not exist if the download failed).
+        """
+        if self.valid_entry(key, path):
+            return path
+        with self.lock(key):
+            # another worker may have downloaded it while we waited for the lock
+            if self.valid_entry(key, path):
+                return path
+            if complete(path):
+                # downloaded before the manifest existed
+                logging.info(f'adding existing {path} to the raw data manifest')
+                self.record(key, path)
+                return path
+            source = download() or {}
+            if complete(path):
+                self.record(key, path, url=source.get('url'), version=source.get('version'))
+        return path
+
+
+def _heartbeat(lock_path: str, interval: int, stop: threading.Event):
+    """Updates the mtime of a held lock file every interval seconds until stop is set."""
+    while not stop.wait(interval):
+        try:
+            os.utime(lock_path)
+        except FileNotFoundError:
+            return
+
+
+def _size(path: str) -> int:
+    """Size of a file or total size of the files in a folder in bytes."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, dirs, files in os.walk(path) for name in files)
@@ -0,0 +1,154 @@
+"""
+Minimal local scheduler for the stages of the spatial data prep.
+
+Each stage declares the artifacts it needs (inputs) and the artifacts it produces (outputs). A stage depends on
+every stage producing one of its inputs; inputs which no stage produces are expected to exist already. Stages
+without pending dependencies are run concurrently in a thread pool (the heavy lifting happens in GDAL, pyogrio and
+numpy, which release the GIL). Wall time is recorded per stage.
+"""
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class Stage:
+    """
+    A unit of work of the data prep.
+
+    Parameters:
+        name (str): Unique name of the stage, used for reporting.
+        func (callable): Function without arguments which runs the stage.
+        inputs (list of str): Names of the artifacts the stage reads.
+        outputs (list of str): Names of the artifacts the stage writes.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=()):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={self.inputs}, outputs={self.outputs})"
+
+
+def resolve_dependencies(stages):
+    """
+    Derives the dependencies between stages from their declared inputs and outputs.
+
+    Parameters:
+        stages (list of Stage): Stages to schedule.
+
+    Returns:
+        dict: Stage name -> set of names of the stages it depends on.
+
+    Raises:
+        ValueError: If stage names or outputs are not unique or the dependencies contain a cycle.
+    """
+    producers = {}
+    names = set()
+    for stage in stages:
+        if stage.name in names:
+            raise ValueError(f"Stage name '{stage.name}' is used more than once.")
+        names.add(stage.name)
+        for artifact in stage.outputs:
+            if artifact in producers:
+                raise ValueError(f"Artifact '{artifact}' is produced by both '{producers[artifact]}' and '{stage.name}'.")
+            producers[artifact] = stage.name
+
+    dependencies = {
+        stage.name: {producers[artifact] for artifact in stage.inputs if artifact in producers} - {stage.name}
+        for stage in stages
+    }
+
+    # detect cycles (Kahn's algorithm)
+    pending = {name: set(deps) for name, deps in dependencies.items()}
+    while pending:
+        ready = [name for name, deps in pending.items() if not deps]
+        if not ready:
+            raise ValueError(f"Cyclic dependencies between stages: {sorted(pending)}")
+        for name in ready:
+            del pending[name]
+        for deps in pending.values():
+            deps.difference_update(ready)
+
+    return dependencies
+
+
+def run_stages(stages, max_workers=1):
+    """
+    Runs stages in dependency order, running independent stages concurrently.
+    A failing stage is logged as error; stages depending on it are skipped and logged as well.
+
+    Parameters:
+        stages (list of Stage): Stages to run.
+        max_workers (int): Number of stages which may run at the same time. 1 runs the stages one after another in the given order.
+
+    Returns:
+        dict: Stage name -> wall time in seconds (None for skipped stages).
+    """
+    dependencies = resolve_dependencies(stages)
+    stages_by_name = {stage.name: stage for stage in stages}
+    order = [stage.name for stage in stages]
+
+    timings = {}
+    failed = set()
+    done = set()
+
+    def run(stage):
+        t0 = time.time()
+        try:
+            stage.func()
+            return True, time.time() - t0
+        except Exception as e:
+            # the traceback goes to the log file, the message also to the error summary of the data prep
+            logging.error(f"stage '{stage.name}' failed: {e}", exc_info=True)
+            return False, time.time() - t0
+
+    def skip_dependents():
+        # skip stages depending (directly or indirectly) on failed stages
+        changed = True
+        while changed:
+            changed = False
+            for name in order:
+                if name not in done and dependencies[name] & failed:
+                    logging.error(f"stage '{name}' skipped because {sorted(dependencies[name] & failed)} failed")
+                    timings[name] = None
+                    failed.add(name)
+                    done.add(name)
+                    changed = True
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        running = {}
+        while len(done) < len(order):
+            skip_dependents()
+            for name in order:
+                if len(running) >= max(1, max_workers):
+                    break
+                if name in done or name in running.values() or not dependencies[name] <= done:
+                    continue
+                running[executor.submit(run, stages_by_name[name])] = name
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                success, elapsed = future.result()
+                timings[name] = elapsed
+                done.add(name)
+                if not success:
+                    failed.add(name)
+                logging.info(f"stage '{name}' finished in {elapsed:.1f} s")
+
+    return timings
+
+
+def print_stage_timings(timings):
+    """Prints the wall time of each stage, longest first."""
+    print('\nwall time per stage:')
+    for name, elapsed in sorted(timings.items(), key=lambda item: -(item[1] or 0)):
+        if elapsed is None:
+            print(f'- {name}: skipped')
+        else:
+            print(f'- {name}: {elapsed:.1f} s')
@@ -6,6 +6,8 @@ import geopandas as gpd
 import yaml
 import glob
 
+from utils.raw_data_cache import RawDataCache
+
 
 def raster2grid(raster_path, target_grid, var_name, method):
     """
@@ -78,6 +80,11 @@ def ds_bias_correction(ds_ref, ds_target, mean_dims):
 dirname = os.getcwd() 
 with open(os.path.join("configs/config.yaml"), "r", encoding="utf-8") as f:
     config = yaml.load(f, Loader=yaml.FullLoader) 
+advanced_config_path = os.path.join("configs", "advanced_settings", "advanced_data_prep_settings.yaml")
+if not os.path.exists(advanced_config_path):
+    advanced_config_path = os.path.join("configs", "advanced_settings", "advanced_data_prep_settings_template.yaml")
+with open(advanced_config_path, "r", encoding="utf-8") as f:
+    config_advanced = yaml.load(f, Loader=yaml.FullLoader)
 
 country_code = config['country_code']
 country_name_solar_atlas = config['country_name_solar_atlas']
@@ -90,8 +97,10 @@ else:
 weather_data_files = glob.glob(os.path.join(weather_data_path, f'*.nc'))
 
 
-GWAraster_path = os.path.join(dirname, 'Raw_Spatial_Data', 'global_solar_wind_atlas', f'{country_code}_wind_speed_100.tif')
-GSAraster_path = os.path.join(dirname, 'Raw_Spatial_Data', 'global_solar_wind_atlas', f'{country_name_solar_atlas}_GISdata_LTAy_YearlyMonthlyTotals_GlobalSolarAtlas-v2_GEOTIFF', 'GHI.tif')
+# the atlases are in the raw data cache (raw_data_cache_dir in the advanced settings, default Raw_Spatial_Data)
+raw_data = RawDataCache(config_advanced.get('raw_data_cache_dir') or os.path.join(dirname, 'Raw_Spatial_Data'))
+GWAraster_path = raw_data.path('global_solar_wind_atlas', f'{country_code}_wind_speed_100.tif')
+GSAraster_path = raw_data.path('global_solar_wind_atlas', f'{country_name_solar_atlas}_GISdata_LTAy_YearlyMonthlyTotals_GlobalSolarAtlas-v2_GEOTIFF', 'GHI.tif')
 
 output_path = os.path.join(weather_data_path, 'bias_correction_factors')
 os.makedirs(output_path, exist_ok=True)